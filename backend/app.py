@@ -1,37 +1,118 @@
+from dotenv import load_dotenv
+
+# Carregar o .env antes de qualquer módulo que leia configurações
+load_dotenv()
+
 from flask import Flask, jsonify
 from flask_cors import CORS
 from datetime import datetime
 import logging
 
+from structured_logging import setup_logging
+from json_provider import FastJSONProvider
+
+# Configurar logging (antes de importar os módulos que registram loggers)
+setup_logging()
+logger = logging.getLogger(__name__)
+
 from routes.users import users_bp
 from routes.auth import auth_bp
 from routes.config import config_bp
 from routes.router import router_bp
+from routes.journal import journal_bp
+from routes.backup import backup_bp
+from routes.profiling import profiling_bp
+from routes.tracing import tracing_bp
+from routes.automation import automation_bp
+from routes.write_queue import write_queue_bp
+from profiling import request_profiler
+from response_compression import response_compressor
+from tracing import tracer
+from session_tokens import session_tokens
+from mailer import outbox_sender
+from automation import automation_scheduler
+from write_queue import write_queue
+from config import Config
+from routers.registry import registry
+from database import db
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-CORS(app)  # Permitir CORS para todas as rotas
-
-# Register blueprints
-app.register_blueprint(users_bp, url_prefix='/api')
-app.register_blueprint(auth_bp, url_prefix='/api')
-app.register_blueprint(config_bp, url_prefix='/api')
-app.register_blueprint(router_bp, url_prefix='/api')
-
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Endpoint para verificar se o serviço está funcionando"""
-    return jsonify({
-        'status': 'ok',
-        'timestamp': datetime.now().isoformat(),
-        'service': 'Multi-Router API Proxy',
-        'supported_routers': ['mikrotik', 'opnsense', 'pfsense']
-    })
+
+def create_app():
+    """
+    Montar a aplicação. Só cria estado imutável (rotas, schema do banco, módulos
+    dos drivers): com `gunicorn --preload` roda uma vez no master e os workers
+    herdam tudo por copy-on-write. Threads e conexões ficam para init_worker.
+    """
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    CORS(app, expose_headers=['ETag', 'X-Profile-Id', 'traceparent'])  # Permitir CORS para todas as rotas
+
+    # Register blueprints
+    app.register_blueprint(users_bp, url_prefix='/api')
+    app.register_blueprint(auth_bp, url_prefix='/api')
+    app.register_blueprint(config_bp, url_prefix='/api')
+    app.register_blueprint(router_bp, url_prefix='/api')
+    app.register_blueprint(journal_bp, url_prefix='/api')
+    app.register_blueprint(backup_bp, url_prefix='/api')
+    app.register_blueprint(profiling_bp, url_prefix='/api')
+    app.register_blueprint(tracing_bp, url_prefix='/api')
+    app.register_blueprint(automation_bp, url_prefix='/api')
+    app.register_blueprint(write_queue_bp, url_prefix='/api')
+
+    # Compressão negociada; registrada primeiro para rodar por último entre os after_request
+    response_compressor.init_app(app)
+
+    # Perfilamento sob demanda (X-Profile + X-Profile-Token)
+    request_profiler.init_app(app)
+
+    # Span por requisição, continuando o traceparent do cliente
+    tracer.init_app(app)
+
+    # Token de acesso obrigatório nos blueprints protegidos (AUTH_REQUIRED)
+    session_tokens.init_app(app)
+
+    @app.route('/health', methods=['GET'])
+    def health_check():
+        """Endpoint para verificar se o serviço está funcionando"""
+        return jsonify({
+            'status': 'ok',
+            'timestamp': datetime.now().isoformat(),
+            'service': 'Multi-Router API Proxy',
+            'supported_routers': registry.supported_types()
+        })
+
+    # Schema e usuário padrão: uma vez por implantação, não por worker
+    db.init_database()
+
+    # Importar os drivers agora para que o código deles seja compartilhado
+    registry.preload()
+
+    return app
+
+
+def init_worker():
+    """
+    Recursos por processo, criados depois do fork (gunicorn post_worker_init).
+    Conexões SQLite, sessões HTTP e as threads de journal/tracing já são
+    recriadas sob demanda quando o pid muda; aqui sobe o que precisa rodar
+    desde o início.
+    """
+    # Drenar mensagens que ficaram pendentes na outbox de execuções anteriores
+    outbox_sender.ensure_started()
+
+    # Todos os workers disputam o lease; só o líder dispara os jobs
+    if Config.AUTOMATION_ENABLED:
+        automation_scheduler.ensure_started()
+
+    # Idem para a fila de escritas: só o líder testa os roteadores e envia
+    if Config.WRITE_QUEUE_ENABLED:
+        write_queue.ensure_started()
+
 
 if __name__ == '__main__':
     import os
+    app = create_app()
+    init_worker()
     debug_flag = os.environ.get('FLASK_ENV') == 'development' or os.environ.get('DEBUG') == '1'
-    app.run(host='0.0.0.0', port=5000, debug=debug_flag)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=debug_flag)
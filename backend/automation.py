@@ -0,0 +1,414 @@
+"""
+Agendador de automações sobre peers WireGuard
+
+Jobs persistidos em automation_jobs habilitam, desabilitam, expiram (removem)
+ou trocam o par de chaves de um peer num horário, uma vez ou a cada
+`interval_seconds`.
+
+Todos os workers rodam a thread, mas só o dono do lease `automation-leader`
+dispara jobs. Ele mantém em memória um heap (run_at, seq, id) dos jobs
+agendados, atualizado de forma incremental pelas linhas com `seq` maior que o
+último visto, então disparar custa O(k log n) para k jobs vencidos,
+independente do total. Cada job vencido ainda é reivindicado no banco
+(claimed_by/claim_expires_at, como a outbox de e-mail) antes de rodar: mesmo com
+dois líderes por um instante, um job executa uma única vez.
+
+Os jobs vencidos são agrupados por roteador; cada grupo lê os peers uma vez,
+junta as ações do mesmo peer (a mais recente prevalece, remoção vence) e aplica
+tudo numa escrita em lote (script único no Mikrotik) ou pelo reconcile.apply.
+"""
+import base64
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+
+import reconcile
+from config import Config
+from database import db
+from encryption import password_encryption
+from router_scheduler import scheduler
+from routers.pagination import PageFetchError
+from routers.registry import registry
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'automation-leader'
+
+ACTIONS = ('enable-peer', 'disable-peer', 'expire-peer', 'rotate-key')
+
+# Campos do roteador guardados no job (a senha vai cifrada em `password`)
+ROUTER_FIELDS = ('routerType', 'endpoint', 'port', 'user', 'useHttps')
+
+PEER_FIELDS = ('.id', 'public-key')
+
+
+def router_key(router):
+    return '%s:%s:%s:%s' % (router['routerType'].lower(), router['endpoint'], router.get('port') or '', router['user'])
+
+
+def parse_time(value):
+    """ISO 8601 (hora local se sem fuso) ou epoch em segundos -> epoch"""
+    if value in (None, ''):
+        return time.time()
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        raise ValueError('runAt deve ser uma data ISO 8601 ou epoch em segundos')
+
+
+def parse_interval(value, action):
+    """
+    Validar intervalSeconds para a ação do job (criação e alteração);
+    None/'' = execução única. Levanta ValueError com a mensagem para o cliente
+    """
+    if value in (None, ''):
+        return None
+    if isinstance(value, bool):
+        raise ValueError('intervalSeconds deve ser um inteiro')
+    try:
+        interval = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('intervalSeconds deve ser um inteiro')
+    if interval < Config.AUTOMATION_MIN_INTERVAL:
+        raise ValueError(f'intervalSeconds mínimo: {Config.AUTOMATION_MIN_INTERVAL}')
+    if action == 'expire-peer':
+        raise ValueError('expire-peer não pode ser recorrente')
+    return interval
+
+
+def build_job(data, router, password):
+    """
+    Validar um job {action, target, runAt, intervalSeconds, name, enabled} e
+    montar a linha do banco; levanta ValueError com a mensagem para o cliente
+    """
+    action = (data.get('action') or '').lower()
+    if action not in ACTIONS:
+        raise ValueError(f"action deve ser um de: {', '.join(ACTIONS)}")
+    target = (data.get('target') or '').strip()
+    if not target:
+        raise ValueError('target (public-key do peer) é obrigatório')
+    interval = parse_interval(data.get('intervalSeconds'), action)
+    return {
+        'name': data.get('name'),
+        'action': action,
+        'target': target,
+        'target_id': data.get('targetId'),
+        'router_key': router_key(router),
+        'router': json.dumps({field: router.get(field) for field in ROUTER_FIELDS}),
+        'password': password_encryption.encrypt_password(password),
+        'run_at': parse_time(data.get('runAt')),
+        'interval_seconds': interval,
+        'enabled': 0 if data.get('enabled') is False else 1,
+    }
+
+
+def public_job(row):
+    """Linha do job para a API (sem senha, datas legíveis)"""
+    job = {key: value for key, value in row.items() if key not in ('password', 'claimed_by', 'seq')}
+    job['router'] = json.loads(row['router'])
+    job['enabled'] = bool(row['enabled'])
+    job['run_at'] = datetime.fromtimestamp(row['run_at']).isoformat()
+    job['claim_expires_at'] = datetime.fromtimestamp(row['claim_expires_at']).isoformat() if row.get('claim_expires_at') else None
+    job['last_result'] = json.loads(row['last_result']) if row.get('last_result') else None
+    return job
+
+
+def generate_keypair():
+    """Par de chaves WireGuard (X25519) em base64: (privada, pública)"""
+    private_key = X25519PrivateKey.generate()
+    private_raw = private_key.private_bytes(
+        serialization.Encoding.Raw, serialization.PrivateFormat.Raw, serialization.NoEncryption()
+    )
+    public_raw = private_key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    return base64.b64encode(private_raw).decode('ascii'), base64.b64encode(public_raw).decode('ascii')
+
+
+def next_run(job, now):
+    """Próxima execução de um job recorrente, pulando as que já passaram"""
+    interval = job['interval_seconds']
+    missed = int((now - job['run_at']) // interval) + 1
+    return job['run_at'] + max(missed, 1) * interval
+
+
+def _fetch_peers(router):
+    if hasattr(router, 'iter_wireguard_peers'):
+        try:
+            return {'success': True, 'status': 200, 'data': list(router.iter_wireguard_peers(PEER_FIELDS))}
+        except PageFetchError as e:
+            return e.result
+    return router.get_wireguard_peers()
+
+
+def plan_group(router, jobs, peers):
+    """
+    Operações REST para os jobs de um roteador, uma por peer: ações do mesmo
+    peer são unidas na ordem de run_at. Retorna (operações, {job id: operação
+    ou resultado de falha}, {job id: nova public-key}).
+    """
+    by_id = {peer.get('.id'): peer for peer in peers if peer.get('.id')}
+    by_key = {peer.get('public-key'): peer for peer in peers if peer.get('public-key')}
+    path = router.WIREGUARD_PEERS_PATH
+    per_peer = {}
+    outcome = {}
+    new_keys = {}
+    for job in sorted(jobs, key=lambda job: (job['run_at'], job['id'])):
+        peer = by_id.get(job['target_id']) if job.get('target_id') else None
+        peer = peer or by_key.get(job['target'])
+        if peer is None:
+            if job['action'] == 'expire-peer':
+                # Já removido: nada a fazer
+                outcome[job['id']] = {'success': True, 'status': None, 'skipped': True}
+            else:
+                outcome[job['id']] = {'success': False, 'code': 'PEER_NOT_FOUND',
+                                      'error': f"Peer não encontrado: {job['target']}"}
+            continue
+        op = per_peer.get(peer['.id'])
+        if op is None:
+            op = {'kind': 'peer', 'action': 'update', 'key': peer.get('public-key'),
+                  'method': 'PATCH', 'path': f"{path}/{peer['.id']}", 'body': {}, 'peer_id': peer['.id']}
+            per_peer[peer['.id']] = op
+        if op['method'] == 'DELETE':
+            outcome[job['id']] = op
+            continue
+        if job['action'] == 'expire-peer':
+            op.update({'action': 'delete', 'method': 'DELETE'})
+            op.pop('body', None)
+        elif job['action'] == 'rotate-key':
+            private_key, public_key = generate_keypair()
+            op['body'].update({'private-key': private_key, 'public-key': public_key})
+            new_keys[job['id']] = public_key
+        else:
+            op['body']['disabled'] = 'true' if job['action'] == 'disable-peer' else 'false'
+        outcome[job['id']] = op
+    return list(per_peer.values()), outcome, new_keys
+
+
+def _op_result(op):
+    result = dict(op.get('result') or {'success': False, 'error': 'Operação não executada'})
+    result['coalesced_into'] = op.get('path')
+    return result
+
+
+class AutomationScheduler:
+    """Thread por processo; o líder mantém o heap e dispara os jobs"""
+
+    def __init__(self):
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._reset()
+        self.stats = {'runs': 0, 'jobs': 0, 'last_run_at': None, 'last_error': None}
+
+    def _reset(self):
+        self.leader = False
+        self._heap = []
+        self._current = {}
+        self._position = (0, 0)
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self.owner = uuid.uuid4().hex
+            self._wake = threading.Event()
+            self._reset()
+            self._thread = threading.Thread(target=self._run, name='automation', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Alterações feitas neste processo: recarregar já, sem esperar o intervalo"""
+        self._wake.set()
+
+    # Heap
+
+    def refresh(self):
+        """Trazer para o heap os jobs alterados desde a última posição (seq, id) vista"""
+        while True:
+            rows = db.changed_automation_jobs(self._position)
+            for row in rows:
+                if row['status'] == 'scheduled' and row['enabled']:
+                    self._current[row['id']] = row['seq']
+                    heapq.heappush(self._heap, (row['run_at'], row['seq'], row['id']))
+                else:
+                    self._current.pop(row['id'], None)
+                self._position = (row['seq'], row['id'])
+            if len(rows) < 5000:
+                break
+        # Entradas obsoletas saem no pop; compacta quando passam a dominar o heap
+        if len(self._heap) > 2 * len(self._current) + 1000:
+            self._heap = [entry for entry in self._heap if self._current.get(entry[2]) == entry[1]]
+            heapq.heapify(self._heap)
+
+    def due(self, now, limit):
+        """Ids vencidos, no máximo `limit`"""
+        ids = []
+        while self._heap and self._heap[0][0] <= now and len(ids) < limit:
+            run_at, seq, job_id = heapq.heappop(self._heap)
+            if self._current.get(job_id) == seq:
+                ids.append(job_id)
+        return ids
+
+    def next_run_at(self):
+        while self._heap and self._current.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    # Execução
+
+    def tick(self, now=None):
+        """Uma rodada do líder; retorna quantos jobs rodaram"""
+        now = now or time.time()
+        self.refresh()
+        ids = self.due(now, Config.AUTOMATION_BATCH_SIZE)
+        if not ids:
+            return 0
+        jobs, busy = db.claim_automation_jobs(ids, self.owner, now, Config.AUTOMATION_CLAIM_LEASE)
+        for job_id, expires_at in busy.items():
+            # Em execução por outro processo: olhar de novo quando o claim vencer
+            if job_id in self._current:
+                heapq.heappush(self._heap, (expires_at, self._current[job_id], job_id))
+        groups = {}
+        for job in jobs:
+            groups.setdefault(job['router_key'], []).append(job)
+        for index, group in enumerate(groups.values()):
+            if index and not db.acquire_lease(LEASE_NAME, self.owner, Config.AUTOMATION_LEASE_SECONDS):
+                # Liderança perdida no meio da rodada: os grupos restantes voltam
+                # para o novo líder quando o claim vencer
+                logger.warning('Automation leadership lost with %s router group(s) pending', len(groups) - index)
+                break
+            try:
+                updates = self.run_group(group, now)
+            except Exception as e:
+                logger.error('Automation group %s failed: %s', group[0]['router_key'], e)
+                failure = {'success': False, 'code': 'AUTOMATION_ERROR', 'error': str(e)}
+                updates = [self._finish(job, failure, None, now) for job in group]
+            # Gravado por roteador: uma falha adiante não perde o que já rodou
+            db.finish_automation_jobs(updates, self.owner)
+            # O próximo refresh relê estas linhas (seq novo) e reinsere as recorrentes
+            for update in updates:
+                self._current.pop(update['id'], None)
+        self.stats['runs'] += 1
+        self.stats['jobs'] += len(jobs)
+        self.stats['last_run_at'] = datetime.now().isoformat()
+        return len(jobs)
+
+    def run_group(self, jobs, now):
+        """Aplicar os jobs de um roteador; retorna as atualizações para o banco"""
+        config = json.loads(jobs[0]['router'])
+        results = {}
+        new_keys = {}
+        router_class = registry.get(config['routerType'])
+        if router_class is None or not hasattr(router_class, 'get_wireguard_peers'):
+            failure = {'success': False, 'code': 'UNSUPPORTED_ROUTER',
+                       'error': f"Automação não suportada para: {config['routerType']}"}
+            results = {job['id']: failure for job in jobs}
+        else:
+            router = router_class(
+                endpoint=config['endpoint'],
+                port=config.get('port') or '',
+                user=config['user'],
+                password=password_encryption.decrypt_password(jobs[0]['password']),
+                use_https=config.get('useHttps', False)
+            )
+            peers = scheduler.call(router, lambda: _fetch_peers(router), lane='bulk')
+            if not peers.get('success') or peers.get('status', 0) >= 400:
+                failure = {'success': False, 'status': peers.get('status'), 'code': peers.get('code'),
+                           'error': peers.get('error') or 'Falha ao ler os peers'}
+                results = {job['id']: failure for job in jobs}
+            else:
+                operations, outcome, new_keys = plan_group(router, jobs, peers.get('data') or [])
+                if operations:
+                    if hasattr(router, 'batch_write'):
+                        # Não atômico: a falha de um peer não desfaz os outros
+                        reconcile.apply_batch(
+                            router, operations, atomic=False,
+                            call=lambda run: scheduler.call(router, run, lane='bulk')
+                        )
+                    else:
+                        reconcile.apply(
+                            router, operations,
+                            request=lambda path, method, body: scheduler.request(router, path, method, body, lane='bulk')
+                        )
+                for job_id, value in outcome.items():
+                    results[job_id] = _op_result(value) if 'path' in value else value
+                for job in jobs:
+                    op = outcome.get(job['id'])
+                    if op is not None and 'peer_id' in op:
+                        job['resolved_id'] = op['peer_id']
+        return [self._finish(job, results[job['id']], new_keys.get(job['id']), now) for job in jobs]
+
+    def _finish(self, job, result, new_key, now):
+        update = {'id': job['id'], 'last_result': json.dumps(result, default=str),
+                  'target_id': job.get('resolved_id')}
+        if result.get('success'):
+            if new_key:
+                update['target'] = new_key
+            update['attempts'] = 0
+            if job['interval_seconds'] and job['action'] != 'expire-peer':
+                update.update(status='scheduled', run_at=next_run(job, now))
+            else:
+                update.update(status='done', run_at=job['run_at'])
+            return update
+        attempts = job['attempts'] + 1
+        if attempts < Config.AUTOMATION_MAX_ATTEMPTS and result.get('code') not in ('PEER_NOT_FOUND', 'UNSUPPORTED_ROUTER'):
+            delay = min(Config.AUTOMATION_RETRY_BASE_SECONDS * (2 ** (attempts - 1)), Config.AUTOMATION_RETRY_MAX_SECONDS)
+            update.update(status='scheduled', run_at=now + delay, attempts=attempts)
+        elif job['interval_seconds']:
+            # Recorrente: desiste desta ocorrência e segue o calendário
+            update.update(status='scheduled', run_at=next_run(job, now), attempts=0)
+        else:
+            update.update(status='failed', run_at=job['run_at'], attempts=attempts)
+        logger.warning('Automation job %s (%s) failed: %s', job['id'], job['action'], result.get('error'))
+        return update
+
+    # Laço
+
+    def _run(self):
+        while True:
+            timeout = Config.AUTOMATION_POLL_INTERVAL
+            try:
+                leader = db.acquire_lease(LEASE_NAME, self.owner, Config.AUTOMATION_LEASE_SECONDS)
+                if leader != self.leader:
+                    logger.info('Automation scheduler %s leadership', 'acquired' if leader else 'lost')
+                    self._reset()
+                    self.leader = leader
+                if leader:
+                    while self.tick():
+                        # Mais jobs vencidos do que um lote: segue sem esperar
+                        db.acquire_lease(LEASE_NAME, self.owner, Config.AUTOMATION_LEASE_SECONDS)
+                    upcoming = self.next_run_at()
+                    if upcoming is not None:
+                        timeout = min(timeout, max(upcoming - time.time(), 0.05))
+            except Exception as e:
+                logger.error('Automation scheduler error: %s', e)
+                self.stats['last_error'] = str(e)
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def status(self):
+        lease = db.get_lease(LEASE_NAME)
+        upcoming = self.next_run_at() if self.leader else None
+        return {
+            'enabled': Config.AUTOMATION_ENABLED,
+            'leader': self.leader,
+            'leader_active': bool(lease and lease['expires_at'] > time.time()),
+            'queued': len(self._current) if self.leader else None,
+            'next_run_at': datetime.fromtimestamp(upcoming).isoformat() if upcoming else None,
+            **self.stats,
+        }
+
+
+automation_scheduler = AutomationScheduler()
@@ -0,0 +1,82 @@
+"""
+Benchmark: CPU e tamanho da compressão das respostas (response_compression.py)
+
+Gera uma listagem sintética de peers WireGuard no formato do RouterOS (como a
+resposta de /api/router/proxy) e comprime o corpo em pedaços de 64 KB com cada
+codificação disponível (gzip sempre; br e zstd se `brotli`/`zstandard` estiverem
+instalados) em alguns níveis, medindo tempo de CPU, taxa e tamanho final.
+
+Uso (a partir de backend/):
+    python benchmarks/bench_compression.py [peers]
+"""
+import base64
+import hashlib
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from response_compression import _compressed, available_encoders  # noqa: E402
+
+CHUNK_SIZE = 64 * 1024
+LEVELS = {
+    'gzip': (1, 6, 9),
+    'br': (1, 4, 6, 11),
+    'zstd': (1, 3, 9, 19),
+}
+
+
+def peer(i):
+    # Chaves aleatórias como as reais (não comprimem)
+    key = base64.b64encode(hashlib.sha256(str(i).encode('ascii')).digest()).decode('ascii')
+    return {
+        '.id': f'*{i:X}',
+        'interface': f'wg{i % 4}',
+        'public-key': key,
+        'allowed-address': f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}/32',
+        'endpoint-address': '',
+        'endpoint-port': '0',
+        'current-endpoint-address': f'198.51.{(i >> 8) & 255}.{i & 255}',
+        'current-endpoint-port': str(1024 + i % 60000),
+        'last-handshake': f'{i % 180}s',
+        'rx': str(i * 7919),
+        'tx': str(i * 104729),
+        'persistent-keepalive': '25s',
+        'comment': f'peer-{i}',
+        'disabled': 'false',
+    }
+
+
+def body_chunks(body):
+    view = memoryview(body)
+    for start in range(0, len(view), CHUNK_SIZE):
+        yield view[start:start + CHUNK_SIZE]
+
+
+def measure(body, name, encoder_class, level):
+    started = time.process_time()
+    size = sum(len(block) for block in _compressed(body_chunks(body), encoder_class(level)))
+    elapsed = time.process_time() - started
+    throughput = len(body) / 1024 / 1024 / elapsed if elapsed else float('inf')
+    print(f'{name:<5} nível {level:<3} {size / 1024:10.1f} KB  razão {len(body) / size:6.2f}x  '
+          f'cpu {elapsed * 1000:8.1f} ms  {throughput:8.1f} MB/s')
+
+
+def main():
+    peers = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    body = json.dumps({'success': True, 'data': [peer(i) for i in range(peers)]}).encode('utf-8')
+    print(f'Listagem sintética de peers: {peers} peers, {len(body) / 1024:.1f} KB sem compressão')
+    encoders = available_encoders()
+    for name in ('gzip', 'br', 'zstd'):
+        if name not in encoders:
+            print(f'{name:<5} indisponível (pacote não instalado)')
+            continue
+        encoder_class = encoders[name][0]
+        for level in LEVELS[name]:
+            measure(body, name, encoder_class, level)
+
+
+if __name__ == '__main__':
+    main()
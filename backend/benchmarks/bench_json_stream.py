@@ -0,0 +1,94 @@
+"""
+Benchmark: json.loads do corpo inteiro x leitura incremental (routers/json_stream.py)
+
+Gera uma tabela sintética de leases DHCP no formato do RouterOS, entregue em
+pedaços de 64 KB como no corpo HTTP em fluxo, e mede tempo e pico de memória
+(tracemalloc) de cada caminho.
+
+Uso (a partir de backend/):
+    python benchmarks/bench_json_stream.py [linhas]
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from routers.json_stream import iter_json_items  # noqa: E402
+
+CHUNK_SIZE = 64 * 1024
+FIELDS = ('address', 'mac-address', 'host-name')
+
+
+def lease(i):
+    return {
+        '.id': f'*{i:X}',
+        'address': f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}',
+        'mac-address': ':'.join(f'{(i >> s) & 255:02X}' for s in (40, 32, 24, 16, 8, 0)),
+        'client-id': f'1:{i:012x}',
+        'host-name': f'host-{i}',
+        'server': 'dhcp1',
+        'status': 'bound',
+        'expires-after': '9m58s',
+        'last-seen': '2s',
+        'active-address': f'10.0.{(i >> 8) & 255}.{i & 255}',
+        'dynamic': 'true',
+        'disabled': 'false',
+        'comment': '',
+    }
+
+
+def body_chunks(rows):
+    """Corpo JSON gerado sob demanda, em pedaços de CHUNK_SIZE bytes"""
+    buffer = bytearray(b'[')
+    for i in range(rows):
+        if i:
+            buffer += b','
+        buffer += json.dumps(lease(i)).encode('utf-8')
+        if len(buffer) >= CHUNK_SIZE:
+            yield bytes(buffer[:CHUNK_SIZE])
+            del buffer[:CHUNK_SIZE]
+    buffer += b']'
+    while buffer:
+        yield bytes(buffer[:CHUNK_SIZE])
+        del buffer[:CHUNK_SIZE]
+
+
+def full_parse(rows):
+    # Equivalente a response.json(): o corpo inteiro e a lista inteira em memória
+    body = b''.join(body_chunks(rows))
+    count = 0
+    for row in json.loads(body):
+        count += 1
+    return count
+
+
+def streamed(rows, fields=None):
+    count = 0
+    for row in iter_json_items(body_chunks(rows), fields=fields):
+        count += 1
+    return count
+
+
+def measure(label, func, *args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    count = func(*args)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:<32} linhas={count:<8} tempo={elapsed:7.2f}s  pico={peak / 1024 / 1024:8.2f} MB')
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(f'Tabela sintética de leases: {rows} linhas')
+    measure('json.loads (corpo inteiro)', full_parse, rows)
+    measure('iter_json_items', streamed, rows)
+    measure('iter_json_items + projeção', streamed, rows, FIELDS)
+
+
+if __name__ == '__main__':
+    main()
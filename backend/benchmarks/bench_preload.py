@@ -0,0 +1,103 @@
+"""
+Benchmark: gunicorn com e sem preload (gunicorn.conf.py)
+
+Sobe o backend duas vezes com o mesmo número de workers, mede o tempo até todos
+os workers estarem prontos (linha "Worker pronto" do post_worker_init) e, depois
+de algumas requisições, a memória de cada worker lida de /proc/<pid>/smaps_rollup:
+PSS (memória proporcional, conta páginas compartilhadas divididas entre os
+processos) e USS (páginas privadas). Requer Linux.
+
+Uso (a partir de backend/):
+    python benchmarks/bench_preload.py [workers]
+"""
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+READY = re.compile(r'Worker pronto \(pid: (\d+)\)')
+REQUESTS_PER_WORKER = 50
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def memory_kb(pid):
+    """(pss, uss) em KB"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as handle:
+        for line in handle:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return values['Pss'], values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+
+
+def run(preload, workers, directory):
+    port = free_port()
+    env = dict(
+        os.environ,
+        GUNICORN_PRELOAD='true' if preload else 'false',
+        GUNICORN_WORKERS=str(workers),
+        GUNICORN_BIND=f'127.0.0.1:{port}',
+        DB_PATH=os.path.join(directory, f'bench-{int(preload)}.db'),
+        SHARED_CACHE_PATH=os.path.join(directory, f'cache-{int(preload)}.db'),
+        TRACING_ENABLED='false',
+        LOG_LEVEL='WARNING',
+    )
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'],
+        cwd=BACKEND, env=env, stderr=subprocess.PIPE, text=True
+    )
+    pids = set()
+    try:
+        for line in process.stderr:
+            match = READY.search(line)
+            if match:
+                pids.add(int(match.group(1)))
+                if len(pids) == workers:
+                    break
+        boot = time.perf_counter() - started
+        if len(pids) < workers:
+            raise RuntimeError('gunicorn terminou antes de subir os workers')
+        for _ in range(REQUESTS_PER_WORKER * workers):
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/health').read()
+        memory = [memory_kb(pid) for pid in sorted(pids)]
+        master = memory_kb(process.pid)
+    finally:
+        process.terminate()
+        process.wait()
+    return boot, memory, master
+
+
+def report(label, boot, memory, master):
+    pss = [value[0] for value in memory]
+    uss = [value[1] for value in memory]
+    print(f'{label:<12} boot {boot:6.2f}s | por worker: PSS {sum(pss) / len(pss) / 1024:6.1f} MB, '
+          f'USS {sum(uss) / len(uss) / 1024:6.1f} MB | total (master + workers) PSS '
+          f'{(sum(pss) + master[0]) / 1024:6.1f} MB')
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    directory = tempfile.mkdtemp(prefix='bench-preload-')
+    try:
+        print(f'{workers} workers, {REQUESTS_PER_WORKER * workers} requisições de aquecimento')
+        report('sem preload', *run(False, workers, directory))
+        report('com preload', *run(True, workers, directory))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
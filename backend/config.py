@@ -20,8 +20,161 @@ class Config:
     # Log level
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     
+    # Logging estruturado: formato (json/text), tamanho da fila e amostragem por rota
+    # LOG_SAMPLE_RATES no formato 'router.request=0.1,router.init=0'
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', '')
+    LOG_SAMPLE_DEFAULT = float(os.getenv('LOG_SAMPLE_DEFAULT', '1.0'))
+    
+    # Envelope de resposta do proxy: 'full' (padrão, inclui headers/url/protocolo do upstream)
+    # ou 'compact' (apenas success, status, data e duration_ms)
+    RESPONSE_ENVELOPE = os.getenv('RESPONSE_ENVELOPE', 'full')
+    
+    # Quantidade de ETags recentes (roteador + path) mantidas em memória
+    ETAG_CACHE_SIZE = int(os.getenv('ETAG_CACHE_SIZE', '1024'))
+    
+    # Cache compartilhado entre workers (SQLite WAL local ao nó)
+    SHARED_CACHE_PATH = os.getenv(
+        'SHARED_CACHE_PATH',
+        os.path.join(os.path.dirname(os.getenv('DB_PATH', 'wireguard_manager.db')), 'shared_cache.db')
+    )
+    SHARED_CACHE_MAX_ENTRIES = int(os.getenv('SHARED_CACHE_MAX_ENTRIES', '5000'))
+    SHARED_CACHE_MAX_BYTES = int(os.getenv('SHARED_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    SHARED_CACHE_DEFAULT_TTL = float(os.getenv('SHARED_CACHE_DEFAULT_TTL', '30'))
+    SHARED_CACHE_LOCK_LEASE = float(os.getenv('SHARED_CACHE_LOCK_LEASE', '15'))
+    SHARED_CACHE_EVICT_EVERY = int(os.getenv('SHARED_CACHE_EVICT_EVERY', '64'))
+    
+    # Outbox de emails: envio em background com conexão SMTP reutilizada
+    SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '15'))
+    SMTP_BATCH_SIZE = int(os.getenv('SMTP_BATCH_SIZE', '20'))
+    SMTP_POLL_INTERVAL = float(os.getenv('SMTP_POLL_INTERVAL', '5'))
+    SMTP_CLAIM_LEASE = float(os.getenv('SMTP_CLAIM_LEASE', '120'))
+    SMTP_IDLE_TIMEOUT = float(os.getenv('SMTP_IDLE_TIMEOUT', '60'))
+    SMTP_KEEPALIVE_CHECK = float(os.getenv('SMTP_KEEPALIVE_CHECK', '10'))
+    SMTP_MAX_ATTEMPTS = int(os.getenv('SMTP_MAX_ATTEMPTS', '6'))
+    SMTP_RETRY_BASE_SECONDS = float(os.getenv('SMTP_RETRY_BASE_SECONDS', '30'))
+    SMTP_RETRY_MAX_SECONDS = float(os.getenv('SMTP_RETRY_MAX_SECONDS', '3600'))
+    
+    # Diretório de usuários (paginação por keyset)
+    USERS_PAGE_SIZE = int(os.getenv('USERS_PAGE_SIZE', '100'))
+    USERS_MAX_PAGE_SIZE = int(os.getenv('USERS_MAX_PAGE_SIZE', '1000'))
+    
+    # Journal de operações do proxy (gravação em lote no SQLite)
+    JOURNAL_FLUSH_INTERVAL = float(os.getenv('JOURNAL_FLUSH_INTERVAL', '2'))
+    JOURNAL_BATCH_SIZE = int(os.getenv('JOURNAL_BATCH_SIZE', '200'))
+    JOURNAL_MAX_BUFFER = int(os.getenv('JOURNAL_MAX_BUFFER', '10000'))
+    
+    # Reconciliação declarativa do WireGuard (operações simultâneas por roteador)
+    RECONCILE_CONCURRENCY = int(os.getenv('RECONCILE_CONCURRENCY', '4'))
+    RECONCILE_MAX_CONCURRENCY = int(os.getenv('RECONCILE_MAX_CONCURRENCY', '16'))
+    
+    # Senhas cifradas: cache de valores decifrados e rotação de chave em lotes
+    DECRYPT_CACHE_SIZE = int(os.getenv('DECRYPT_CACHE_SIZE', '128'))
+    DECRYPT_CACHE_TTL = float(os.getenv('DECRYPT_CACHE_TTL', '300'))
+    KEY_ROTATION_BATCH_SIZE = int(os.getenv('KEY_ROTATION_BATCH_SIZE', '100'))
+    KEY_ROTATION_MAX_BATCH_SIZE = int(os.getenv('KEY_ROTATION_MAX_BATCH_SIZE', '5000'))
+    KEY_ROTATION_MAX_ERRORS = int(os.getenv('KEY_ROTATION_MAX_ERRORS', '100'))
+    KEY_ROTATION_PAUSE = float(os.getenv('KEY_ROTATION_PAUSE', '0.05'))
+    KEY_ROTATION_LEASE_SECONDS = float(os.getenv('KEY_ROTATION_LEASE_SECONDS', '60'))
+    
+    # APIs paginadas (OPNsense search*, UniFi): tamanho da página e páginas simultâneas
+    PAGINATION_PAGE_SIZE = int(os.getenv('PAGINATION_PAGE_SIZE', '500'))
+    PAGINATION_WINDOW = int(os.getenv('PAGINATION_WINDOW', '4'))
+    
+    # Agendador por roteador: requisições simultâneas, taxa (token bucket) e espera máxima por fila
+    SCHEDULER_CONCURRENCY = int(os.getenv('SCHEDULER_CONCURRENCY', '4'))
+    SCHEDULER_RATE = float(os.getenv('SCHEDULER_RATE', '20'))
+    SCHEDULER_BURST = int(os.getenv('SCHEDULER_BURST', '10'))
+    SCHEDULER_MAX_WAIT_INTERACTIVE = float(os.getenv('SCHEDULER_MAX_WAIT_INTERACTIVE', '5'))
+    SCHEDULER_MAX_WAIT_BULK = float(os.getenv('SCHEDULER_MAX_WAIT_BULK', '30'))
+    
+    # Exportação/importação em NDJSON
+    EXPORT_GZIP_LEVEL = int(os.getenv('EXPORT_GZIP_LEVEL', '6'))
+    # A importação do banco é validada inteira em memória antes de ser aplicada
+    IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', '100000'))
+    
+    # Análises de peers WireGuard: validade e quantidade de snapshots em memória
+    ANALYTICS_SNAPSHOT_TTL = float(os.getenv('ANALYTICS_SNAPSHOT_TTL', '30'))
+    ANALYTICS_SNAPSHOT_CACHE_SIZE = int(os.getenv('ANALYTICS_SNAPSHOT_CACHE_SIZE', '32'))
+    
+    # Índice de regras de firewall: validade e quantidade de índices em memória
+    FIREWALL_INDEX_TTL = float(os.getenv('FIREWALL_INDEX_TTL', '60'))
+    FIREWALL_INDEX_CACHE_SIZE = int(os.getenv('FIREWALL_INDEX_CACHE_SIZE', '32'))
+    
+    # Índice de prefixos (rotas + allowed-address): validade e quantidade em memória
+    PREFIX_INDEX_TTL = float(os.getenv('PREFIX_INDEX_TTL', '10'))
+    PREFIX_INDEX_CACHE_SIZE = int(os.getenv('PREFIX_INDEX_CACHE_SIZE', '32'))
+    
+    # Perfilamento sob demanda (desligado sem PROFILING_TOKEN)
+    PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005'))
+    PROFILE_MAX_SAMPLES = int(os.getenv('PROFILE_MAX_SAMPLES', '20000'))
+    PROFILE_DIR = os.getenv(
+        'PROFILE_DIR',
+        os.path.join(os.path.dirname(os.getenv('DB_PATH', 'wireguard_manager.db')), 'profiles')
+    )
+    PROFILE_MAX_ENTRIES = int(os.getenv('PROFILE_MAX_ENTRIES', '50'))
+    
+    # Tracing por spans: fração de requisições sem traceparent que iniciam um trace,
+    # spans mantidos em memória e arquivo JSON Lines opcional (com rotação)
+    TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'true').lower() == 'true'
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '1'))
+    TRACE_BUFFER_SIZE = int(os.getenv('TRACE_BUFFER_SIZE', '5000'))
+    TRACE_FILE = os.getenv('TRACE_FILE', '')
+    # Acima deste tamanho o arquivo vira TRACE_FILE.1 (substituindo o anterior); 0 desliga a rotação
+    TRACE_FILE_MAX_BYTES = int(os.getenv('TRACE_FILE_MAX_BYTES', str(50 * 1024 * 1024)))
+    
+    # Automações agendadas: intervalo de verificação, lease do líder entre workers,
+    # claim de cada job em execução, tamanho do lote e novas tentativas
+    AUTOMATION_ENABLED = os.getenv('AUTOMATION_ENABLED', 'true').lower() == 'true'
+    AUTOMATION_POLL_INTERVAL = float(os.getenv('AUTOMATION_POLL_INTERVAL', '5'))
+    AUTOMATION_LEASE_SECONDS = float(os.getenv('AUTOMATION_LEASE_SECONDS', '30'))
+    AUTOMATION_CLAIM_LEASE = float(os.getenv('AUTOMATION_CLAIM_LEASE', '300'))
+    AUTOMATION_BATCH_SIZE = int(os.getenv('AUTOMATION_BATCH_SIZE', '500'))
+    AUTOMATION_MAX_ATTEMPTS = int(os.getenv('AUTOMATION_MAX_ATTEMPTS', '5'))
+    AUTOMATION_RETRY_BASE_SECONDS = float(os.getenv('AUTOMATION_RETRY_BASE_SECONDS', '30'))
+    AUTOMATION_RETRY_MAX_SECONDS = float(os.getenv('AUTOMATION_RETRY_MAX_SECONDS', '3600'))
+    AUTOMATION_MIN_INTERVAL = int(os.getenv('AUTOMATION_MIN_INTERVAL', '60'))
+    
+    # Compressão das respostas (Accept-Encoding): ordem de preferência, tamanho
+    # mínimo, níveis por algoritmo e tipos comprimidos
+    COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    COMPRESSION_ALGORITHMS = [name.strip() for name in os.getenv('COMPRESSION_ALGORITHMS', 'zstd,br,gzip').split(',') if name.strip()]
+    COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+    COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+    COMPRESSION_ZSTD_LEVEL = int(os.getenv('COMPRESSION_ZSTD_LEVEL', '3'))
+    COMPRESSION_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/plain', 'text/csv')
+    
+    # Tokens de sessão (HMAC): segredo (padrão: aleatório, gerado e guardado no banco), validade em
+    # segundos, intervalo máximo para um worker ver revogações e exigência por blueprint
+    AUTH_TOKEN_SECRET = os.getenv('AUTH_TOKEN_SECRET', '')
+    AUTH_ACCESS_TOKEN_TTL = int(os.getenv('AUTH_ACCESS_TOKEN_TTL', '900'))
+    AUTH_REFRESH_TOKEN_TTL = int(os.getenv('AUTH_REFRESH_TOKEN_TTL', str(7 * 24 * 3600)))
+    AUTH_REVOCATION_POLL = float(os.getenv('AUTH_REVOCATION_POLL', '2'))
+    AUTH_REQUIRED = os.getenv('AUTH_REQUIRED', 'false').lower() == 'true'
+    AUTH_PROTECTED_BLUEPRINTS = tuple(
+        name.strip() for name in os.getenv(
+            'AUTH_PROTECTED_BLUEPRINTS', 'users,config,router,journal,backup,automation,write_queue'
+        ).split(',') if name.strip()
+    )
+    
+    # Fila store-and-forward de escritas para roteadores inacessíveis (desligada por padrão):
+    # intervalo do laço, lease do líder, claim por lote, tamanho do lote e teste de conexão
+    WRITE_QUEUE_ENABLED = os.getenv('WRITE_QUEUE_ENABLED', 'false').lower() == 'true'
+    WRITE_QUEUE_POLL_INTERVAL = float(os.getenv('WRITE_QUEUE_POLL_INTERVAL', '5'))
+    WRITE_QUEUE_LEASE_SECONDS = float(os.getenv('WRITE_QUEUE_LEASE_SECONDS', '30'))
+    WRITE_QUEUE_CLAIM_LEASE = float(os.getenv('WRITE_QUEUE_CLAIM_LEASE', '300'))
+    WRITE_QUEUE_BATCH_SIZE = int(os.getenv('WRITE_QUEUE_BATCH_SIZE', '200'))
+    WRITE_QUEUE_PROBE_INTERVAL = float(os.getenv('WRITE_QUEUE_PROBE_INTERVAL', '10'))
+    WRITE_QUEUE_PROBE_MAX_INTERVAL = float(os.getenv('WRITE_QUEUE_PROBE_MAX_INTERVAL', '300'))
+    
     # Roteadores suportados
-    SUPPORTED_ROUTERS = ['mikrotik', 'opnsense', 'unifi']
+    # Drivers embutidos ficam em routers/registry.py; drivers externos entram por
+    # entry points do grupo 'wiredash.routers' ou pela env ROUTER_DRIVERS
+    SUPPORTED_ROUTERS = ['mikrotik', 'opnsense', 'pfsense', 'unifi']
 
 class DevelopmentConfig(Config):
     """Configurações para desenvolvimento"""
@@ -1,16 +1,23 @@
 
 import sqlite3
 import os
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 import bcrypt
 import json
+import secrets
 from encryption import password_encryption
+from tracing import tracer
+
+# Columns exposed by the user directory API (never the password hash)
+USER_PUBLIC_FIELDS = ('id', 'name', 'email', 'enabled', 'created_at')
 
 class DatabaseManager:
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, initialize=True):
         # Default DB path can be overridden with DB_PATH env var (used by Docker volume mounting)
         self.db_path = db_path or os.getenv('DB_PATH', 'wireguard_manager.db')
-        self.init_database()
+        if initialize:
+            self.init_database()
 
     
     def get_connection(self):
@@ -23,6 +30,9 @@ class DatabaseManager:
         """Initialize database with tables"""
         conn = self.get_connection()
         cursor = conn.cursor()
+
+        # WAL lets readers proceed while batched writers (journal, key rotation) commit
+        cursor.execute('PRAGMA journal_mode=WAL')
         
         # Create users table
         cursor.execute('''
@@ -36,6 +46,34 @@ class DatabaseManager:
             )
         ''')
         
+        # Indexes for the keyset-paginated user directory and prefix search
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_usuarios_created_id ON usuarios(created_at, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_usuarios_name_nocase ON usuarios(name COLLATE NOCASE)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_usuarios_email_nocase ON usuarios(email COLLATE NOCASE)')
+
+        # Row counters maintained by triggers, so totals never scan the table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS table_counts (
+                name TEXT PRIMARY KEY,
+                total INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_usuarios_count_insert AFTER INSERT ON usuarios
+            BEGIN
+                UPDATE table_counts SET total = total + 1 WHERE name = 'usuarios';
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_usuarios_count_delete AFTER DELETE ON usuarios
+            BEGIN
+                UPDATE table_counts SET total = total - 1 WHERE name = 'usuarios';
+            END
+        ''')
+        cursor.execute('''
+            INSERT OR IGNORE INTO table_counts (name, total) SELECT 'usuarios', COUNT(*) FROM usuarios
+        ''')
+        
         # Create router configurations table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS configuracoes_roteador (
@@ -92,26 +130,241 @@ class DatabaseManager:
                 FOREIGN KEY(user_id) REFERENCES usuarios(id)
             )
         ''')
+
+        # Create email outbox table (drained by the background sender in mailer.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS email_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                to_email TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                body TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at DATETIME NOT NULL,
+                claimed_by TEXT,
+                claim_expires_at DATETIME,
+                last_error TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                sent_at DATETIME
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox(status, next_attempt_at)')
+
+        # Create API operation journal (written in batches by journal.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS api_journal (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at DATETIME NOT NULL,
+                actor TEXT,
+                router_type TEXT,
+                router_endpoint TEXT,
+                path TEXT,
+                method TEXT,
+                status INTEGER,
+                duration_ms REAL,
+                error_code TEXT
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_api_journal_created ON api_journal(created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_api_journal_router ON api_journal(router_endpoint, created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_api_journal_path ON api_journal(path, created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_api_journal_status ON api_journal(status, created_at)')
         
-        # Insert default admin user if none exists (INSERT OR IGNORE handles race conditions)
-        admin_password = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        # Scheduled automation jobs (fired by automation.py); run_at/claim_expires_at are epoch seconds
+        # and seq is a global change counter the scheduler uses to pick up edits incrementally
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS automation_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                action TEXT NOT NULL,
+                target TEXT NOT NULL,
+                target_id TEXT,
+                router_key TEXT NOT NULL,
+                router TEXT NOT NULL,
+                password TEXT,
+                run_at REAL NOT NULL,
+                interval_seconds INTEGER,
+                enabled BOOLEAN NOT NULL DEFAULT 1,
+                status TEXT NOT NULL DEFAULT 'scheduled',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                seq INTEGER NOT NULL,
+                claimed_by TEXT,
+                claim_expires_at REAL,
+                last_run_at DATETIME,
+                last_result TEXT,
+                created_at DATETIME NOT NULL,
+                updated_at DATETIME NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_automation_jobs_seq ON automation_jobs(seq)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_automation_jobs_status ON automation_jobs(status, id)')
+
+        # Named leases: one holder at a time across workers (automation scheduler leader)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+
+        # Progress of background jobs (key rotation) as JSON, so any worker can report it
         cursor.execute('''
-            INSERT OR IGNORE INTO usuarios (name, email, password, enabled, created_at)
-            VALUES (?, ?, ?, ?, ?)
-        ''', ('Admin User', 'admin@example.com', admin_password, 1, '2024-01-15'))
+            CREATE TABLE IF NOT EXISTS job_status (
+                name TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at DATETIME NOT NULL
+            )
+        ''')
+
+        # Per-user session token cutoff: tokens issued before valid_after are rejected.
+        # Triggers bump it when a user is disabled, changes password or is deleted;
+        # workers poll rows by seq to keep an in-memory copy
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS token_revocations (
+                user_id INTEGER PRIMARY KEY,
+                valid_after REAL NOT NULL,
+                seq INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_token_revocations_seq ON token_revocations(seq)')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_usuarios_revoke_update AFTER UPDATE OF enabled, password ON usuarios
+            WHEN OLD.enabled IS NOT NEW.enabled OR OLD.password IS NOT NEW.password
+            BEGIN
+                INSERT INTO token_revocations (user_id, valid_after, seq)
+                VALUES (NEW.id, (julianday('now') - 2440587.5) * 86400.0,
+                        (SELECT COALESCE(MAX(seq), 0) + 1 FROM token_revocations))
+                ON CONFLICT(user_id) DO UPDATE SET valid_after = excluded.valid_after, seq = excluded.seq;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_usuarios_revoke_delete AFTER DELETE ON usuarios
+            BEGIN
+                INSERT INTO token_revocations (user_id, valid_after, seq)
+                VALUES (OLD.id, (julianday('now') - 2440587.5) * 86400.0,
+                        (SELECT COALESCE(MAX(seq), 0) + 1 FROM token_revocations))
+                ON CONFLICT(user_id) DO UPDATE SET valid_after = excluded.valid_after, seq = excluded.seq;
+            END
+        ''')
+
+        # Random server-side secrets (session token signing key, cache key HMAC), created once
+        # and shared by every worker; never derived from ENCRYPTION_KEY
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS server_secrets (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        ''')
+        cursor.execute(
+            'INSERT OR IGNORE INTO server_secrets (name, value) VALUES (?, ?)',
+            ('session-tokens', secrets.token_hex(32))
+        )
+
+        # Store-and-forward queue of proxy writes to unreachable routers (write_queue.py).
+        # One row per router with its credentials and reachability; entries are applied in id order
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS write_queue_routers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                router_key TEXT UNIQUE NOT NULL,
+                router TEXT NOT NULL,
+                password TEXT,
+                state TEXT NOT NULL DEFAULT 'offline',
+                probe_failures INTEGER NOT NULL DEFAULT 0,
+                next_probe_at REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                last_seen_at DATETIME,
+                updated_at DATETIME NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS write_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                router_key TEXT NOT NULL,
+                method TEXT NOT NULL,
+                path TEXT NOT NULL,
+                body TEXT,
+                actor TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                coalesced INTEGER NOT NULL DEFAULT 0,
+                coalesced_into INTEGER,
+                claimed_by TEXT,
+                claim_expires_at REAL,
+                result TEXT,
+                created_at DATETIME NOT NULL,
+                updated_at DATETIME NOT NULL,
+                applied_at DATETIME
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_write_queue_router ON write_queue(router_key, status, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_write_queue_item ON write_queue(router_key, path, status)')
+
+        # Insert default admin user if none exists (INSERT OR IGNORE handles race conditions)
+        cursor.execute('SELECT 1 FROM usuarios WHERE email = ?', ('admin@example.com',))
+        if cursor.fetchone() is None:
+            # bcrypt is slow on purpose: only hash when the row is actually missing
+            admin_password = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            cursor.execute('''
+                INSERT OR IGNORE INTO usuarios (name, email, password, enabled, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', ('Admin User', 'admin@example.com', admin_password, 1, '2024-01-15'))
         
         conn.commit()
         conn.close()
     
     # User management methods
-    def get_users(self):
-        """Get all users"""
+    def list_users(self, limit, cursor=None, search=None, fields=None, include_total=False):
+        """
+        Keyset-paginated user listing ordered by (created_at, id) descending.
+
+        `cursor` is the (created_at, id) pair of the last row of the previous page,
+        `search` is a case-insensitive prefix matched against name and email and
+        `fields` restricts the returned columns (password is never returned).
+        Returns (users, next_cursor, total); total is None when not requested
+        for a filtered listing.
+        """
+        fields = [f for f in (fields or USER_PUBLIC_FIELDS) if f in USER_PUBLIC_FIELDS] or list(USER_PUBLIC_FIELDS)
+        columns = list(dict.fromkeys(fields + ['id', 'created_at']))
+
+        where = []
+        params = []
+        if search:
+            pattern = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            where.append("(name LIKE ? ESCAPE '\\' OR email LIKE ? ESCAPE '\\')")
+            params.extend([pattern, pattern])
+        filters = list(where)
+        filter_params = list(params)
+        if cursor:
+            where.append('(created_at, id) < (?, ?)')
+            params.extend(cursor)
+
+        query = f"SELECT {', '.join(columns)} FROM usuarios"
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        params.append(limit + 1)
+
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM usuarios ORDER BY created_at DESC')
-        users = [dict(row) for row in cursor.fetchall()]
+        db_cursor = conn.cursor()
+        db_cursor.execute(query, params)
+        rows = [dict(row) for row in db_cursor.fetchall()]
+
+        total = None
+        if not filters:
+            db_cursor.execute("SELECT total FROM table_counts WHERE name = 'usuarios'")
+            row = db_cursor.fetchone()
+            total = row['total'] if row else None
+        elif include_total:
+            db_cursor.execute('SELECT COUNT(*) FROM usuarios WHERE ' + ' AND '.join(filters), filter_params)
+            total = db_cursor.fetchone()[0]
         conn.close()
-        return users
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1]['created_at'], rows[-1]['id'])
+        users = [{key: row[key] for key in fields} for row in rows]
+        return users, next_cursor, total
     
     def get_user_by_email(self, email):
         """Get user by email"""
@@ -294,5 +547,683 @@ class DatabaseManager:
         conn.commit()
         conn.close()
 
-# Global database instance
-db = DatabaseManager()
+    # Email outbox methods
+    def enqueue_email(self, to_email, subject, body):
+        """Durably queue an email for the background sender"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        now = datetime.now().isoformat()
+        cursor.execute('''
+            INSERT INTO email_outbox (to_email, subject, body, status, attempts, next_attempt_at, created_at)
+            VALUES (?, ?, ?, 'pending', 0, ?, ?)
+        ''', (to_email, subject, body, now, now))
+        message_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return message_id
+
+    def claim_outbox_batch(self, owner, limit, lease_seconds):
+        """Atomically claim due messages (pending, or abandoned by a dead sender)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        now = datetime.now()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                SELECT * FROM email_outbox
+                WHERE (status = 'pending' AND next_attempt_at <= ?)
+                   OR (status = 'sending' AND claim_expires_at <= ?)
+                ORDER BY id LIMIT ?
+            ''', (now.isoformat(), now.isoformat(), limit))
+            rows = [dict(row) for row in cursor.fetchall()]
+            if rows:
+                claim_expires_at = (now + timedelta(seconds=lease_seconds)).isoformat()
+                cursor.executemany('''
+                    UPDATE email_outbox SET status = 'sending', claimed_by = ?, claim_expires_at = ?
+                    WHERE id = ?
+                ''', [(owner, claim_expires_at, row['id']) for row in rows])
+            conn.commit()
+        finally:
+            conn.close()
+        return rows
+
+    def mark_email_sent(self, message_id, owner):
+        """Mark a message sent; only applies while `owner` still holds the claim"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE email_outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1,
+                claimed_by = NULL, claim_expires_at = NULL, last_error = NULL
+            WHERE id = ? AND claimed_by = ?
+        ''', (datetime.now().isoformat(), message_id, owner))
+        conn.commit()
+        conn.close()
+
+    def mark_email_failed(self, message_id, owner, error, next_attempt_at=None):
+        """Record a failed attempt of a claimed message; without next_attempt_at the message is given up"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE email_outbox SET status = ?, attempts = attempts + 1, next_attempt_at = COALESCE(?, next_attempt_at),
+                claimed_by = NULL, claim_expires_at = NULL, last_error = ?
+            WHERE id = ? AND claimed_by = ?
+        ''', ('pending' if next_attempt_at else 'failed', next_attempt_at, error, message_id, owner))
+        conn.commit()
+        conn.close()
+
+    def get_outbox_message(self, message_id):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, to_email, subject, status, attempts, next_attempt_at, last_error, created_at, sent_at
+            FROM email_outbox WHERE id = ?
+        ''', (message_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    # API journal methods
+    def insert_journal_entries(self, entries):
+        """Insert a batch of journal entries in a single transaction"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO api_journal
+            (created_at, actor, router_type, router_endpoint, path, method, status, duration_ms, error_code)
+            VALUES (:created_at, :actor, :router_type, :router_endpoint, :path, :method, :status, :duration_ms, :error_code)
+        ''', entries)
+        conn.commit()
+        conn.close()
+
+    def query_journal(self, start=None, end=None, router=None, path=None, status=None, error_code=None,
+                      before_id=None, limit=100):
+        """Query the journal newest first (created_at, id); a path ending in '*' is a prefix match"""
+        where = []
+        params = []
+        if start:
+            where.append('created_at >= ?')
+            params.append(start)
+        if end:
+            where.append('created_at < ?')
+            params.append(end)
+        if router:
+            where.append('router_endpoint = ?')
+            params.append(router)
+        if path:
+            if path.endswith('*'):
+                # Range scan on the path index instead of LIKE
+                prefix = path[:-1]
+                where.append('path >= ? AND path < ?')
+                params.extend([prefix, prefix + '\uffff'])
+            else:
+                where.append('path = ?')
+                params.append(path)
+        if status is not None:
+            where.append('status = ?')
+            params.append(status)
+        if error_code:
+            where.append('error_code = ?')
+            params.append(error_code)
+        if before_id:
+            # Keyset on (created_at, id), the order every journal index already provides
+            where.append('(created_at, id) < (SELECT created_at, id FROM api_journal WHERE id = ?)')
+            params.append(before_id)
+
+        query = 'SELECT * FROM api_journal'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        params.append(limit)
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return rows
+
+    # Automation jobs
+    AUTOMATION_JOB_FIELDS = ('name', 'action', 'target', 'target_id', 'router_key', 'router', 'password',
+                             'run_at', 'interval_seconds', 'enabled')
+
+    def _next_automation_seq(self, cursor):
+        cursor.execute('SELECT COALESCE(MAX(seq), 0) + 1 FROM automation_jobs')
+        return cursor.fetchone()[0]
+
+    def create_automation_jobs(self, jobs):
+        """Insert jobs (dicts with AUTOMATION_JOB_FIELDS) in one transaction; returns their ids"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        now = datetime.now().isoformat()
+        ids = []
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            seq = self._next_automation_seq(cursor)
+            columns = self.AUTOMATION_JOB_FIELDS + ('seq', 'created_at', 'updated_at')
+            placeholders = ', '.join('?' for _ in columns)
+            for job in jobs:
+                cursor.execute(
+                    f"INSERT INTO automation_jobs ({', '.join(columns)}) VALUES ({placeholders})",
+                    tuple(job.get(field) for field in self.AUTOMATION_JOB_FIELDS) + (seq, now, now)
+                )
+                ids.append(cursor.lastrowid)
+            conn.commit()
+        finally:
+            conn.close()
+        return ids
+
+    def get_automation_job(self, job_id):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM automation_jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def list_automation_jobs(self, status=None, after_id=None, limit=100):
+        """Jobs ordered by id (keyset on after_id), without the router password"""
+        where = []
+        params = []
+        if status:
+            where.append('status = ?')
+            params.append(status)
+        if after_id:
+            where.append('id > ?')
+            params.append(after_id)
+        query = 'SELECT * FROM automation_jobs'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY id LIMIT ?'
+        params.append(limit)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        for row in rows:
+            row.pop('password', None)
+        return rows
+
+    def update_automation_job(self, job_id, **fields):
+        """Update editable fields and bump seq; returns False if the job does not exist"""
+        allowed = {'name', 'run_at', 'interval_seconds', 'enabled', 'status', 'attempts'}
+        fields = {key: value for key, value in fields.items() if key in allowed}
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            fields['seq'] = self._next_automation_seq(cursor)
+            fields['updated_at'] = datetime.now().isoformat()
+            assignments = ', '.join(f'{key} = ?' for key in fields)
+            cursor.execute(f'UPDATE automation_jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+            updated = cursor.rowcount > 0
+            conn.commit()
+        finally:
+            conn.close()
+        return updated
+
+    def delete_automation_job(self, job_id):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM automation_jobs WHERE id = ?', (job_id,))
+        deleted = cursor.rowcount > 0
+        conn.commit()
+        conn.close()
+        return deleted
+
+    def changed_automation_jobs(self, after, limit=5000):
+        """Scheduling fields of jobs changed after a (seq, id) position, in that order"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, run_at, seq, status, enabled FROM automation_jobs
+            WHERE (seq, id) > (?, ?) ORDER BY seq, id LIMIT ?
+        ''', (*after, limit))
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return rows
+
+    def claim_automation_jobs(self, job_ids, owner, now, lease_seconds):
+        """
+        Atomically claim due jobs among job_ids. Returns (claimed rows, busy) where
+        busy maps ids still leased by another owner to their claim expiry.
+        """
+        if not job_ids:
+            return [], {}
+        marks = ', '.join('?' for _ in job_ids)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute(f'''
+                UPDATE automation_jobs SET claimed_by = ?, claim_expires_at = ?
+                WHERE id IN ({marks}) AND status = 'scheduled' AND enabled = 1 AND run_at <= ?
+                  AND (claimed_by IS NULL OR claim_expires_at <= ?)
+            ''', (owner, now + lease_seconds, *job_ids, now, now))
+            cursor.execute(f'SELECT * FROM automation_jobs WHERE id IN ({marks})', job_ids)
+            rows = [dict(row) for row in cursor.fetchall()]
+            conn.commit()
+        finally:
+            conn.close()
+        claimed = [row for row in rows if row['claimed_by'] == owner]
+        busy = {
+            row['id']: row['claim_expires_at'] for row in rows
+            if row['claimed_by'] not in (None, owner) and row['status'] == 'scheduled'
+            and row['claim_expires_at'] and row['claim_expires_at'] > now
+        }
+        return claimed, busy
+
+    def finish_automation_jobs(self, updates, owner):
+        """
+        Release claimed jobs with their outcome. Each update is a dict with id,
+        status, run_at, attempts, last_result and optionally target/target_id.
+        Returns the seq assigned to the batch.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        now = datetime.now().isoformat()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            seq = self._next_automation_seq(cursor)
+            cursor.executemany('''
+                UPDATE automation_jobs SET status = ?, run_at = ?, attempts = ?, last_result = ?,
+                    target = COALESCE(?, target), target_id = COALESCE(?, target_id),
+                    last_run_at = ?, updated_at = ?, seq = ?, claimed_by = NULL, claim_expires_at = NULL
+                WHERE id = ? AND claimed_by = ?
+            ''', [
+                (update['status'], update['run_at'], update['attempts'], update['last_result'],
+                 update.get('target'), update.get('target_id'), now, now, seq, update['id'], owner)
+                for update in updates
+            ])
+            conn.commit()
+        finally:
+            conn.close()
+        return seq
+
+    # Server-side secrets
+    def get_server_secret(self, name):
+        """Hex secret stored under name, created at random on first use"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT OR IGNORE INTO server_secrets (name, value) VALUES (?, ?)', (name, secrets.token_hex(32))
+        )
+        conn.commit()
+        cursor.execute('SELECT value FROM server_secrets WHERE name = ?', (name,))
+        value = cursor.fetchone()['value']
+        conn.close()
+        return value
+
+    # Session token revocation
+    def revoke_user_tokens(self, user_id):
+        """Reject every session token issued to the user until now (logout everywhere)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO token_revocations (user_id, valid_after, seq)
+            VALUES (?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM token_revocations))
+            ON CONFLICT(user_id) DO UPDATE SET valid_after = excluded.valid_after, seq = excluded.seq
+        ''', (user_id, time.time()))
+        conn.commit()
+        conn.close()
+
+    def changed_token_revocations(self, after_seq=0):
+        """Revocations written after the given seq, as (user_id, valid_after, seq) tuples"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT user_id, valid_after, seq FROM token_revocations WHERE seq > ? ORDER BY seq',
+            (after_seq,)
+        )
+        rows = [tuple(row) for row in cursor.fetchall()]
+        conn.close()
+        return rows
+
+    # Store-and-forward write queue
+    def enqueue_write(self, router_key, router, password, method, path, body, actor=None):
+        """
+        Queue a write behind the router's pending entries, coalescing per item
+        without reordering: a PATCH merges into the previous one only when that
+        unclaimed PATCH of the same path is the router's newest pending entry, and a
+        DELETE supersedes the unclaimed pending PATCHes of that path queued after the
+        router's last pending PUT/POST (a create may depend on them).
+        Returns (entry id, coalesced).
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        now = datetime.now().isoformat()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                INSERT INTO write_queue_routers (router_key, router, password, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(router_key) DO UPDATE SET router = excluded.router, password = excluded.password,
+                    updated_at = excluded.updated_at
+            ''', (router_key, router, password, now))
+            cursor.execute('''
+                SELECT id, method, path, body, claimed_by FROM write_queue
+                WHERE router_key = ? AND status = 'pending' ORDER BY id DESC LIMIT 1
+            ''', (router_key,))
+            last = cursor.fetchone()
+            if (method == 'PATCH' and last and last['method'] == 'PATCH' and last['path'] == path
+                    and last['claimed_by'] is None):
+                previous = json.loads(last['body']) if last['body'] else None
+                merged = {**previous, **body} if isinstance(previous, dict) and isinstance(body, dict) else body
+                cursor.execute('''
+                    UPDATE write_queue SET body = ?, coalesced = coalesced + 1, actor = ?, updated_at = ?
+                    WHERE id = ?
+                ''', (json.dumps(merged), actor, now, last['id']))
+                conn.commit()
+                return last['id'], True
+            cursor.execute('''
+                INSERT INTO write_queue (router_key, method, path, body, actor, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (router_key, method, path, json.dumps(body) if body is not None else None, actor, now, now))
+            entry_id = cursor.lastrowid
+            coalesced = False
+            if method == 'DELETE':
+                cursor.execute('''
+                    SELECT COALESCE(MAX(id), 0) AS barrier FROM write_queue
+                    WHERE router_key = ? AND status = 'pending' AND method IN ('PUT', 'POST') AND id < ?
+                ''', (router_key, entry_id))
+                barrier = cursor.fetchone()['barrier']
+                cursor.execute('''
+                    UPDATE write_queue SET status = 'coalesced', coalesced_into = ?, updated_at = ?
+                    WHERE router_key = ? AND path = ? AND status = 'pending' AND method = 'PATCH'
+                      AND claimed_by IS NULL AND id > ? AND id < ?
+                ''', (entry_id, now, router_key, path, barrier, entry_id))
+                coalesced = cursor.rowcount > 0
+                cursor.execute('UPDATE write_queue SET coalesced = ? WHERE id = ?', (cursor.rowcount, entry_id))
+            conn.commit()
+        finally:
+            conn.close()
+        return entry_id, coalesced
+
+    def has_pending_writes(self, router_key):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT 1 FROM write_queue WHERE router_key = ? AND status = 'pending' LIMIT 1", (router_key,)
+        )
+        pending = cursor.fetchone() is not None
+        conn.close()
+        return pending
+
+    def due_write_queue_routers(self, now):
+        """Routers with pending writes whose next probe/flush is due"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM write_queue_routers r
+            WHERE next_probe_at <= ?
+              AND EXISTS (SELECT 1 FROM write_queue q WHERE q.router_key = r.router_key AND q.status = 'pending')
+            ORDER BY next_probe_at
+        ''', (now,))
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return rows
+
+    def update_write_queue_router(self, router_key, **fields):
+        allowed = {'state', 'probe_failures', 'next_probe_at', 'last_error', 'last_seen_at'}
+        fields = {key: value for key, value in fields.items() if key in allowed}
+        fields['updated_at'] = datetime.now().isoformat()
+        assignments = ', '.join(f'{key} = ?' for key in fields)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'UPDATE write_queue_routers SET {assignments} WHERE router_key = ?', (*fields.values(), router_key))
+        updated = cursor.rowcount > 0
+        conn.commit()
+        conn.close()
+        return updated
+
+    def claim_write_batch(self, router_key, owner, now, lease_seconds, limit):
+        """
+        Claim the first `limit` pending writes of a router in id order. Returns []
+        if the head of the queue is still leased by another owner, so entries are
+        never applied out of order.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                SELECT * FROM write_queue WHERE router_key = ? AND status = 'pending' ORDER BY id LIMIT ?
+            ''', (router_key, limit))
+            rows = [dict(row) for row in cursor.fetchall()]
+            if any(row['claimed_by'] not in (None, owner) and (row['claim_expires_at'] or 0) > now for row in rows):
+                conn.rollback()
+                return []
+            cursor.executemany(
+                'UPDATE write_queue SET claimed_by = ?, claim_expires_at = ? WHERE id = ?',
+                [(owner, now + lease_seconds, row['id']) for row in rows]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        for row in rows:
+            row['claimed_by'] = owner
+        return rows
+
+    def finish_writes(self, updates, owner):
+        """
+        Record outcomes of claimed writes. Each update is (status, result json, id);
+        status 'pending' releases the claim so the entry is retried in place.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        now = datetime.now().isoformat()
+        cursor.executemany('''
+            UPDATE write_queue SET status = ?, result = ?, updated_at = ?,
+                applied_at = CASE WHEN ? = 'pending' THEN applied_at ELSE ? END,
+                claimed_by = NULL, claim_expires_at = NULL
+            WHERE id = ? AND claimed_by = ?
+        ''', [(status, result, now, status, now, entry_id, owner) for status, result, entry_id in updates])
+        conn.commit()
+        conn.close()
+
+    def write_queue_summary(self):
+        """Per-router reachability and entry counts by status"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM write_queue_routers ORDER BY router_key')
+        routers = {row['router_key']: dict(row) for row in cursor.fetchall()}
+        cursor.execute('''
+            SELECT router_key, status, COUNT(*) AS total, MIN(created_at) AS oldest
+            FROM write_queue GROUP BY router_key, status
+        ''')
+        for row in cursor.fetchall():
+            router = routers.get(row['router_key'])
+            if router is None:
+                continue
+            router.setdefault('counts', {})[row['status']] = row['total']
+            if row['status'] == 'pending':
+                router['oldest_pending_at'] = row['oldest']
+        conn.close()
+        for router in routers.values():
+            router.pop('password', None)
+            router.setdefault('counts', {})
+        return list(routers.values())
+
+    def list_writes(self, router_key=None, status=None, after_id=None, limit=100):
+        """Queued writes ordered by id (keyset on after_id)"""
+        where = []
+        params = []
+        if router_key:
+            where.append('router_key = ?')
+            params.append(router_key)
+        if status:
+            where.append('status = ?')
+            params.append(status)
+        if after_id:
+            where.append('id > ?')
+            params.append(after_id)
+        query = 'SELECT * FROM write_queue'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY id LIMIT ?'
+        params.append(limit)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return rows
+
+    def cancel_write(self, entry_id):
+        """Cancel a pending write that is not being applied; returns False otherwise"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE write_queue SET status = 'cancelled', updated_at = ?
+            WHERE id = ? AND status = 'pending' AND claimed_by IS NULL
+        ''', (datetime.now().isoformat(), entry_id))
+        cancelled = cursor.rowcount > 0
+        conn.commit()
+        conn.close()
+        return cancelled
+
+    # Named leases (one holder across workers)
+    def acquire_lease(self, name, owner, seconds):
+        """Take or renew a named lease; True if `owner` holds it afterwards"""
+        now = time.time()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE leases.owner = excluded.owner OR leases.expires_at <= ?
+            ''', (name, owner, now + seconds, now))
+            held = cursor.rowcount > 0
+            conn.commit()
+        finally:
+            conn.close()
+        return held
+
+    def release_lease(self, name, owner):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, owner))
+        conn.commit()
+        conn.close()
+
+    def get_lease(self, name):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM leases WHERE name = ?', (name,))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    # Background job progress (shared across workers)
+    def save_job_status(self, name, data):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO job_status (name, data, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+        ''', (name, json.dumps(data), datetime.now().isoformat()))
+        conn.commit()
+        conn.close()
+
+    def get_job_status(self, name):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT data FROM job_status WHERE name = ?', (name,))
+        row = cursor.fetchone()
+        conn.close()
+        return json.loads(row['data']) if row else None
+
+    # Encrypted column maintenance (key rotation)
+    ENCRYPTED_PASSWORD_TABLES = ('configuracoes_roteador', 'configuracoes_smtp', 'automation_jobs', 'write_queue_routers')
+
+    def get_encrypted_password_batch(self, table, after_id, limit):
+        """Read (id, password) rows after a given id, for streaming re-encryption"""
+        if table not in self.ENCRYPTED_PASSWORD_TABLES:
+            raise ValueError(f'Unsupported table: {table}')
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT id, password FROM {table} WHERE id > ? ORDER BY id LIMIT ?', (after_id, limit))
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return rows
+
+    def replace_encrypted_passwords(self, table, updates):
+        """
+        Swap ciphertexts in one short transaction. Each update is (new, id, old) and
+        only applies if the row still holds the old value, so concurrent saves win.
+        """
+        if table not in self.ENCRYPTED_PASSWORD_TABLES:
+            raise ValueError(f'Unsupported table: {table}')
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany(f'UPDATE {table} SET password = ? WHERE id = ? AND password = ?', updates)
+        changed = conn.total_changes
+        conn.commit()
+        conn.close()
+        return changed
+
+    # Streaming export / import of configuration tables
+    EXPORTABLE_TABLES = ('configuracoes_roteador', 'configuracoes_wireguard', 'configuracoes_smtp')
+
+    def iter_table_rows(self, table, batch_size=500):
+        """Yield rows of a configuration table incrementally (passwords stay encrypted)"""
+        if table not in self.EXPORTABLE_TABLES:
+            raise ValueError(f'Unsupported table: {table}')
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT * FROM {table} ORDER BY id')
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            conn.close()
+
+    def import_tables(self, rows_by_table):
+        """
+        Replace the contents of each given table with its exported rows, all in one
+        transaction (every table or none), ignoring unknown columns. Only the columns
+        present in a row are written, so missing ones (e.g. from an older backup) get
+        their schema defaults instead of NULL. Returns {table: rows imported}.
+        """
+        for table in rows_by_table:
+            if table not in self.EXPORTABLE_TABLES:
+                raise ValueError(f'Unsupported table: {table}')
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for table, rows in rows_by_table.items():
+                cursor.execute(f'DELETE FROM {table}')
+                cursor.execute(f'PRAGMA table_info({table})')
+                columns = [row['name'] for row in cursor.fetchall()]
+                # One executemany per distinct column set (normally a single group)
+                groups = {}
+                for row in rows:
+                    present = tuple(column for column in columns if column in row)
+                    groups.setdefault(present, []).append(tuple(row[column] for column in present))
+                for present, values in groups.items():
+                    if not present:
+                        continue
+                    placeholders = ', '.join('?' for _ in present)
+                    cursor.executemany(
+                        f"INSERT OR REPLACE INTO {table} ({', '.join(present)}) VALUES ({placeholders})", values
+                    )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return {table: len(rows) for table, rows in rows_by_table.items()}
+
+# Spans for each query method when called inside a trace
+tracer.instrument(DatabaseManager, 'db', exclude=('get_connection', 'init_database'))
+
+# Global database instance; the schema is created by create_app() (once, before fork)
+db = DatabaseManager(initialize=False)
@@ -1,83 +1,165 @@
 import os
 import base64
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import padding
 
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Versioned ciphertext prefix: "v2:<key id>:<base64(nonce + ciphertext + tag)>"
+AEAD_VERSION = 'v2'
+AEAD_ASSOCIATED_DATA = b'wiredash-password-v2'
+NONCE_SIZE = 12
+
+
+class DecryptionError(Exception):
+    """Raised by decrypt_password_strict when no configured key can decrypt a value"""
+
+
+def _normalize_key(raw_key):
+    # Ensure key is exactly 32 bytes for AES-256
+    if len(raw_key) < 32:
+        raw_key = raw_key.ljust(32, '0')[:32]
+    else:
+        raw_key = raw_key[:32]
+    return raw_key.encode('utf-8')
+
+
+def _key_id(key):
+    return hashlib.sha256(key).hexdigest()[:8]
+
+
 class PasswordEncryption:
     def __init__(self):
         # Get encryption key from environment or use default (not recommended for production)
-        self.key = os.environ.get('ENCRYPTION_KEY', 'default_32_char_key_not_for_prod')
-        # Ensure key is exactly 32 bytes for AES-256
-        if len(self.key) < 32:
-            self.key = self.key.ljust(32, '0')[:32]
-        else:
-            self.key = self.key[:32]
-        self.key = self.key.encode('utf-8')
-    
+        self.key = _normalize_key(os.environ.get('ENCRYPTION_KEY', 'default_32_char_key_not_for_prod'))
+        self.key_id = _key_id(self.key)
+
+        # Previous keys stay available for decryption while rows are rotated
+        previous = [k for k in os.environ.get('ENCRYPTION_KEYS_PREVIOUS', '').split(',') if k]
+        self.keys = OrderedDict([(self.key_id, self.key)])
+        for raw_key in previous:
+            key = _normalize_key(raw_key)
+            self.keys.setdefault(_key_id(key), key)
+
+        # Cipher contexts are built once per key instead of on every call
+        self._aead = {kid: AESGCM(key) for kid, key in self.keys.items()}
+        self._cbc_algorithms = [algorithms.AES(key) for key in self.keys.values()]
+
+        # Small bounded cache of decrypted secrets keyed by ciphertext hash
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_size = Config.DECRYPT_CACHE_SIZE
+        self.cache_ttl = Config.DECRYPT_CACHE_TTL
+
     def encrypt_password(self, plain_password: str) -> str:
-        """Encrypt password using AES-256-CBC"""
+        """Encrypt password using AES-256-GCM (versioned, authenticated)"""
         if not plain_password:
             return ""
-        
+
         try:
-            # Generate random IV
-            iv = os.urandom(16)
-            
-            # Create cipher
-            cipher = Cipher(algorithms.AES(self.key), modes.CBC(iv), backend=default_backend())
-            encryptor = cipher.encryptor()
-            
-            # Apply PKCS7 padding
-            padder = padding.PKCS7(128).padder()
-            padded_data = padder.update(plain_password.encode('utf-8'))
-            padded_data += padder.finalize()
-            
-            # Encrypt
-            encrypted = encryptor.update(padded_data) + encryptor.finalize()
-            
-            # Combine IV and encrypted data, then base64 encode
-            encrypted_data = iv + encrypted
-            return base64.b64encode(encrypted_data).decode('utf-8')
-            
+            nonce = os.urandom(NONCE_SIZE)
+            encrypted = self._aead[self.key_id].encrypt(nonce, plain_password.encode('utf-8'), AEAD_ASSOCIATED_DATA)
+            payload = base64.b64encode(nonce + encrypted).decode('utf-8')
+            return f'{AEAD_VERSION}:{self.key_id}:{payload}'
+
         except Exception as e:
-            print(f"Error encrypting password: {str(e)}")
+            logger.error('Error encrypting password: %s', e)
             return plain_password  # Fallback to plain text for backward compatibility
-    
+
     def decrypt_password(self, encrypted_password: str) -> str:
-        """Decrypt password using AES-256-CBC"""
+        """Decrypt a v2 (AES-GCM) or legacy AES-256-CBC password"""
         if not encrypted_password:
             return ""
-        
+
         try:
-            # Decode base64
-            encrypted_data = base64.b64decode(encrypted_password.encode('utf-8'))
-            
-            # Extract IV and encrypted content
-            iv = encrypted_data[:16]
-            encrypted_content = encrypted_data[16:]
-            
-            # Create cipher
-            cipher = Cipher(algorithms.AES(self.key), modes.CBC(iv), backend=default_backend())
-            decryptor = cipher.decryptor()
-            
-            # Decrypt
-            decrypted_padded = decryptor.update(encrypted_content) + decryptor.finalize()
-            
-            # Remove PKCS7 padding
-            unpadder = padding.PKCS7(128).unpadder()
-            decrypted = unpadder.update(decrypted_padded)
-            decrypted += unpadder.finalize()
-            
-            return decrypted.decode('utf-8')
-            
-        except Exception as e:
-            print(f"Error decrypting password: {str(e)}")
+            return self.decrypt_password_strict(encrypted_password)
+        except DecryptionError as e:
+            logger.warning('Error decrypting password: %s', e)
             # Assume it's plain text (for backward compatibility)
             return encrypted_password
-    
+
+    def decrypt_password_strict(self, encrypted_password: str) -> str:
+        """Decrypt or raise DecryptionError (never falls back to plain text)"""
+        digest = hashlib.sha256(encrypted_password.encode('utf-8')).digest()
+        now = time.monotonic()
+        with self._cache_lock:
+            cached = self._cache.get(digest)
+            if cached is not None and cached[1] > now:
+                self._cache.move_to_end(digest)
+                return cached[0]
+
+        if encrypted_password.startswith(AEAD_VERSION + ':'):
+            plain = self._decrypt_aead(encrypted_password)
+        else:
+            plain = self._decrypt_cbc(encrypted_password)
+
+        with self._cache_lock:
+            self._cache[digest] = (plain, now + self.cache_ttl)
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return plain
+
+    def _decrypt_aead(self, encrypted_password):
+        try:
+            _, kid, payload = encrypted_password.split(':', 2)
+            data = base64.b64decode(payload.encode('utf-8'))
+        except ValueError as e:
+            raise DecryptionError(f'Malformed ciphertext: {e}')
+        aead = self._aead.get(kid)
+        if aead is None:
+            raise DecryptionError(f'Unknown encryption key id: {kid}')
+        if len(data) <= NONCE_SIZE:
+            raise DecryptionError('Ciphertext too short')
+        try:
+            return aead.decrypt(data[:NONCE_SIZE], data[NONCE_SIZE:], AEAD_ASSOCIATED_DATA).decode('utf-8')
+        except InvalidTag:
+            raise DecryptionError('Authentication tag mismatch')
+        except ValueError as e:
+            # Truncated tag (AESGCM needs 16 bytes) or plaintext that is not UTF-8
+            raise DecryptionError(f'Malformed ciphertext: {e}')
+
+    def _decrypt_cbc(self, encrypted_password):
+        """Legacy format: base64(IV + AES-256-CBC(PKCS7(plain)))"""
+        try:
+            encrypted_data = base64.b64decode(encrypted_password.encode('utf-8'))
+        except ValueError as e:
+            raise DecryptionError(f'Not base64: {e}')
+        iv = encrypted_data[:16]
+        encrypted_content = encrypted_data[16:]
+        if len(iv) != 16 or not encrypted_content or len(encrypted_content) % 16:
+            raise DecryptionError('Invalid CBC ciphertext length')
+
+        for algorithm in self._cbc_algorithms:
+            try:
+                decryptor = Cipher(algorithm, modes.CBC(iv), backend=default_backend()).decryptor()
+                decrypted_padded = decryptor.update(encrypted_content) + decryptor.finalize()
+                unpadder = padding.PKCS7(128).unpadder()
+                decrypted = unpadder.update(decrypted_padded) + unpadder.finalize()
+                return decrypted.decode('utf-8')
+            except ValueError:
+                # Wrong key (bad padding or invalid UTF-8): try the next one
+                continue
+        raise DecryptionError('No configured key decrypts this value')
+
+    def needs_rotation(self, encrypted_password: str) -> bool:
+        """True if the value is not a v2 ciphertext under the current key"""
+        return bool(encrypted_password) and not encrypted_password.startswith(f'{AEAD_VERSION}:{self.key_id}:')
+
     def is_encrypted(self, password: str) -> bool:
         """Check if password is already encrypted"""
+        if password.startswith(AEAD_VERSION + ':'):
+            return True
         try:
             # Try to decode as base64 and check if it's likely encrypted
             decoded = base64.b64decode(password.encode('utf-8'))
@@ -86,4 +168,4 @@ class PasswordEncryption:
             return False
 
 # Global encryption instance
-password_encryption = PasswordEncryption()
\ No newline at end of file
+password_encryption = PasswordEncryption()
@@ -0,0 +1,94 @@
+"""
+ETags fortes para leituras feitas através do proxy
+
+O ETag é calculado sobre a serialização canônica (chaves ordenadas) do payload
+do upstream. Um cache LRU por roteador e path guarda a impressão digital do
+corpo bruto recebido: se o roteador devolver exatamente os mesmos bytes, o ETag
+anterior é reaproveitado sem re-serializar o payload.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def fingerprint(raw_bytes):
+    """Impressão digital barata do corpo bruto do upstream"""
+    return hashlib.blake2b(raw_bytes, digest_size=16).digest()
+
+
+def compute_etag(canonical_bytes):
+    """ETag forte a partir da serialização canônica do payload"""
+    return '"%s"' % hashlib.blake2b(canonical_bytes, digest_size=16).hexdigest()
+
+
+# Sufixos que response_compression acrescenta ao ETag da representação comprimida
+ENCODING_SUFFIXES = ('-gzip"', '-br"', '-zstd"')
+
+
+def _strip_encoding(tag):
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Comparação fraca de If-None-Match (RFC 9110, seção 13.1.2); o sufixo de
+    codificação ("abc-gzip") é ignorado, pois o conteúdo é o mesmo
+    """
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if _strip_encoding(candidate) == opaque:
+            return True
+    return False
+
+
+class TagCache:
+    """Cache LRU thread-safe de (impressão digital do corpo -> ETag) por chave"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, key, body_fingerprint):
+        """Retornar o ETag conhecido se o corpo bruto não mudou"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != body_fingerprint:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def store(self, key, body_fingerprint, etag):
+        with self._lock:
+            self._entries[key] = (body_fingerprint, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def etag_for_result(cache, key, result, raw_body, serialize):
+    """
+    Obter o ETag de um resultado do proxy.
+
+    `raw_body` é o corpo bruto do upstream (ou None se indisponível) e
+    `serialize` produz os bytes canônicos do payload quando necessário.
+    """
+    body_fingerprint = fingerprint(raw_body) if raw_body is not None else None
+    if body_fingerprint is not None:
+        etag = cache.lookup(key, body_fingerprint)
+        if etag is not None:
+            return etag
+    etag = compute_etag(serialize(result.get('data')))
+    if body_fingerprint is not None:
+        cache.store(key, body_fingerprint, etag)
+    return etag
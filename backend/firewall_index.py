@@ -0,0 +1,277 @@
+"""
+Índice de regras de firewall para consultas de "primeira regra que casa"
+
+As regras normalizadas (routers/firewall.py) são agrupadas por cadeia e
+numeradas pela ordem de avaliação; cada regra vira um bit. Para cada critério
+o índice guarda, por intervalo elementar (faixas de endereço e porta) ou por
+valor (protocolo, interface), o conjunto de regras que aceitam aquele valor
+como um inteiro usado como bitset. Uma consulta faz uma busca binária por
+dimensão, um AND dos bitsets e pega o bit menos significativo: a primeira
+regra na ordem. Regras com critérios não avaliáveis localmente são "incertas"
+e são informadas quando aparecem antes da primeira correspondência certa.
+"""
+import ipaddress
+import time
+from bisect import bisect_right
+
+from config import Config
+from peer_analytics import SnapshotCache
+from routers.firewall import TERMINAL_ACTIONS, BRANCH_ACTIONS, normalize_protocols
+
+# Máximo de regras incertas listadas por resposta
+MAX_UNCERTAIN = 20
+
+
+class RangeDimension:
+    """Faixas numéricas por regra -> bitset por intervalo elementar"""
+
+    def __init__(self):
+        self.any = 0
+        self.constrained = 0
+        self._toggles = {}
+        self.points = []
+        self.covers = []
+
+    def add(self, bit, ranges):
+        if ranges is None:
+            self.any |= bit
+            return
+        self.constrained |= bit
+        # Faixas já unidas: alternar o bit no início e logo após o fim
+        for start, end in ranges:
+            self._toggles[start] = self._toggles.get(start, 0) ^ bit
+            self._toggles[end + 1] = self._toggles.get(end + 1, 0) ^ bit
+
+    def build(self):
+        self.points = sorted(self._toggles)
+        cover = 0
+        for point in self.points:
+            cover ^= self._toggles[point]
+            self.covers.append(cover)
+        self._toggles = None
+        return self
+
+    def lookup(self, value):
+        index = bisect_right(self.points, value) - 1
+        return self.any | (self.covers[index] if index >= 0 else 0)
+
+
+class DiscreteDimension:
+    """Valores discretos (protocolo, interface), com negação"""
+
+    def __init__(self):
+        self.any = 0
+        self.constrained = 0
+        self.positive = {}
+        self.negative = {}
+
+    def add(self, bit, values, negated=False):
+        if values is None:
+            self.any |= bit
+            return
+        self.constrained |= bit
+        if negated:
+            self.any |= bit
+            for value in values:
+                self.negative[value] = self.negative.get(value, 0) | bit
+        else:
+            for value in values:
+                self.positive[value] = self.positive.get(value, 0) | bit
+
+    def build(self):
+        return self
+
+    def lookup(self, value):
+        return (self.any | self.positive.get(value, 0)) & ~self.negative.get(value, 0)
+
+
+def _interface(value):
+    if not value:
+        return None, False
+    if value.startswith('!'):
+        return {value[1:]}, True
+    return {value}, False
+
+
+def _family_ranges(addresses, family):
+    if addresses is None:
+        return None
+    return addresses.get(family, [])
+
+
+class ChainIndex:
+    """Índice das regras terminais habilitadas de uma cadeia"""
+
+    def __init__(self, rules):
+        self.rules = [
+            rule for rule in sorted(rules, key=lambda rule: rule.position)
+            if not rule.disabled and (rule.action in TERMINAL_ACTIONS or rule.action in BRANCH_ACTIONS)
+        ]
+        self.all = (1 << len(self.rules)) - 1
+        self.uncertain = 0
+        self.dimensions = {
+            'src4': RangeDimension(), 'src6': RangeDimension(),
+            'dst4': RangeDimension(), 'dst6': RangeDimension(),
+            'src_port': RangeDimension(), 'dst_port': RangeDimension(),
+            'protocol': DiscreteDimension(),
+            'in_interface': DiscreteDimension(), 'out_interface': DiscreteDimension(),
+        }
+        dims = self.dimensions
+        for index, rule in enumerate(self.rules):
+            bit = 1 << index
+            if rule.unresolved or rule.action in BRANCH_ACTIONS:
+                self.uncertain |= bit
+            for family in (4, 6):
+                dims[f'src{family}'].add(bit, _family_ranges(rule.src, family))
+                dims[f'dst{family}'].add(bit, _family_ranges(rule.dst, family))
+            dims['src_port'].add(bit, rule.src_ports)
+            dims['dst_port'].add(bit, rule.dst_ports)
+            dims['protocol'].add(bit, rule.protocols, rule.protocols_negated)
+            dims['in_interface'].add(bit, *_interface(rule.in_interface))
+            dims['out_interface'].add(bit, *_interface(rule.out_interface))
+        for dimension in dims.values():
+            dimension.build()
+
+    def match(self, query):
+        candidates = self.all
+        uncertain = self.uncertain
+        family = query['family']
+        lookups = (
+            (f'src{family}' if family else 'src4', query['src']),
+            (f'dst{family}' if family else 'dst4', query['dst']),
+            ('src_port', query['src_port']),
+            ('dst_port', query['dst_port']),
+            ('protocol', query['protocol']),
+            ('in_interface', query['in_interface']),
+            ('out_interface', query['out_interface']),
+        )
+        for name, value in lookups:
+            dimension = self.dimensions[name]
+            if value is None:
+                # Critério não informado: regras que o restringem podem ou não casar
+                uncertain |= dimension.constrained
+            else:
+                candidates &= dimension.lookup(value)
+            if not candidates:
+                break
+        if family is None:
+            # Sem endereços na consulta, regras com endereço também ficam incertas
+            for name in ('src6', 'dst6'):
+                uncertain |= self.dimensions[name].constrained
+
+        certain = candidates & ~uncertain
+        first = (certain & -certain).bit_length() - 1 if certain else None
+        before = candidates & uncertain
+        if first is not None:
+            before &= (1 << first) - 1
+        return {
+            'rule': self.rules[first].to_dict() if first is not None else None,
+            'uncertain_before': [rule.to_dict() for rule in _rules_from_bits(self.rules, before, MAX_UNCERTAIN)],
+        }
+
+
+def _rules_from_bits(rules, bits, limit):
+    result = []
+    while bits and len(result) < limit:
+        low = bits & -bits
+        result.append(rules[low.bit_length() - 1])
+        bits ^= low
+    return result
+
+
+class FirewallIndex:
+    """Índices por cadeia de um snapshot das regras de um roteador"""
+
+    def __init__(self, rules, taken_at=None):
+        self.taken_at = taken_at or time.time()
+        self.rule_count = len(rules)
+        by_chain = {}
+        for rule in rules:
+            by_chain.setdefault(rule.chain, []).append(rule)
+        self.chains = {chain: ChainIndex(items) for chain, items in by_chain.items()}
+
+    def match(self, query):
+        """Primeira regra que casa, numa cadeia (query['chain']) ou em todas"""
+        if query['chain'] is not None:
+            chain = self.chains.get(query['chain'])
+            if chain is None:
+                return {query['chain']: {'rule': None, 'uncertain_before': []}}
+            return {query['chain']: chain.match(query)}
+        return {name: chain.match(query) for name, chain in self.chains.items()}
+
+    def describe(self):
+        return {
+            'taken_at': self.taken_at,
+            'age_seconds': round(time.time() - self.taken_at, 3),
+            'rules': self.rule_count,
+            'chains': {name: len(chain.rules) for name, chain in self.chains.items()},
+        }
+
+
+def _port(value, name):
+    if value is None or value == '':
+        return None
+    try:
+        port = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} deve ser um número de porta')
+    if not 0 <= port <= 65535:
+        raise ValueError(f'{name} fora da faixa 0-65535')
+    return port
+
+
+def parse_query(data):
+    """
+    Normalizar uma consulta {src, dst, protocol, srcPort, dstPort, chain,
+    inInterface, outInterface}; levanta ValueError com a mensagem para o cliente
+    """
+    family = None
+    addresses = {}
+    for field in ('src', 'dst'):
+        value = data.get(field)
+        if value in (None, ''):
+            addresses[field] = None
+            continue
+        try:
+            address = ipaddress.ip_address(str(value).strip())
+        except ValueError:
+            raise ValueError(f'{field} deve ser um endereço IP')
+        if family is not None and address.version != family:
+            raise ValueError('src e dst devem ser da mesma família (IPv4 ou IPv6)')
+        family = address.version
+        addresses[field] = int(address)
+    protocols = normalize_protocols(data.get('protocol'))
+    if protocols is not None and len(protocols) != 1:
+        raise ValueError('protocol deve ser um único protocolo')
+    return {
+        'family': family,
+        'src': addresses['src'],
+        'dst': addresses['dst'],
+        'protocol': next(iter(protocols)) if protocols else None,
+        'src_port': _port(data.get('srcPort'), 'srcPort'),
+        'dst_port': _port(data.get('dstPort'), 'dstPort'),
+        'chain': data.get('chain') or None,
+        'in_interface': data.get('inInterface') or None,
+        'out_interface': data.get('outInterface') or None,
+    }
+
+
+def load_index(cache, key, fetch, refresh=False):
+    """
+    Obter o índice do cache ou montar a partir de `fetch()` (resultado com as
+    regras normalizadas em data). Retorna (índice, None) ou (None, falha).
+    """
+    if not refresh:
+        index = cache.get(key)
+        if index is not None:
+            return index, None
+    result = fetch()
+    if not result.get('success') or result.get('status', 0) >= 400:
+        return None, result
+    index = FirewallIndex(result.get('data') or [])
+    cache.store(key, index)
+    return index, None
+
+
+# Índices compartilhados pelos blueprints (por processo)
+indexes = SnapshotCache(max_entries=Config.FIREWALL_INDEX_CACHE_SIZE, ttl=Config.FIREWALL_INDEX_TTL)
@@ -0,0 +1,35 @@
+"""
+Configuração do gunicorn
+
+Com preload o app é montado uma vez no master (create_app) e os workers são
+criados por fork, compartilhando por copy-on-write os módulos e dados
+imutáveis. Cada worker sobe os próprios recursos em post_worker_init.
+
+    gunicorn -c gunicorn.conf.py 'app:create_app()'
+"""
+import gc
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+wsgi_app = 'app:create_app()'
+
+
+def when_ready(server):
+    # Sem arquivo, /api/traces só vê os spans do worker que atendeu a consulta
+    if workers > 1 and os.getenv('TRACING_ENABLED', 'true').lower() == 'true' and not os.getenv('TRACE_FILE'):
+        server.log.warning('TRACE_FILE não definido com %s workers: /api/traces mostra apenas um worker', workers)
+
+
+def pre_fork(server, worker):
+    # Objetos do master vão para a geração permanente: o coletor do worker não
+    # os percorre nem escreve nos cabeçalhos, então as páginas continuam compartilhadas
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    from app import init_worker
+    init_worker()
+    worker.log.info('Worker pronto (pid: %s)', worker.pid)
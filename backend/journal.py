@@ -0,0 +1,101 @@
+"""
+Journal das operações feitas nos roteadores através do proxy
+
+As entradas vão para um buffer em memória e são gravadas no SQLite em lotes
+(uma transação por lote) por uma thread dedicada, disparada por tempo ou pelo
+tamanho do buffer, de modo que o journal não adiciona um fsync por requisição.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+from config import Config
+from database import db
+
+logger = logging.getLogger(__name__)
+
+
+class OperationJournal:
+    """Buffer write-behind para a tabela api_journal"""
+
+    def __init__(self, flush_interval=None, batch_size=None, max_buffer=None):
+        self.flush_interval = flush_interval or Config.JOURNAL_FLUSH_INTERVAL
+        self.batch_size = batch_size or Config.JOURNAL_BATCH_SIZE
+        self.max_buffer = max_buffer or Config.JOURNAL_MAX_BUFFER
+        self.dropped = 0
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # Uma thread por processo; após fork o filho cria a sua
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._buffer = deque()
+            self._wake = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='api-journal', daemon=True)
+            self._thread.start()
+
+    def record(self, actor, router_type, router_endpoint, path, method, status, duration_ms, error_code):
+        """Registrar uma operação (não toca no banco)"""
+        self._ensure_started()
+        entry = {
+            'created_at': datetime.now().isoformat(),
+            'actor': actor,
+            'router_type': router_type,
+            'router_endpoint': router_endpoint,
+            'path': path,
+            'method': method,
+            'status': status,
+            'duration_ms': duration_ms,
+            'error_code': error_code,
+        }
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                # Banco indisponível por muito tempo: preserva as entradas mais recentes
+                self._buffer.popleft()
+                self.dropped += 1
+            self._buffer.append(entry)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Gravar o conteúdo atual do buffer em uma transação"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = list(self._buffer), deque()
+            if not batch:
+                return 0
+            try:
+                db.insert_journal_entries(batch)
+            except Exception as e:
+                logger.error('Failed to flush API journal (%s entries): %s', len(batch), e)
+                # Devolve o lote ao buffer para a próxima tentativa, respeitando o limite
+                with self._lock:
+                    room = max(self.max_buffer - len(self._buffer), 0)
+                    if room:
+                        self._buffer.extendleft(reversed(batch[-room:]))
+                    self.dropped += max(len(batch) - room, 0)
+                return 0
+            return len(batch)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+journal = OperationJournal()
+atexit.register(journal.flush)
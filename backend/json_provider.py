@@ -0,0 +1,66 @@
+"""
+Provider JSON rápido para o Flask
+
+Usa orjson quando disponível e recorre ao provider padrão do Flask (stdlib json)
+para tipos ou argumentos que o orjson não suporta.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+_ORJSON_OPTIONS = 0
+if orjson is not None:
+    # Datas passam pelo `default` do Flask para manter o formato HTTP-date atual
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSONProvider baseado em orjson com fallback para o json da stdlib"""
+
+    # Ordenar chaves tem custo e nenhum cliente depende da ordem
+    sort_keys = False
+
+    def _orjson_options(self, indent=None, sort_keys=None):
+        options = _ORJSON_OPTIONS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        if self.sort_keys if sort_keys is None else sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps_bytes(self, obj, indent=None, sort_keys=None):
+        """Serializar diretamente para bytes (evita decode/encode intermediário)"""
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=self.default, option=self._orjson_options(indent, sort_keys))
+            except TypeError:
+                # Ex.: inteiros acima de 64 bits; o json da stdlib aceita
+                pass
+        kwargs = {'indent': indent} if indent else {}
+        if sort_keys is not None:
+            kwargs['sort_keys'] = sort_keys
+        return super().dumps(obj, **kwargs).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not set(kwargs) - {'indent', 'sort_keys'}:
+            return self.dumps_bytes(obj, kwargs.get('indent'), kwargs.get('sort_keys')).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                pass
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = None
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            indent = 2
+        body = self.dumps_bytes(obj, indent=indent) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
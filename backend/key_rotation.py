@@ -0,0 +1,120 @@
+"""
+Rotação online da chave de criptografia das senhas armazenadas
+
+Percorre configuracoes_roteador e configuracoes_smtp em lotes por id, re-cifrando
+com a chave atual (formato v2) os valores gravados com chaves anteriores ou no
+formato CBC legado. Cada lote é uma transação curta e, com o banco em WAL, as
+leituras não são bloqueadas durante a rotação.
+
+O lease `key-rotation` (tabela leases) garante uma rotação por vez entre todos
+os workers, renovado a cada lote; o progresso fica na tabela job_status, então
+qualquer worker responde ao GET de status. Se o worker que rodava morrer, o
+lease expira e o status passa a 'interrupted'.
+"""
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from config import Config
+from database import db
+from encryption import password_encryption, DecryptionError
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = 'key-rotation'
+
+
+class KeyRotationJob:
+    """Job em background de re-cifragem; um por vez entre os workers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._status = None
+
+    @property
+    def status(self):
+        """Progresso gravado no banco pelo worker que roda (ou rodou) a rotação"""
+        status = db.get_job_status(JOB_NAME) or {'state': 'idle'}
+        if status['state'] == 'running':
+            lease = db.get_lease(JOB_NAME)
+            if not lease or lease['expires_at'] <= time.time():
+                status['state'] = 'interrupted'
+        return status
+
+    def start(self, batch_size=None):
+        """Iniciar a rotação; retorna False se já houver uma em andamento em algum worker"""
+        with self._lock:
+            owner = uuid.uuid4().hex
+            if not db.acquire_lease(JOB_NAME, owner, Config.KEY_ROTATION_LEASE_SECONDS):
+                return False
+            self._status = {
+                'state': 'running',
+                'key_id': password_encryption.key_id,
+                'started_at': datetime.now().isoformat(),
+                'finished_at': None,
+                'scanned': 0,
+                'rotated': 0,
+                'skipped': 0,
+                'errors': [],
+            }
+            db.save_job_status(JOB_NAME, self._status)
+            self._thread = threading.Thread(
+                target=self._run, args=(owner, batch_size or Config.KEY_ROTATION_BATCH_SIZE),
+                name='key-rotation', daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def _add_error(self, error):
+        # Só os primeiros KEY_ROTATION_MAX_ERRORS; o total fica em 'skipped'
+        if len(self._status['errors']) < Config.KEY_ROTATION_MAX_ERRORS:
+            self._status['errors'].append(error)
+
+    def rotate_table(self, table, batch_size, owner):
+        last_id = 0
+        while True:
+            rows = db.get_encrypted_password_batch(table, last_id, batch_size)
+            if not rows:
+                return
+            updates = []
+            for row in rows:
+                self._status['scanned'] += 1
+                old = row['password']
+                if not password_encryption.needs_rotation(old):
+                    continue
+                try:
+                    plain = password_encryption.decrypt_password_strict(old)
+                except DecryptionError as e:
+                    # Valor em texto puro ou chave desconhecida: não arriscar corromper
+                    self._status['skipped'] += 1
+                    self._add_error({'table': table, 'id': row['id'], 'error': str(e)})
+                    continue
+                updates.append((password_encryption.encrypt_password(plain), row['id'], old))
+            if updates:
+                self._status['rotated'] += db.replace_encrypted_passwords(table, updates)
+            last_id = rows[-1]['id']
+            db.save_job_status(JOB_NAME, self._status)
+            if not db.acquire_lease(JOB_NAME, owner, Config.KEY_ROTATION_LEASE_SECONDS):
+                raise RuntimeError('Lease da rotação perdido')
+            # Cede espaço para escritas concorrentes entre lotes
+            time.sleep(Config.KEY_ROTATION_PAUSE)
+
+    def _run(self, owner, batch_size):
+        try:
+            for table in db.ENCRYPTED_PASSWORD_TABLES:
+                self.rotate_table(table, batch_size, owner)
+            self._status['state'] = 'completed'
+        except Exception as e:
+            logger.error('Key rotation failed: %s', e)
+            self._status['state'] = 'failed'
+            self._status['errors'].append({'error': str(e)})
+        finally:
+            self._status['finished_at'] = datetime.now().isoformat()
+            db.save_job_status(JOB_NAME, self._status)
+            db.release_lease(JOB_NAME, owner)
+
+
+key_rotation = KeyRotationJob()
@@ -0,0 +1,186 @@
+"""
+Envio assíncrono de emails através da tabela email_outbox
+
+As rotas HTTP apenas gravam a mensagem na outbox e retornam. Uma thread por
+processo drena a outbox em lotes, reaproveitando uma única conexão SMTP
+autenticada entre mensagens e reagendando falhas com backoff exponencial.
+"""
+import logging
+import os
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from config import Config
+from database import db
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def build_message(smtp_config, to_email, subject, body):
+    msg = EmailMessage()
+    msg['Subject'] = subject
+    msg['From'] = smtp_config.get('from_email') or smtp_config.get('username')
+    msg['To'] = to_email
+    msg.set_content(body)
+    return msg
+
+
+class SMTPConnection:
+    """Conexão SMTP autenticada reutilizada entre mensagens"""
+
+    def __init__(self):
+        self.server = None
+        self.config_key = None
+        self.last_used = 0.0
+
+    @staticmethod
+    def _key(smtp_config):
+        return tuple(smtp_config.get(k) for k in ('host', 'port', 'username', 'password', 'use_tls', 'use_ssl'))
+
+    def _connect(self, smtp_config):
+        host = smtp_config.get('host')
+        port = int(smtp_config.get('port') or (587 if smtp_config.get('use_tls') else 25))
+        username = smtp_config.get('username')
+        password = smtp_config.get('password')
+        if smtp_config.get('use_ssl'):
+            server = smtplib.SMTP_SSL(host, port, timeout=Config.SMTP_TIMEOUT)
+        else:
+            server = smtplib.SMTP(host, port, timeout=Config.SMTP_TIMEOUT)
+            if smtp_config.get('use_tls'):
+                server.starttls()
+        if username and password:
+            server.login(username, password)
+        self.server = server
+        self.config_key = self._key(smtp_config)
+
+    def _alive(self):
+        try:
+            return self.server.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    @tracer.traced('smtp.send', kind='client', root=True)
+    def send(self, smtp_config, msg):
+        """Enviar reutilizando a conexão; reconecta se a config mudou ou o servidor caiu"""
+        if self.server is not None and self.config_key != self._key(smtp_config):
+            self.close()
+        if self.server is not None and time.monotonic() - self.last_used > Config.SMTP_KEEPALIVE_CHECK and not self._alive():
+            self.close()
+        if self.server is None:
+            self._connect(smtp_config)
+        try:
+            self.server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self._connect(smtp_config)
+            self.server.send_message(msg)
+        self.last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self.server is not None and time.monotonic() - self.last_used > Config.SMTP_IDLE_TIMEOUT:
+            self.close()
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.server = None
+        self.config_key = None
+
+
+class OutboxSender:
+    """Thread que drena a outbox; uma por processo, recriada após fork"""
+
+    def __init__(self):
+        self.owner = uuid.uuid4().hex
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.connection = SMTPConnection()
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self.owner = uuid.uuid4().hex
+            self._wake = threading.Event()
+            self.connection = SMTPConnection()
+            self._thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _backoff(self, attempts):
+        delay = min(Config.SMTP_RETRY_BASE_SECONDS * (2 ** attempts), Config.SMTP_RETRY_MAX_SECONDS)
+        return (datetime.now() + timedelta(seconds=delay)).isoformat()
+
+    def _retry_at(self, row):
+        """Próxima tentativa após uma falha, ou None quando as tentativas acabaram"""
+        attempts = row['attempts'] + 1
+        return self._backoff(attempts) if attempts < Config.SMTP_MAX_ATTEMPTS else None
+
+    def drain_once(self):
+        """Enviar um lote de mensagens vencidas; retorna quantas foram processadas"""
+        batch = db.claim_outbox_batch(self.owner, Config.SMTP_BATCH_SIZE, Config.SMTP_CLAIM_LEASE)
+        if not batch:
+            return 0
+        smtp_config = db.get_smtp_config()
+        for row in batch:
+            if not smtp_config:
+                db.mark_email_failed(row['id'], self.owner, 'SMTP não configurado', self._retry_at(row))
+                continue
+            try:
+                msg = build_message(smtp_config, row['to_email'], row['subject'], row['body'])
+            except (ValueError, TypeError) as e:
+                # Cabeçalho inválido (ex.: quebra de linha no destinatário): não adianta tentar de novo
+                logger.warning('Email %s rejected: %s', row['id'], e)
+                db.mark_email_failed(row['id'], self.owner, f'Mensagem inválida: {e}')
+                continue
+            try:
+                self.connection.send(smtp_config, msg)
+            except Exception as e:
+                # Qualquer falha conta como tentativa (SMTP, rede, UnicodeEncodeError do login
+                # com senha não ASCII...): o resto do lote segue e SMTP_MAX_ATTEMPTS vale
+                self.connection.close()
+                logger.warning('Email %s failed (attempt %s): %s', row['id'], row['attempts'] + 1, e)
+                db.mark_email_failed(row['id'], self.owner, str(e), self._retry_at(row))
+                continue
+            db.mark_email_sent(row['id'], self.owner)
+        return len(batch)
+
+    def _run(self):
+        while True:
+            try:
+                processed = self.drain_once()
+            except Exception as e:
+                logger.error('Email outbox sender error: %s', e)
+                processed = 0
+            if processed:
+                continue
+            self.connection.close_if_idle()
+            self._wake.wait(Config.SMTP_POLL_INTERVAL)
+            self._wake.clear()
+
+
+outbox_sender = OutboxSender()
+
+
+def enqueue_email(to_email, subject, body):
+    """Gravar a mensagem na outbox e acordar o sender deste processo"""
+    message_id = db.enqueue_email(to_email, subject, body)
+    outbox_sender.ensure_started()
+    outbox_sender.wake()
+    return message_id
@@ -0,0 +1,128 @@
+"""
+Pipeline de geradores para exportação/importação em NDJSON
+
+Tudo trabalha com iteradores de bytes: linhas são serializadas, comprimidas
+(gzip) e empacotadas (tar) à medida que são produzidas, sem materializar o
+conteúdo completo em memória.
+"""
+import io
+import json
+import tarfile
+import tempfile
+import time
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+TAR_BLOCK = tarfile.BLOCKSIZE
+
+
+def ndjson_lines(records):
+    """Serializar cada registro como uma linha JSON (bytes)"""
+    for record in records:
+        yield json.dumps(record, default=str, ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+def buffered(chunks, size=CHUNK_SIZE):
+    """Agrupar pedaços pequenos em blocos de ~size bytes"""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def gzip_stream(chunks, level=6):
+    """Comprimir um fluxo de bytes em formato gzip sob demanda"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def tar_stream(members):
+    """
+    Empacotar membros (nome, iterador de bytes) num tar em fluxo.
+    O cabeçalho tar exige o tamanho, então cada membro passa por um arquivo
+    temporário (em memória até 1 MB, depois em disco).
+    """
+    for name, chunks in members:
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as spool:
+            for chunk in chunks:
+                spool.write(chunk)
+            size = spool.tell()
+            spool.seek(0)
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mtime = int(time.time())
+            info.mode = 0o644
+            yield info.tobuf(format=tarfile.PAX_FORMAT)
+            while True:
+                block = spool.read(CHUNK_SIZE)
+                if not block:
+                    break
+                yield block
+            remainder = size % TAR_BLOCK
+            if remainder:
+                yield b'\0' * (TAR_BLOCK - remainder)
+    yield b'\0' * (TAR_BLOCK * 2)
+
+
+class _StreamReader(io.RawIOBase):
+    """Adaptar um stream de entrada com descompressão gzip opcional (detectada)"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.decompressor = None
+        self.first = True
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self.pending:
+            chunk = self.stream.read(CHUNK_SIZE)
+            if not chunk:
+                if self.decompressor is not None:
+                    self.pending = self.decompressor.flush()
+                    self.decompressor = None
+                    continue
+                return 0
+            if self.first:
+                self.first = False
+                if chunk[:2] == b'\x1f\x8b':
+                    self.decompressor = zlib.decompressobj(47)
+            self.pending = self.decompressor.decompress(chunk) if self.decompressor else chunk
+        size = min(len(target), len(self.pending))
+        target[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def open_input(stream):
+    """Stream binário bufferizado, descomprimindo gzip automaticamente"""
+    return io.BufferedReader(_StreamReader(stream), buffer_size=CHUNK_SIZE)
+
+
+def iter_ndjson(stream):
+    """Iterar registros de um fluxo NDJSON (linhas vazias são ignoradas)"""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_tar_ndjson(stream):
+    """Iterar (nome do membro, registro) de um tar em fluxo com membros NDJSON"""
+    with tarfile.open(fileobj=stream, mode='r|') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            handle = archive.extractfile(member)
+            for record in iter_ndjson(handle):
+                yield member.name, record
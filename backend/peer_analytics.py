@@ -0,0 +1,292 @@
+"""
+Análises agregadas dos peers WireGuard de um roteador
+
+A lista de peers é lida uma vez e convertida num snapshot colunar (arrays NumPy
+quando disponível, listas Python caso contrário): bytes recebidos/enviados,
+idade do último handshake em segundos e a interface de cada peer. Os agregados
+(top-N por tráfego, peers sem handshake recente e histogramas de idade por
+interface) são calculados sobre as colunas e memorizados no próprio snapshot,
+que é reaproveitado por ANALYTICS_SNAPSHOT_TTL segundos.
+"""
+import heapq
+import math
+import re
+import secrets
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from functools import lru_cache
+
+from config import Config
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - dependência opcional
+    np = None
+
+# Faixas padrão do histograma de idade do handshake (segundos)
+DEFAULT_HISTOGRAM_BINS = (60, 300, 900, 3600, 6 * 3600, 86400, 7 * 86400)
+
+METRICS = ('rx', 'tx', 'total')
+
+# Campos de identificação devolvidos nas listas de peers
+PEER_FIELDS = ('.id', 'interface', 'public-key', 'comment', 'allowed-address', 'current-endpoint-address')
+
+# Campos lidos do roteador para montar um snapshot
+SNAPSHOT_FIELDS = PEER_FIELDS + ('rx', 'tx', 'last-handshake')
+
+_DURATION_UNITS = {'w': 604800, 'd': 86400, 'h': 3600, 'm': 60, 's': 1, 'ms': 0.001, 'us': 1e-6, 'ns': 1e-9}
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|us|ns|w|d|h|m|s)')
+
+
+@lru_cache(maxsize=65536)
+def parse_duration(value):
+    """
+    Converter uma duração do RouterOS ('1w2d3h4m5s', '3m10s', '00:01:02') em segundos.
+    Retorna NaN para ausente ou inválido (peer que nunca fez handshake).
+    """
+    if value is None:
+        return math.nan
+    value = str(value).strip()
+    if not value or value == 'never':
+        return math.nan
+    if ':' in value:
+        # Formato antigo hh:mm:ss, opcionalmente precedido por dias ('1d02:03:04')
+        days = 0
+        if 'd' in value:
+            prefix, value = value.split('d', 1)
+            days = int(prefix) if prefix.isdigit() else 0
+        try:
+            parts = [float(part) for part in value.split(':')]
+        except ValueError:
+            return math.nan
+        seconds = 0.0
+        for part in parts:
+            seconds = seconds * 60 + part
+        return days * 86400 + seconds
+    total = 0.0
+    position = 0
+    for match in _DURATION_PART.finditer(value):
+        if match.start() != position:
+            return math.nan
+        total += float(match.group(1)) * _DURATION_UNITS[match.group(2)]
+        position = match.end()
+    if position != len(value):
+        return math.nan
+    return total
+
+
+def _counter(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _row(peer, rx, tx, age):
+    row = {field: peer.get(field) for field in PEER_FIELDS if peer.get(field) is not None}
+    row['rx'] = int(rx)
+    row['tx'] = int(tx)
+    row['last_handshake_seconds'] = None if math.isnan(age) else float(age)
+    return row
+
+
+class PeerSnapshot:
+    """Colunas imutáveis de uma leitura dos peers com agregados memorizados"""
+
+    def __init__(self, peers, snapshot_id=None, taken_at=None):
+        self.peers = peers
+        self.id = snapshot_id or secrets.token_hex(8)
+        self.taken_at = taken_at or time.time()
+        self.backend = 'numpy' if np is not None else 'python'
+        self._results = {}
+        self._lock = threading.Lock()
+        self._load(peers)
+
+    def _load(self, peers):
+        if np is not None:
+            count = len(peers)
+            self.rx = np.fromiter((_counter(p.get('rx')) for p in peers), dtype=np.int64, count=count)
+            self.tx = np.fromiter((_counter(p.get('tx')) for p in peers), dtype=np.int64, count=count)
+            # Durações repetem muito: converte só os valores distintos e expande pelo índice inverso
+            raw = np.array([str(p.get('last-handshake') or '') for p in peers], dtype=object)
+            distinct, inverse = np.unique(raw, return_inverse=True) if count else (raw, np.zeros(0, dtype=np.intp))
+            parsed = np.fromiter((parse_duration(v) for v in distinct), dtype=np.float64, count=len(distinct))
+            self.age = parsed[inverse.reshape(-1)]
+            names = np.array([str(p.get('interface') or '') for p in peers], dtype=object)
+            self.interfaces, self.interface_index = np.unique(names, return_inverse=True) if count else (names, np.zeros(0, dtype=np.intp))
+            self.interface_index = self.interface_index.reshape(-1)
+        else:
+            self.rx = [_counter(p.get('rx')) for p in peers]
+            self.tx = [_counter(p.get('tx')) for p in peers]
+            self.age = [parse_duration(p.get('last-handshake') or '') for p in peers]
+            self.interfaces = sorted({str(p.get('interface') or '') for p in peers})
+            position = {name: index for index, name in enumerate(self.interfaces)}
+            self.interface_index = [position[str(p.get('interface') or '')] for p in peers]
+
+    def _memo(self, key, compute):
+        with self._lock:
+            if key in self._results:
+                return self._results[key]
+        value = compute()
+        with self._lock:
+            self._results[key] = value
+        return value
+
+    def _metric(self, metric):
+        if metric == 'rx':
+            return self.rx
+        if metric == 'tx':
+            return self.tx
+        if np is not None:
+            return self.rx + self.tx
+        return [rx + tx for rx, tx in zip(self.rx, self.tx)]
+
+    def top(self, metric='total', n=10):
+        """Os n peers com maior tráfego pela métrica (rx, tx ou total)"""
+        return self._memo(('top', metric, n), lambda: self._top(metric, n))
+
+    def _top(self, metric, n):
+        values = self._metric(metric)
+        n = max(0, min(n, len(self.peers)))
+        if np is not None:
+            if n == 0:
+                indexes = []
+            else:
+                candidates = np.argpartition(-values, n - 1)[:n] if n < len(values) else np.arange(len(values))
+                indexes = candidates[np.argsort(-values[candidates], kind='stable')].tolist()
+        else:
+            indexes = heapq.nlargest(n, range(len(values)), key=values.__getitem__)
+        return [self._peer_row(i) for i in indexes]
+
+    def stale(self, threshold=86400, limit=1000):
+        """Peers sem handshake há mais de threshold segundos (ou que nunca fizeram)"""
+        return self._memo(('stale', threshold, limit), lambda: self._stale(threshold, limit))
+
+    def _stale(self, threshold, limit):
+        if np is not None:
+            never = np.isnan(self.age)
+            mask = never | (np.nan_to_num(self.age, nan=0.0) > threshold)
+            indexes = np.flatnonzero(mask)
+            count, never_count = int(indexes.size), int(never.sum())
+            indexes = indexes[:limit].tolist()
+        else:
+            indexes = [i for i, age in enumerate(self.age) if math.isnan(age) or age > threshold]
+            count = len(indexes)
+            never_count = sum(1 for age in self.age if math.isnan(age))
+            indexes = indexes[:limit]
+        return {
+            'threshold_seconds': threshold,
+            'count': count,
+            'never': never_count,
+            'truncated': count > len(indexes),
+            'peers': [self._peer_row(i) for i in indexes],
+        }
+
+    def histogram(self, bins=DEFAULT_HISTOGRAM_BINS):
+        """Contagem de peers por faixa de idade do handshake, por interface"""
+        bins = tuple(sorted(bins))
+        return self._memo(('histogram', bins), lambda: self._histogram(bins))
+
+    def _histogram(self, bins):
+        buckets = len(bins) + 2  # faixas + acima do último limite + nunca
+        if np is not None:
+            never = np.isnan(self.age)
+            bucket = np.searchsorted(np.asarray(bins, dtype=np.float64), np.nan_to_num(self.age, nan=0.0), side='right')
+            bucket[never] = buckets - 1
+            flat = np.bincount(self.interface_index * buckets + bucket, minlength=len(self.interfaces) * buckets)
+            counts = flat.reshape(len(self.interfaces), buckets).tolist()
+        else:
+            counts = [[0] * buckets for _ in self.interfaces]
+            for interface, age in zip(self.interface_index, self.age):
+                counts[interface][buckets - 1 if math.isnan(age) else bisect_right(bins, age)] += 1
+        labels = []
+        lower = 0
+        for upper in bins:
+            labels.append({'from': lower, 'to': upper})
+            lower = upper
+        labels.append({'from': lower, 'to': None})
+        labels.append({'never': True})
+        return {
+            'bins': labels,
+            'interfaces': {str(name): row for name, row in zip(self.interfaces, counts)},
+        }
+
+    def summary(self):
+        return self._memo(('summary',), self._summary)
+
+    def _summary(self):
+        if np is not None:
+            total_rx, total_tx = int(self.rx.sum()), int(self.tx.sum())
+            never = int(np.isnan(self.age).sum())
+        else:
+            total_rx, total_tx = sum(self.rx), sum(self.tx)
+            never = sum(1 for age in self.age if math.isnan(age))
+        return {
+            'peers': len(self.peers),
+            'interfaces': len(self.interfaces),
+            'rx': total_rx,
+            'tx': total_tx,
+            'never_handshake': never,
+        }
+
+    def _peer_row(self, index):
+        return _row(self.peers[index], self.rx[index], self.tx[index], self.age[index])
+
+    def describe(self):
+        return {
+            'id': self.id,
+            'taken_at': self.taken_at,
+            'age_seconds': round(time.time() - self.taken_at, 3),
+            'backend': self.backend,
+        }
+
+
+class SnapshotCache:
+    """LRU de snapshots por roteador, válidos por ttl segundos"""
+
+    def __init__(self, max_entries=None, ttl=None):
+        self.max_entries = max_entries or Config.ANALYTICS_SNAPSHOT_CACHE_SIZE
+        self.ttl = Config.ANALYTICS_SNAPSHOT_TTL if ttl is None else ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            snapshot = self._entries.get(key)
+            if snapshot is None or time.time() - snapshot.taken_at > self.ttl:
+                return None
+            self._entries.move_to_end(key)
+            return snapshot
+
+    def store(self, key, snapshot):
+        with self._lock:
+            self._entries[key] = snapshot
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def load_snapshot(cache, key, fetch, refresh=False):
+    """
+    Obter o snapshot do cache ou ler os peers com `fetch()` (resultado de make_request).
+    Retorna (snapshot, None) ou (None, resultado com falha).
+    """
+    if not refresh:
+        snapshot = cache.get(key)
+        if snapshot is not None:
+            return snapshot, None
+    result = fetch()
+    if not result.get('success') or result.get('status', 0) >= 400:
+        return None, result
+    peers = result.get('data') or []
+    if not isinstance(peers, list):
+        return None, {'success': False, 'status': 502, 'error': 'Resposta inesperada do roteador', 'code': 'INVALID_RESPONSE'}
+    snapshot = PeerSnapshot(peers)
+    cache.store(key, snapshot)
+    return snapshot, None
+
+
+# Snapshots compartilhados pelos blueprints (por processo)
+snapshots = SnapshotCache()
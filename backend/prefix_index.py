@@ -0,0 +1,292 @@
+"""
+Índice de prefixos: tabela de rotas + allowed-address dos peers WireGuard
+
+Uma trie binária (radix 2) por família de endereço guarda cada prefixo com as
+entradas que o declararam (rota ou peer). Ela responde longest-prefix-match e,
+para um prefixo candidato, quais prefixos o contêm (caminho até o nó) e quais
+ele contém (subárvore) em O(comprimento do prefixo) — rápido o bastante para
+validar cada criação/edição de peer. O relatório completo de sobreposições
+ordena os prefixos uma vez e varre com uma pilha de prefixos abertos
+(O(n log n)).
+"""
+import ipaddress
+import time
+
+from config import Config
+from peer_analytics import SnapshotCache
+
+# Máximo de conflitos listados por resposta
+MAX_CONFLICTS = 200
+
+# Rotas padrão contêm qualquer prefixo e não contam como sobreposição
+DEFAULT_ROUTES = ('0.0.0.0/0', '::/0')
+
+# Campos lidos do roteador
+ROUTE_FIELDS = ('.id', 'dst-address', 'gateway', 'immediate-gw', 'distance', 'routing-table', 'disabled', 'comment')
+PEER_FIELDS = ('.id', 'interface', 'public-key', 'allowed-address', 'comment', 'disabled')
+
+
+def parse_prefixes(value):
+    """'10.0.0.2/32,fd00::/64' -> lista de ip_network (inválidos são ignorados)"""
+    networks = []
+    for part in str(value or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(part, strict=False))
+        except ValueError:
+            continue
+    return networks
+
+
+def route_entries(routes):
+    """Entradas das rotas ativas da tabela main"""
+    entries = []
+    for route in routes:
+        if str(route.get('disabled', 'false')).lower() == 'true':
+            continue
+        if (route.get('routing-table') or 'main') != 'main':
+            continue
+        for network in parse_prefixes(route.get('dst-address')):
+            entries.append((network, {
+                'source': 'route',
+                'id': route.get('.id'),
+                'prefix': str(network),
+                'gateway': route.get('gateway'),
+                'interface': (route.get('immediate-gw') or '').partition('%')[2] or route.get('gateway'),
+                'comment': route.get('comment'),
+            }))
+    return entries
+
+
+def peer_entries(peers):
+    """Uma entrada por allowed-address de cada peer habilitado"""
+    entries = []
+    for peer in peers:
+        if str(peer.get('disabled', 'false')).lower() == 'true':
+            continue
+        for network in parse_prefixes(peer.get('allowed-address')):
+            entries.append((network, peer_entry(peer, network)))
+    return entries
+
+
+def peer_entry(peer, network):
+    return {
+        'source': 'peer',
+        'id': peer.get('.id'),
+        'public-key': peer.get('public-key'),
+        'prefix': str(network),
+        'interface': peer.get('interface'),
+        'comment': peer.get('comment'),
+    }
+
+
+class PrefixTrie:
+    """Trie binária de prefixos; cada nó é [filho 0, filho 1, entradas]"""
+
+    def __init__(self):
+        self.roots = {4: [None, None, None], 6: [None, None, None]}
+        self.size = 0
+
+    @staticmethod
+    def _bits(network):
+        value = int(network.network_address)
+        width = network.max_prefixlen
+        for depth in range(network.prefixlen):
+            yield (value >> (width - 1 - depth)) & 1
+
+    def insert(self, network, entry):
+        node = self.roots[network.version]
+        for bit in self._bits(network):
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None:
+            node[2] = []
+        node[2].append(entry)
+        self.size += 1
+
+    def longest_match(self, address):
+        """Entradas do prefixo mais específico que contém o endereço"""
+        address = ipaddress.ip_address(address)
+        node = self.roots[address.version]
+        value, width = int(address), address.max_prefixlen
+        best = node[2]
+        for depth in range(width):
+            node = node[(value >> (width - 1 - depth)) & 1]
+            if node is None:
+                break
+            if node[2]:
+                best = node[2]
+        return best or []
+
+    def containing(self, network):
+        """Entradas de prefixos que contêm (ou são iguais a) network, do menos ao mais específico"""
+        node = self.roots[network.version]
+        found = list(node[2] or [])
+        for bit in self._bits(network):
+            node = node[bit]
+            if node is None:
+                return found
+            if node[2]:
+                found.extend(node[2])
+        return found
+
+    def contained(self, network, limit=MAX_CONFLICTS):
+        """Entradas de prefixos estritamente mais específicos dentro de network"""
+        node = self.roots[network.version]
+        for bit in self._bits(network):
+            node = node[bit]
+            if node is None:
+                return []
+        found = []
+        stack = [child for child in node[:2] if child is not None]
+        while stack and len(found) < limit:
+            current = stack.pop()
+            if current[2]:
+                found.extend(current[2])
+            stack.extend(child for child in current[:2] if child is not None)
+        return found[:limit]
+
+
+def classify(first, second):
+    """
+    Tipo de conflito entre duas entradas (first contém ou é igual a second),
+    ou None quando a sobreposição é esperada
+    """
+    same = first['prefix'] == second['prefix']
+    sources = {first['source'], second['source']}
+    if sources == {'peer'}:
+        if first['id'] is not None and first['id'] == second['id']:
+            return None
+        return 'duplicate' if same else 'overlap'
+    if sources == {'route'}:
+        # Rotas aninhadas são o uso normal do longest-prefix-match
+        return None
+    peer, route = (first, second) if first['source'] == 'peer' else (second, first)
+    if route['prefix'] in DEFAULT_ROUTES:
+        # A rota padrão contém tudo por definição
+        return None
+    if route['interface'] and route['interface'] == peer['interface']:
+        # Rota apontando para a própria interface WireGuard do peer
+        return None
+    if same:
+        return 'duplicate'
+    # O prefixo mais específico "rouba" parte do tráfego do outro
+    return 'route-shadows-peer' if second['source'] == 'route' else 'peer-shadows-route'
+
+
+def _conflict(kind, outer, inner):
+    return {'kind': kind, 'outer': outer, 'inner': inner}
+
+
+class PrefixIndex:
+    """Snapshot indexado das rotas e allowed-address de um roteador"""
+
+    def __init__(self, routes, peers, taken_at=None):
+        self.taken_at = taken_at or time.time()
+        self.entries = route_entries(routes) + peer_entries(peers)
+        # Linhas atuais dos peers (campos PEER_FIELDS), para completar edições parciais
+        self.peers = {peer['.id']: peer for peer in peers if peer.get('.id')}
+        self.trie = PrefixTrie()
+        for network, entry in self.entries:
+            self.trie.insert(network, entry)
+
+    def lookup(self, address):
+        return self.trie.longest_match(address)
+
+    def check(self, peer, exclude_id=None, exclude_key=None, limit=MAX_CONFLICTS):
+        """
+        Conflitos dos allowed-address de um peer candidato com o índice.
+        exclude_id/exclude_key ignoram o próprio peer numa edição.
+        """
+        conflicts = []
+        for network in parse_prefixes(peer.get('allowed-address')):
+            candidate = peer_entry(peer, network)
+            related = (
+                [(entry, candidate) for entry in self.trie.containing(network)]
+                + [(candidate, entry) for entry in self.trie.contained(network, limit)]
+            )
+            for outer, inner in related:
+                other = inner if outer is candidate else outer
+                if other['source'] == 'peer' and (
+                    (exclude_id and other['id'] == exclude_id)
+                    or (exclude_key and other['public-key'] == exclude_key)
+                ):
+                    continue
+                kind = classify(outer, inner)
+                if kind:
+                    conflicts.append(_conflict(kind, outer, inner))
+                    if len(conflicts) >= limit:
+                        return conflicts
+        return conflicts
+
+    def overlaps(self, limit=MAX_CONFLICTS):
+        """
+        Todas as sobreposições do conjunto: ordena por (família, início, tamanho do
+        prefixo) e varre mantendo a pilha de prefixos que ainda contêm o atual.
+        Cada item da pilha é um prefixo distinto com a lista das suas entradas.
+        """
+        ordered = sorted(
+            self.entries,
+            key=lambda item: (item[0].version, int(item[0].network_address), item[0].prefixlen)
+        )
+        conflicts = []
+        total = 0
+        stack = []
+        family = None
+        for network, entry in ordered:
+            if network.version != family:
+                stack, family = [], network.version
+            start = int(network.network_address)
+            while stack and int(stack[-1][0].broadcast_address) < start:
+                stack.pop()
+            # Os prefixos da pilha são distintos e aninhados: no máximo um por
+            # comprimento de prefixo (33 no IPv4, 129 no IPv6); prefixos repetidos
+            # são agrupados na mesma posição
+            for outer_network, outers in stack:
+                for outer in outers:
+                    kind = classify(outer, entry)
+                    if kind:
+                        total += 1
+                        if len(conflicts) < limit:
+                            conflicts.append(_conflict(kind, outer, entry))
+            if stack and stack[-1][0] == network:
+                stack[-1][1].append(entry)
+            else:
+                stack.append((network, [entry]))
+        return {'total': total, 'truncated': total > len(conflicts), 'conflicts': conflicts}
+
+    def describe(self):
+        return {
+            'taken_at': self.taken_at,
+            'age_seconds': round(time.time() - self.taken_at, 3),
+            'prefixes': self.trie.size,
+            'routes': sum(1 for _, entry in self.entries if entry['source'] == 'route'),
+            'peer_prefixes': sum(1 for _, entry in self.entries if entry['source'] == 'peer'),
+        }
+
+
+def load_index(cache, key, fetch_routes, fetch_peers, refresh=False):
+    """
+    Obter o índice do cache ou montar a partir das leituras de rotas e peers
+    (resultados no formato de make_request). Retorna (índice, None) ou (None, falha).
+    """
+    if not refresh:
+        index = cache.get(key)
+        if index is not None:
+            return index, None
+    data = []
+    for fetch in (fetch_routes, fetch_peers):
+        result = fetch()
+        if not result.get('success') or result.get('status', 0) >= 400:
+            return None, result
+        data.append(result.get('data') or [])
+    index = PrefixIndex(*data)
+    cache.store(key, index)
+    return index, None
+
+
+# Índices compartilhados pelos blueprints (por processo)
+indexes = SnapshotCache(max_entries=Config.PREFIX_INDEX_CACHE_SIZE, ttl=Config.PREFIX_INDEX_TTL)
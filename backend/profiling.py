@@ -0,0 +1,301 @@
+"""
+Perfilamento sob demanda de requisições individuais
+
+Um administrador liga o perfilamento de uma requisição com o header
+`X-Profile: sampler|cprofile` (ou `?__profile=sampler`) junto do token
+PROFILING_TOKEN em `X-Profile-Token`; PROFILE_SAMPLE_RATE perfila também uma
+fração aleatória de todas as requisições. Sem PROFILING_TOKEN o recurso fica
+desligado.
+
+- sampler: uma thread amostra a pilha da thread da requisição a cada
+  PROFILE_SAMPLE_INTERVAL segundos (baixo custo; exporta collapsed e speedscope)
+- cprofile: cProfile determinístico (exporta pstats e texto)
+
+Os perfis ficam num buffer circular em disco (PROFILE_DIR), limitado a
+PROFILE_MAX_ENTRIES perfis; os mais antigos são apagados.
+"""
+import cProfile
+import hmac
+import io
+import json
+import logging
+import marshal
+import os
+import pstats
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+MODES = ('sampler', 'cprofile')
+
+
+def authorized(token):
+    """Token de administrador do perfilamento (comparação em tempo constante)"""
+    expected = Config.PROFILING_TOKEN
+    return bool(expected) and bool(token) and hmac.compare_digest(str(token), expected)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """Amostrador estatístico da pilha de uma thread"""
+
+    def __init__(self, thread_id, interval, max_samples):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_samples = max_samples
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval) and self.samples < self.max_samples:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            # Raiz primeiro, como no formato collapsed
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+
+def collapsed(stacks):
+    """Formato collapsed (flamegraph.pl / speedscope): 'a;b;c contagem' por linha"""
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+
+
+def speedscope(meta, stacks):
+    """Documento speedscope (perfil 'sampled') a partir das pilhas agregadas"""
+    frames = []
+    index = {}
+    samples = []
+    weights = []
+    for stack, count in stacks.items():
+        sample = []
+        for name in stack.split(';'):
+            if name not in index:
+                index[name] = len(frames)
+                frames.append({'name': name})
+            sample.append(index[name])
+        samples.append(sample)
+        weights.append(count * meta['interval_ms'])
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': f"{meta['method']} {meta['path']}",
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        }],
+        'name': f"{meta['method']} {meta['path']} ({meta['id']})",
+        'exporter': 'wiredash',
+    }
+
+
+class ProfileStore:
+    """Buffer circular de perfis em disco: <id>.json (metadados) + dados"""
+
+    def __init__(self, directory=None, max_entries=None):
+        self.directory = directory or Config.PROFILE_DIR
+        self.max_entries = max_entries or Config.PROFILE_MAX_ENTRIES
+        self._lock = threading.Lock()
+
+    def _path(self, profile_id, extension):
+        if not profile_id.replace('-', '').isalnum():
+            raise ValueError('Identificador de perfil inválido')
+        return os.path.join(self.directory, f'{profile_id}.{extension}')
+
+    def save(self, meta, data, extension):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(meta['id'], extension), 'wb') as handle:
+            handle.write(data)
+        # Metadados por último: um perfil listado sempre tem os dados completos
+        temporary = self._path(meta['id'], 'json.tmp')
+        with open(temporary, 'w', encoding='utf-8') as handle:
+            json.dump(meta, handle)
+        os.replace(temporary, self._path(meta['id'], 'json'))
+        self._prune()
+
+    def _prune(self):
+        with self._lock:
+            entries = self.list()
+            for meta in entries[self.max_entries:]:
+                self.delete(meta['id'])
+
+    def list(self):
+        """Metadados dos perfis, do mais recente ao mais antigo"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as handle:
+                    entries.append(json.load(handle))
+            except (OSError, ValueError):
+                continue
+        entries.sort(key=lambda meta: meta['started_at'], reverse=True)
+        return entries
+
+    def get(self, profile_id):
+        """(metadados, bytes dos dados) ou (None, None)"""
+        try:
+            with open(self._path(profile_id, 'json'), encoding='utf-8') as handle:
+                meta = json.load(handle)
+            with open(self._path(profile_id, meta['data_format']), 'rb') as handle:
+                return meta, handle.read()
+        except (OSError, ValueError, KeyError):
+            return None, None
+
+    def delete(self, profile_id):
+        for extension in ('json', 'stacks', 'pstats'):
+            try:
+                os.remove(self._path(profile_id, extension))
+            except FileNotFoundError:
+                pass
+
+
+class RequestProfiler:
+    """Hooks do Flask que perfilam as requisições selecionadas"""
+
+    def __init__(self, store=None):
+        self.store = store or ProfileStore()
+
+    def init_app(self, app):
+        app.before_request(self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+
+    def _requested_mode(self):
+        mode = request.headers.get('X-Profile') or request.args.get('__profile')
+        if mode:
+            if not authorized(request.headers.get('X-Profile-Token')):
+                return None
+            mode = mode.lower()
+            return mode if mode in MODES else 'sampler'
+        if Config.PROFILING_TOKEN and Config.PROFILE_SAMPLE_RATE > 0 and random.random() < Config.PROFILE_SAMPLE_RATE:
+            return 'sampler'
+        return None
+
+    def _before(self):
+        mode = self._requested_mode()
+        if mode is None:
+            return
+        profiler = None
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Outro cProfile já ativo no processo (um por vez): usa o amostrador
+                profiler, mode = None, 'sampler'
+        if profiler is None:
+            profiler = StackSampler(threading.get_ident(), Config.PROFILE_SAMPLE_INTERVAL, Config.PROFILE_MAX_SAMPLES)
+            profiler.start()
+        g.profile = {'mode': mode, 'profiler': profiler, 'started': time.time(), 'clock': time.perf_counter()}
+
+    def _teardown(self, error=None):
+        # Exceção não tratada: after_request não rodou, só para o perfilador
+        profile = g.pop('profile', None)
+        if profile is not None:
+            if profile['mode'] == 'cprofile':
+                profile['profiler'].disable()
+            else:
+                profile['profiler'].stop()
+
+    def _after(self, response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        duration_ms = round((time.perf_counter() - profile['clock']) * 1000, 2)
+        profiler = profile['profiler']
+        if profile['mode'] == 'cprofile':
+            profiler.disable()
+        else:
+            profiler.stop()
+        meta = {
+            'id': f"{time.strftime('%Y%m%d%H%M%S', time.gmtime(profile['started']))}-{secrets.token_hex(4)}",
+            'mode': profile['mode'],
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'started_at': profile['started'],
+            'duration_ms': duration_ms,
+        }
+        try:
+            if profile['mode'] == 'cprofile':
+                meta['data_format'] = 'pstats'
+                # Mesmo formato de Stats.dump_stats: abre com pstats/snakeviz
+                data = marshal.dumps(pstats.Stats(profiler).stats)
+            else:
+                meta['data_format'] = 'stacks'
+                meta['samples'] = profiler.samples
+                meta['interval_ms'] = Config.PROFILE_SAMPLE_INTERVAL * 1000
+                data = json.dumps(dict(profiler.stacks)).encode('utf-8')
+            self.store.save(meta, data, meta['data_format'])
+            response.headers['X-Profile-Id'] = meta['id']
+        except Exception as e:
+            logger.error('Falha ao gravar perfil: %s', e, extra={'route': 'profiling'})
+        return response
+
+
+def export(meta, data, fmt):
+    """Converter um perfil gravado; retorna (bytes, mimetype, extensão) ou None"""
+    if meta['data_format'] == 'stacks':
+        stacks = Counter(json.loads(data))
+        if fmt in (None, 'speedscope'):
+            return json.dumps(speedscope(meta, stacks)).encode('utf-8'), 'application/json', 'speedscope.json'
+        if fmt == 'collapsed':
+            return collapsed(stacks).encode('utf-8'), 'text/plain', 'collapsed.txt'
+        return None
+    if fmt in (None, 'pstats'):
+        return data, 'application/octet-stream', 'pstats'
+    if fmt == 'text':
+        stats = pstats.Stats(_StatsSource(marshal.loads(data)), stream=io.StringIO())
+        stats.sort_stats('cumulative').print_stats(50)
+        return stats.stream.getvalue().encode('utf-8'), 'text/plain', 'txt'
+    return None
+
+
+class _StatsSource:
+    """Adaptador para pstats.Stats carregar estatísticas já deserializadas"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+# Perfilador global registrado no app
+request_profiler = RequestProfiler()
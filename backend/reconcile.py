@@ -0,0 +1,267 @@
+"""
+Reconciliação declarativa do estado WireGuard de um roteador
+
+Recebe o conjunto desejado de interfaces e peers, lê o estado atual uma única
+vez e calcula o diff mínimo: interfaces são identificadas por `.id` ou `name`
+e peers por `.id` ou `public-key`. Apenas campos informados no estado desejado
+são comparados, e só as operações necessárias são aplicadas, com concorrência
+limitada.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from tracing import tracer
+
+# Campos somente leitura/estatísticas que nunca entram na comparação
+READ_ONLY_FIELDS = {
+    '.id', 'running', 'rx', 'tx', 'last-handshake', 'current-endpoint-address',
+    'current-endpoint-port', 'dynamic', 'responder',
+}
+
+# Somente leitura apenas em interfaces: a public-key é derivada da private-key
+# (nos peers ela é o campo chave e precisa ser enviada)
+INTERFACE_READ_ONLY_FIELDS = {'public-key'}
+
+# Campos cujo valor é uma lista separada por vírgulas sem ordem significativa
+LIST_FIELDS = {'allowed-address'}
+
+# Ordem de aplicação: peers dependem das interfaces existirem
+PHASES = (
+    ('interface', ('create', 'update')),
+    ('peer', ('delete',)),
+    ('peer', ('create', 'update')),
+    ('interface', ('delete',)),
+)
+
+
+def normalize_value(field, value):
+    """Normalizar valores para o formato textual do RouterOS"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    value = str(value).strip()
+    if field in LIST_FIELDS:
+        return ','.join(sorted(part.strip() for part in value.split(',') if part.strip()))
+    return value
+
+
+def read_only_fields(kind):
+    """Campos que não são comparados nem enviados para o tipo de item"""
+    return READ_ONLY_FIELDS | INTERFACE_READ_ONLY_FIELDS if kind == 'interface' else READ_ONLY_FIELDS
+
+
+def _item_key(kind, item):
+    if item.get('.id'):
+        return ('.id', item['.id'])
+    field = 'name' if kind == 'interface' else 'public-key'
+    return (field, item.get(field))
+
+
+def diff_collection(kind, path, desired, current, prune=False):
+    """Calcular as operações para uma coleção (interfaces ou peers)"""
+    key_field = 'name' if kind == 'interface' else 'public-key'
+    by_id = {item.get('.id'): item for item in current if item.get('.id')}
+    by_key = {item.get(key_field): item for item in current if item.get(key_field)}
+    ignored = read_only_fields(kind)
+
+    operations = []
+    matched = set()
+    for item in desired:
+        key = _item_key(kind, item)
+        if key[1] is None:
+            operations.append({'kind': kind, 'action': 'invalid', 'key': None,
+                               'error': f'Item sem .id nem {key_field}'})
+            continue
+        existing = by_id.get(key[1]) if key[0] == '.id' else by_key.get(key[1])
+        fields = {k: v for k, v in item.items() if k not in ignored}
+        if existing is None:
+            if key[0] == '.id':
+                operations.append({'kind': kind, 'action': 'invalid', 'key': key[1],
+                                   'error': f'.id {key[1]} não existe no roteador'})
+                continue
+            operations.append({'kind': kind, 'action': 'create', 'key': key[1],
+                               'method': 'PUT', 'path': path, 'body': fields})
+            continue
+        matched.add(existing['.id'])
+        changes = {
+            k: v for k, v in fields.items()
+            if normalize_value(k, existing.get(k)) != normalize_value(k, v)
+        }
+        if changes:
+            operations.append({'kind': kind, 'action': 'update', 'key': key[1],
+                               'method': 'PATCH', 'path': f"{path}/{existing['.id']}", 'body': changes,
+                               'previous': {k: existing.get(k, '') for k in changes}})
+
+    if prune:
+        for item in current:
+            if item.get('.id') not in matched:
+                operations.append({'kind': kind, 'action': 'delete', 'key': item.get(key_field) or item.get('.id'),
+                                   'method': 'DELETE', 'path': f"{path}/{item['.id']}",
+                                   'previous': {k: v for k, v in item.items() if k not in ignored}})
+    return operations
+
+
+def plan(router, desired, prune=False, call=None):
+    """
+    Montar o plano de reconciliação.
+    `call(leitura)` permite interpor um agendador nas leituras do estado atual.
+    Retorna (operações, erro); erro é o resultado do roteador quando a leitura falha.
+    """
+    call = call or (lambda run: run())
+    operations = []
+    collections = (
+        ('interface', router.WIREGUARD_INTERFACES_PATH, router.get_wireguard_interfaces, desired.get('interfaces')),
+        ('peer', router.WIREGUARD_PEERS_PATH, router.get_wireguard_peers, desired.get('peers')),
+    )
+    for kind, path, fetch, wanted in collections:
+        if wanted is None:
+            # Coleção ausente no estado desejado: não é gerenciada nesta chamada
+            continue
+        result = call(fetch)
+        if not result.get('success') or result.get('status', 0) >= 400:
+            return None, result
+        current = result.get('data') or []
+        operations.extend(diff_collection(kind, path, wanted, current, prune=prune))
+    return operations, None
+
+
+def _execute(operation, request):
+    result = request(operation['path'], operation['method'], operation.get('body'))
+    ok = result.get('success') and result.get('status', 0) < 400
+    operation['result'] = {
+        'success': bool(ok),
+        'status': result.get('status'),
+        'code': result.get('code'),
+        'error': None if ok else (result.get('error') or result.get('data')),
+    }
+    return ok
+
+
+def _workers(concurrency):
+    return max(1, min(concurrency or Config.RECONCILE_CONCURRENCY, Config.RECONCILE_MAX_CONCURRENCY))
+
+
+def apply(router, operations, concurrency=None, request=None):
+    """
+    Aplicar o plano fase a fase com concorrência limitada.
+    `request(path, method, body)` permite interpor um agendador; padrão é router.make_request.
+    """
+    request = request or (lambda path, method, body: router.make_request(path, method, body))
+    workers = _workers(concurrency)
+
+    def run(operation):
+        return _execute(operation, request)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for kind, actions in PHASES:
+            batch = [op for op in operations if op['kind'] == kind and op['action'] in actions]
+            if not batch:
+                continue
+            results = list(executor.map(tracer.wrap(run), batch))
+            if not all(results) and kind == 'interface':
+                # Sem as interfaces desejadas as fases seguintes falhariam em cascata
+                for op in operations:
+                    if 'result' not in op and op['action'] != 'invalid':
+                        op['result'] = {'success': False, 'skipped': True}
+                break
+    return operations
+
+
+def ordered(operations):
+    """Operações executáveis na ordem das fases"""
+    return [
+        op for kind, actions in PHASES
+        for op in operations if op['kind'] == kind and op['action'] in actions
+    ]
+
+
+def apply_batch(router, operations, atomic=True, call=None):
+    """
+    Aplicar o plano num único script (router.batch_write), na ordem das fases.
+    `call(operação)` permite interpor um agendador para a chamada única.
+    """
+    batch = ordered(operations)
+    if not batch:
+        return operations
+    run = lambda: router.batch_write(batch, atomic=atomic)
+    result = call(run) if call else run()
+    for op in batch:
+        if 'result' not in op:
+            # A chamada nem chegou ao roteador (ex.: fila cheia)
+            op['result'] = {'success': False, 'status': result.get('status'),
+                            'code': result.get('code'), 'error': result.get('error')}
+    return operations
+
+
+def public(operations):
+    """Operações sem os valores anteriores (podem conter chaves privadas)"""
+    return [{k: v for k, v in op.items() if k != 'previous'} for op in operations]
+
+
+def apply_stream(router, records, concurrency=None, request=None, call=None):
+    """
+    Restaurar um fluxo de registros {'kind': 'interface'|'peer', 'data': {...}}.
+
+    O estado atual é lido uma vez; cada registro vira no máximo uma operação
+    (chaveada por name/public-key, ignorando o .id de origem) aplicada com um
+    número limitado de operações em voo. Interfaces devem vir antes dos peers.
+    Retorna o resumo sem acumular as operações.
+    `call(leitura)` permite interpor um agendador nas leituras do estado atual.
+    """
+    request = request or (lambda path, method, body: router.make_request(path, method, body))
+    call = call or (lambda run: run())
+    current = {}
+    for kind, fetch in (('interface', router.get_wireguard_interfaces), ('peer', router.get_wireguard_peers)):
+        result = call(fetch)
+        if not result.get('success') or result.get('status', 0) >= 400:
+            return None, result
+        current[kind] = result.get('data') or []
+    paths = {'interface': router.WIREGUARD_INTERFACES_PATH, 'peer': router.WIREGUARD_PEERS_PATH}
+
+    summary = {'create': 0, 'update': 0, 'delete': 0, 'invalid': 0, 'failed': 0, 'unchanged': 0, 'errors': []}
+    window = _workers(concurrency)
+    in_flight = []
+
+    def settle(future_op):
+        future, op = future_op
+        if not future.result():
+            summary['failed'] += 1
+            if len(summary['errors']) < 100:
+                summary['errors'].append({'kind': op['kind'], 'key': op['key'], **op['result']})
+
+    with ThreadPoolExecutor(max_workers=window) as executor:
+        phase = 'interface'
+        for record in records:
+            kind = record.get('kind')
+            if kind not in paths:
+                continue
+            if kind == 'peer' and phase == 'interface':
+                # Barreira: peers só depois de todas as interfaces aplicadas
+                for item in in_flight:
+                    settle(item)
+                in_flight = []
+                phase = 'peer'
+            item = {k: v for k, v in (record.get('data') or {}).items() if k != '.id'}
+            operations = diff_collection(kind, paths[kind], [item], current[kind])
+            if not operations:
+                summary['unchanged'] += 1
+            for op in operations:
+                summary[op['action']] += 1
+                if op['action'] == 'invalid':
+                    continue
+                if len(in_flight) >= window:
+                    settle(in_flight.pop(0))
+                in_flight.append((executor.submit(tracer.wrap(_execute), op, request), op))
+        for item in in_flight:
+            settle(item)
+    return summary, None
+
+
+def summarize(operations):
+    summary = {'create': 0, 'update': 0, 'delete': 0, 'invalid': 0, 'failed': 0}
+    for op in operations:
+        summary[op['action']] += 1
+        if op.get('result') and not op['result'].get('success'):
+            summary['failed'] += 1
+    return summary
@@ -0,0 +1,190 @@
+"""
+Compressão negociada das respostas da API
+
+Um after_request escolhe a codificação pelo Accept-Encoding do cliente (zstd e
+brotli quando os pacotes `zstandard`/`brotli` estão instalados, gzip sempre) e
+comprime respostas JSON/NDJSON/texto acima de COMPRESSION_MIN_SIZE bytes. A
+compressão é incremental: o corpo é entregue ao compressor em pedaços e os
+blocos comprimidos saem conforme ficam prontos, então respostas em fluxo
+(exportação NDJSON) continuam em fluxo e um corpo grande não ganha uma segunda
+cópia inteira comprimida na memória.
+
+O ETag forte de uma resposta comprimida recebe o sufixo da codificação
+("abc-gzip"), como exige a RFC 9110 para representações diferentes;
+etag_cache.etag_matches ignora esse sufixo ao comparar If-None-Match.
+"""
+import zlib
+
+from flask import request
+
+from config import Config
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependência opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependência opcional
+    zstandard = None
+
+# Tamanho dos pedaços entregues ao compressor
+CHUNK_SIZE = 64 * 1024
+
+
+class _GzipEncoder:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def available_encoders():
+    """{codificação: (classe, nível)} disponíveis neste ambiente"""
+    encoders = {'gzip': (_GzipEncoder, Config.COMPRESSION_GZIP_LEVEL)}
+    if brotli is not None:
+        encoders['br'] = (_BrotliEncoder, Config.COMPRESSION_BROTLI_QUALITY)
+    if zstandard is not None:
+        encoders['zstd'] = (_ZstdEncoder, Config.COMPRESSION_ZSTD_LEVEL)
+    return encoders
+
+
+def parse_accept_encoding(header):
+    """'gzip, br;q=0.8' -> {'gzip': 1.0, 'br': 0.8}"""
+    accepted = {}
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def negotiate(header, preference):
+    """
+    Codificação escolhida para o Accept-Encoding, ou None (identity).
+    Maior q vence; empates seguem a ordem de preferência do servidor.
+    """
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get('*', 0.0)
+    best = None
+    best_quality = 0.0
+    for name in preference:
+        quality = accepted.get(name, wildcard)
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def encoded_etag(etag, encoding):
+    """ETag forte da representação codificada ('"abc"' -> '"abc-gzip"')"""
+    if not etag or etag.startswith('W/') or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def _compressed(chunks, encoder):
+    for chunk in chunks:
+        view = memoryview(chunk)
+        for start in range(0, len(view), CHUNK_SIZE):
+            block = encoder.compress(view[start:start + CHUNK_SIZE])
+            if block:
+                yield block
+    tail = encoder.finish()
+    if tail:
+        yield tail
+
+
+class ResponseCompressor:
+    """after_request que comprime as respostas elegíveis"""
+
+    def __init__(self):
+        self.encoders = available_encoders()
+        self.preference = [name for name in Config.COMPRESSION_ALGORITHMS if name in self.encoders]
+
+    def init_app(self, app):
+        if Config.COMPRESSION_ENABLED:
+            app.after_request(self.compress)
+
+    def _eligible(self, response):
+        if request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 206):
+            return False
+        if 'Content-Encoding' in response.headers:
+            return False
+        if 'no-transform' in (response.headers.get('Cache-Control') or ''):
+            return False
+        return response.mimetype in Config.COMPRESSION_MIMETYPES
+
+    def compress(self, response):
+        if response.status_code == 304:
+            # 304 devolve o ETag na forma que o cliente guardou
+            return self._not_modified(response)
+        if not self._eligible(response):
+            return response
+        response.vary.add('Accept-Encoding')
+        if not response.is_streamed and (response.content_length or 0) < Config.COMPRESSION_MIN_SIZE:
+            return response
+        encoding = negotiate(request.headers.get('Accept-Encoding'), self.preference)
+        if encoding is None:
+            return response
+        encoder_class, level = self.encoders[encoding]
+        response.response = _compressed(response.iter_encoded(), encoder_class(level))
+        response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = encoding
+        etag = response.headers.get('ETag')
+        if etag:
+            response.headers['ETag'] = encoded_etag(etag, encoding)
+        return response
+
+    def _not_modified(self, response):
+        etag = response.headers.get('ETag')
+        if not etag:
+            return response
+        response.vary.add('Accept-Encoding')
+        if_none_match = request.headers.get('If-None-Match') or ''
+        for encoding in self.encoders:
+            candidate = encoded_etag(etag, encoding)
+            if candidate != etag and candidate in if_none_match:
+                response.headers['ETag'] = candidate
+                break
+        return response
+
+
+# Compressor global registrado no app
+response_compressor = ResponseCompressor()
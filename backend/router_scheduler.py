@@ -0,0 +1,148 @@
+"""
+Agendador de requisições por roteador
+
+Fica na frente dos drivers e limita, por roteador, o número de requisições
+simultâneas e a taxa (token bucket). Há duas filas de prioridade: 'interactive'
+(navegação na UI) sempre passa à frente de 'bulk' (operações em massa,
+reconciliação, importação). A espera na fila é limitada e informada ao cliente.
+
+Os limites valem por processo: com N workers do gunicorn, o teto efetivo por
+roteador é N vezes o configurado.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from config import Config
+
+LANES = ('interactive', 'bulk')
+
+
+class QueueTimeout(Exception):
+    """A requisição esperou mais que o permitido pela sua fila"""
+
+    def __init__(self, lane, waited_ms):
+        super().__init__(f'Fila {lane} excedeu {waited_ms:.0f}ms')
+        self.lane = lane
+        self.waited_ms = waited_ms
+
+
+class _RouterState:
+    def __init__(self, concurrency, rate, burst):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.active = 0
+        self.waiting = {lane: 0 for lane in LANES}
+        self.cond = threading.Condition()
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, lane, now):
+        """Retorna 0 se adquiriu, ou quanto esperar (segundos, None = até notificação)"""
+        if self.active >= self.concurrency:
+            return None
+        if lane != 'interactive' and self.waiting['interactive']:
+            return None
+        if self.rate <= 0:
+            return 0
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RequestScheduler:
+    """Limites de concorrência e taxa por roteador com filas de prioridade"""
+
+    def __init__(self, concurrency=None, rate=None, burst=None):
+        self.concurrency = concurrency or Config.SCHEDULER_CONCURRENCY
+        self.rate = Config.SCHEDULER_RATE if rate is None else rate
+        self.burst = burst or Config.SCHEDULER_BURST
+        self.max_wait = {
+            'interactive': Config.SCHEDULER_MAX_WAIT_INTERACTIVE,
+            'bulk': Config.SCHEDULER_MAX_WAIT_BULK,
+        }
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def _state(self, router_key):
+        state = self._states.get(router_key)
+        if state is None:
+            with self._lock:
+                state = self._states.setdefault(
+                    router_key, _RouterState(self.concurrency, self.rate, self.burst)
+                )
+        return state
+
+    @contextmanager
+    def slot(self, router_key, lane='interactive'):
+        """Reservar uma vaga para uma requisição ao roteador; levanta QueueTimeout"""
+        lane = lane if lane in LANES else 'interactive'
+        state = self._state(router_key)
+        started = time.monotonic()
+        deadline = started + self.max_wait[lane]
+        with state.cond:
+            state.waiting[lane] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = state.try_acquire(lane, now)
+                    if delay == 0:
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise QueueTimeout(lane, (now - started) * 1000)
+                    state.cond.wait(remaining if delay is None else min(delay, remaining))
+            finally:
+                state.waiting[lane] -= 1
+                if lane == 'interactive' and not state.waiting['interactive']:
+                    # A fila bulk pode ter ficado elegível
+                    state.cond.notify_all()
+            state.active += 1
+        ticket = {'lane': lane, 'queued_ms': round((time.monotonic() - started) * 1000, 2)}
+        try:
+            yield ticket
+        finally:
+            with state.cond:
+                state.active -= 1
+                state.cond.notify_all()
+
+    def call(self, router, operation, lane='interactive'):
+        """Executar operation() (que retorna um resultado de driver) dentro de uma vaga"""
+        try:
+            with self.slot(router.base_url, lane) as ticket:
+                result = operation()
+        except QueueTimeout as e:
+            return {
+                'success': False,
+                'status': 503,
+                'error': 'Roteador ocupado: tempo máximo de espera na fila excedido',
+                'code': 'QUEUE_TIMEOUT',
+                'router_type': router.get_router_type(),
+                'scheduler': {'lane': e.lane, 'queued_ms': round(e.waited_ms, 2)}
+            }
+        result['scheduler'] = ticket
+        return result
+
+    def iter_rows(self, router, rows, lane='bulk'):
+        """
+        Consumir uma leitura em fluxo do driver (ex.: router.iter_rows) ocupando
+        uma vaga do roteador até o fim; levanta QueueTimeout
+        """
+        with self.slot(router.base_url, lane):
+            yield from rows
+
+    def request(self, router, path, method='GET', body=None, lane='interactive'):
+        """make_request com agendamento; o resultado inclui os metadados da fila"""
+        return self.call(router, lambda: router.make_request(path, method, body), lane)
+
+
+# Agendador global compartilhado pelos blueprints
+scheduler = RequestScheduler()
@@ -1,22 +1,67 @@
 
 import requests
 import base64
+import functools
 import json
 import os
+import time
 from datetime import datetime
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
 import logging
 from abc import ABC, abstractmethod
 import urllib3
-
-# Suppress InsecureRequestWarning
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from .json_stream import iter_json_items, JSONStreamError
+from .pagination import PageFetchError
+from tracing import tracer
 
 logger = logging.getLogger(__name__)
 
+# Tamanho dos pedaços lidos do corpo HTTP em stream_rows
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_insecure_warnings_disabled = False
+
+def disable_insecure_warnings():
+    """Suprimir InsecureRequestWarning (uma vez, no primeiro uso de um driver)"""
+    global _insecure_warnings_disabled
+    if not _insecure_warnings_disabled:
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        _insecure_warnings_disabled = True
+
+def traced_request(func):
+    """Span de cliente em volta de make_request (só dentro de um trace)"""
+    @functools.wraps(func)
+    def wrapper(self, path, method='GET', body=None):
+        if tracer.current() is None:
+            return func(self, path, method, body)
+        attributes = {'router.type': self.get_router_type(), 'http.method': method, 'http.path': path}
+        with tracer.span('router.request', 'client', attributes) as span:
+            result = func(self, path, method, body)
+            span.set('http.status', result.get('status'))
+            if not result.get('success'):
+                span.error(result.get('error'))
+            return result
+    return wrapper
+
+def traced_stream(func):
+    """Span de cliente em volta de stream_rows; o span não vira o corrente entre os yields"""
+    @functools.wraps(func)
+    def wrapper(self, path, *args, **kwargs):
+        attributes = {'router.type': self.get_router_type(), 'http.method': 'GET', 'http.path': path}
+        span = tracer.start_span('router.stream', 'client', attributes, activate=False)
+        rows = 0
+        try:
+            for row in func(self, path, *args, **kwargs):
+                rows += 1
+                yield row
+        except PageFetchError as e:
+            span.set('http.status', e.result.get('status'))
+            span.error(e)
+            raise
+        finally:
+            span.set('rows', rows)
+            tracer.end_span(span)
+    return wrapper
+
 class BaseRouter(ABC):
     """Classe base para todos os tipos de roteadores"""
     
@@ -33,7 +78,13 @@ class BaseRouter(ABC):
         port_suffix = f':{port}' if port else ''
         self.base_url = f'{protocol}://{self.endpoint}{port_suffix}'
         
-        logger.info(f'Router initialized with base URL: {self.base_url} (HTTPS: {use_https})')
+        disable_insecure_warnings()
+        
+        # Última resposta HTTP recebida (usada para ETag sobre o corpo bruto)
+        self.last_response = None
+        
+        logger.debug('Router initialized with base URL: %s (HTTPS: %s)', self.base_url, use_https,
+                     extra={'route': 'router.init'})
     
     def get_auth_headers(self):
         """Gerar headers de autenticação básica"""
@@ -43,23 +94,26 @@ class BaseRouter(ABC):
             'Content-Type': 'application/json'
         }
     
+    def verify_ssl(self):
+        """Configure SSL verification based on environment"""
+        verify_ssl_env = os.getenv('VERIFY_SSL')
+        if verify_ssl_env is not None:
+            return verify_ssl_env.lower() == 'true'
+        # Default to secure verification in production, allow self-signed in development
+        return os.getenv('FLASK_ENV') != 'development'
+    
+    @traced_request
     def make_request(self, path, method='GET', body=None):
         """Fazer requisição HTTP genérica"""
         try:
             url = f'{self.base_url}{path}'
             headers = self.get_auth_headers()
             
-            logger.info(f'Fazendo requisição {method} para: {url} (HTTPS: {self.use_https})')
+            logger.debug('Fazendo requisição %s para: %s', method, url, extra={'route': 'router.request'})
             
             start_time = datetime.now()
             
-            # Configure SSL verification based on environment
-            verify_ssl_env = os.getenv('VERIFY_SSL')
-            if verify_ssl_env is not None:
-                verify_ssl = verify_ssl_env.lower() == 'true'
-            else:
-                # Default to secure verification in production, allow self-signed in development
-                verify_ssl = os.getenv('FLASK_ENV') != 'development'
+            verify_ssl = self.verify_ssl()
             
             # Fazer requisição baseada no método
             if method.upper() == 'GET':
@@ -81,8 +135,13 @@ class BaseRouter(ABC):
             
             end_time = datetime.now()
             duration = (end_time - start_time).total_seconds() * 1000
+            self.last_response = response
             
-            logger.info(f'Resposta recebida - Status: {response.status_code}, Tempo: {duration:.2f}ms, URL: {url}')
+            logger.info('Resposta recebida - Status: %s, Tempo: %.2fms, URL: %s',
+                        response.status_code, duration, url,
+                        extra={'route': 'router.request', 'status': response.status_code,
+                               'duration_ms': round(duration, 2), 'method': method.upper(),
+                               'router_type': self.get_router_type()})
             
             # Processar resposta
             try:
@@ -102,8 +161,13 @@ class BaseRouter(ABC):
                 'protocol': 'HTTPS' if self.use_https else 'HTTP'
             }
             
-        except requests.exceptions.Timeout:
-            logger.error('Timeout na requisição')
+        except requests.exceptions.RequestException as e:
+            return self.request_error(e, url)
+    
+    def request_error(self, error, url):
+        """Converter uma exceção do requests no resultado de erro padrão"""
+        if isinstance(error, requests.exceptions.Timeout):
+            logger.error('Timeout na requisição: %s', url, extra={'route': 'router.request', 'code': 'TIMEOUT'})
             return {
                 'success': False,
                 'error': 'Timeout na conexão com o roteador. Verifique o IP e a porta.',
@@ -111,18 +175,17 @@ class BaseRouter(ABC):
                 'router_type': self.get_router_type()
             }
             
-        except requests.exceptions.SSLError as e:
-            logger.error(f'Erro de SSL: {str(e)}')
+        if isinstance(error, requests.exceptions.SSLError):
+            logger.error('Erro de SSL: %s', error, extra={'route': 'router.request', 'code': 'SSL_ERROR'})
             return {
                 'success': False,
-                'error': f'Erro de certificado SSL: {str(e)}',
+                'error': f'Erro de certificado SSL: {str(error)}',
                 'code': 'SSL_ERROR',
                 'router_type': self.get_router_type()
             }
             
-        except requests.exceptions.ConnectionError as e:
-            logger.error(f'Erro de conexão: {str(e)}')
-
+        if isinstance(error, requests.exceptions.ConnectionError):
+            logger.error('Erro de conexão: %s', error, extra={'route': 'router.request', 'code': 'CONNECTION_ERROR'})
             return {
                 'success': False,
                 'error': 'Não foi possível conectar ao roteador',
@@ -130,14 +193,68 @@ class BaseRouter(ABC):
                 'router_type': self.get_router_type()
             }
             
+        logger.error('Erro na requisição: %s', error, extra={'route': 'router.request', 'code': 'REQUEST_ERROR'})
+        return {
+            'success': False,
+            'error': f'Erro na requisição: {str(error)}',
+            'code': 'REQUEST_ERROR',
+            'router_type': self.get_router_type()
+        }
+    
+    @traced_stream
+    def stream_rows(self, path, items_path=(), fields=None, params=None):
+        """
+        Iterar as linhas de uma tabela (GET) sem materializar o corpo inteiro.
+        O corpo é lido em pedaços e decodificado incrementalmente; `fields`
+        projeta cada linha e `items_path` localiza o array dentro do documento.
+        Falhas levantam PageFetchError com o resultado no formato de make_request.
+        Usa autenticação básica; drivers com sessão própria devem sobrescrever.
+        """
+        url = f'{self.base_url}{path}'
+        logger.debug('Lendo tabela em fluxo: %s', url, extra={'route': 'router.request'})
+        start_time = time.perf_counter()
+        try:
+            response = requests.get(url, headers=self.get_auth_headers(), params=params,
+                                    timeout=10, verify=self.verify_ssl(), stream=True)
         except requests.exceptions.RequestException as e:
-            logger.error(f'Erro na requisição: {str(e)}')
-            return {
-                'success': False,
-                'error': f'Erro na requisição: {str(e)}',
-                'code': 'REQUEST_ERROR',
-                'router_type': self.get_router_type()
-            }
+            raise PageFetchError(self.request_error(e, url))
+        
+        with response:
+            if response.status_code >= 400:
+                try:
+                    error_data = response.json() if response.content else {}
+                except json.JSONDecodeError:
+                    error_data = {'raw_response': response.text}
+                raise PageFetchError({
+                    'success': True,
+                    'status': response.status_code,
+                    'data': error_data,
+                    'error': f'HTTP {response.status_code}',
+                    'url': url,
+                    'method': 'GET',
+                    'router_type': self.get_router_type()
+                })
+            count = 0
+            try:
+                for row in iter_json_items(response.iter_content(STREAM_CHUNK_SIZE), items_path, fields):
+                    count += 1
+                    yield row
+            except requests.exceptions.RequestException as e:
+                raise PageFetchError(self.request_error(e, url))
+            except JSONStreamError as e:
+                raise PageFetchError({
+                    'success': False,
+                    'status': 502,
+                    'error': f'Resposta JSON inválida do roteador: {str(e)}',
+                    'code': 'INVALID_RESPONSE',
+                    'router_type': self.get_router_type()
+                })
+        
+        duration = (time.perf_counter() - start_time) * 1000
+        logger.info('Tabela lida em fluxo - Linhas: %s, Tempo: %.2fms, URL: %s', count, duration, url,
+                    extra={'route': 'router.request', 'status': response.status_code,
+                           'duration_ms': round(duration, 2), 'method': 'GET',
+                           'router_type': self.get_router_type()})
     
     @abstractmethod
     def get_router_type(self):
@@ -0,0 +1,219 @@
+"""
+Modelo normalizado de regras de firewall
+
+Cada driver converte as regras no formato do fabricante em `FirewallRule`:
+cadeia, posição, ação, protocolos, interfaces e faixas numéricas de endereço
+(IPv4 e IPv6 separados) e de porta. Critérios que não podem ser avaliados
+localmente (aliases, address-lists, estado de conexão...) ficam listados em
+`unresolved` e tornam a regra "incerta" nas consultas.
+"""
+import ipaddress
+
+IPV4_MAX = (1 << 32) - 1
+IPV6_MAX = (1 << 128) - 1
+PORT_MAX = 65535
+
+FAMILY_MAX = {4: IPV4_MAX, 6: IPV6_MAX}
+
+# Números de protocolo mais comuns para nomes
+PROTOCOL_NAMES = {'1': 'icmp', '6': 'tcp', '17': 'udp', '58': 'ipv6-icmp', '47': 'gre', '50': 'ipsec-esp'}
+
+# Ações que encerram a avaliação; as demais (log, passthrough, add-*-to-address-list)
+# apenas seguem para a próxima regra e não entram no índice
+TERMINAL_ACTIONS = {'accept', 'drop', 'reject', 'fasttrack-connection'}
+
+# Ações que desviam para outra cadeia: o resultado não pode ser decidido localmente
+BRANCH_ACTIONS = {'jump', 'return'}
+
+ACTION_ALIASES = {
+    'accept': 'accept', 'pass': 'accept', 'allow': 'accept',
+    'drop': 'drop', 'block': 'drop', 'deny': 'drop',
+    'reject': 'reject', 'tarpit': 'reject',
+}
+
+
+class FirewallRule:
+    """Regra normalizada; None em um critério significa 'qualquer'"""
+
+    __slots__ = (
+        'id', 'chain', 'position', 'action', 'protocols', 'protocols_negated',
+        'src', 'dst', 'src_ports', 'dst_ports', 'in_interface', 'out_interface',
+        'unresolved', 'comment', 'disabled',
+    )
+
+    def __init__(self, id, chain, position, action, protocols=None, protocols_negated=False,
+                 src=None, dst=None, src_ports=None, dst_ports=None, in_interface=None,
+                 out_interface=None, unresolved=(), comment=None, disabled=False):
+        self.id = id
+        self.chain = chain
+        self.position = position
+        self.action = action
+        self.protocols = protocols
+        self.protocols_negated = protocols_negated
+        # Endereços: {4: [(início, fim)], 6: [...]} com faixas inclusivas
+        self.src = src
+        self.dst = dst
+        # Portas: [(início, fim)]
+        self.src_ports = src_ports
+        self.dst_ports = dst_ports
+        self.in_interface = in_interface
+        self.out_interface = out_interface
+        self.unresolved = tuple(unresolved)
+        self.comment = comment
+        self.disabled = disabled
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'chain': self.chain,
+            'position': self.position,
+            'action': self.action,
+            'protocols': sorted(self.protocols) if self.protocols is not None else None,
+            'protocols_negated': self.protocols_negated,
+            'src': format_addresses(self.src),
+            'dst': format_addresses(self.dst),
+            'src_ports': format_ranges(self.src_ports),
+            'dst_ports': format_ranges(self.dst_ports),
+            'in_interface': self.in_interface,
+            'out_interface': self.out_interface,
+            'unresolved': list(self.unresolved),
+            'comment': self.comment,
+            'disabled': self.disabled,
+        }
+
+
+def normalize_action(action):
+    action = str(action or '').strip().lower()
+    return ACTION_ALIASES.get(action, action or None)
+
+
+def normalize_protocols(value):
+    """'tcp', 'TCP/UDP', '6', 'any', '' -> conjunto de nomes ou None (qualquer)"""
+    value = str(value or '').strip().lower()
+    if value in ('', 'any', 'all', '*'):
+        return None
+    protocols = set()
+    for part in value.replace('/', ',').split(','):
+        part = part.strip()
+        if part:
+            protocols.add(PROTOCOL_NAMES.get(part, part))
+    return protocols or None
+
+
+def parse_address(value):
+    """
+    Converter um endereço, prefixo ou faixa ('10.0.0.0/24', '10.0.0.1-10.0.0.9')
+    em (família, início, fim). Levanta ValueError se não for um endereço literal.
+    """
+    value = value.strip()
+    if '-' in value and '/' not in value:
+        first, last = value.split('-', 1)
+        first, last = ipaddress.ip_address(first.strip()), ipaddress.ip_address(last.strip())
+        if first.version != last.version:
+            raise ValueError(value)
+        return first.version, int(first), int(last)
+    network = ipaddress.ip_network(value, strict=False)
+    return network.version, int(network.network_address), int(network.broadcast_address)
+
+
+def parse_addresses(value, negated=False):
+    """
+    Lista de endereços separados por vírgula -> ({família: faixas}, resolvido).
+    Retorna (None, True) para 'qualquer' e (None, False) quando há nomes
+    (aliases, redes de interface) que não podem ser resolvidos aqui.
+    """
+    if isinstance(value, (list, tuple)):
+        value = ','.join(str(v) for v in value)
+    value = str(value or '').strip()
+    if value.startswith('!'):
+        negated, value = not negated, value[1:]
+    if value.lower() in ('', 'any', '*'):
+        return None, True
+    ranges = {4: [], 6: []}
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            family, start, end = parse_address(part)
+        except ValueError:
+            return None, False
+        ranges[family].append((start, end))
+    ranges = {family: merge_ranges(items) for family, items in ranges.items()}
+    if negated:
+        ranges = {family: complement_ranges(items, FAMILY_MAX[family]) for family, items in ranges.items()}
+    return ranges, True
+
+
+def parse_ports(value, negated=False):
+    """'80', '80,443', '1000-2000', '1000:2000', '!22' -> (faixas, resolvido)"""
+    if isinstance(value, (list, tuple)):
+        value = ','.join(str(v) for v in value)
+    value = str(value or '').strip()
+    if value.startswith('!'):
+        negated, value = not negated, value[1:]
+    if value.lower() in ('', 'any', '*'):
+        return None, True
+    ranges = []
+    for part in value.split(','):
+        part = part.strip().replace(':', '-')
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        if not first.isdigit() or (last and not last.isdigit()):
+            return None, False
+        ranges.append((int(first), int(last or first)))
+    ranges = merge_ranges(ranges)
+    if negated:
+        ranges = complement_ranges(ranges, PORT_MAX)
+    return ranges, True
+
+
+def merge_ranges(ranges):
+    """Ordenar e unir faixas inclusivas sobrepostas ou adjacentes"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def complement_ranges(ranges, maximum):
+    """Complemento de faixas (já unidas) dentro de [0, maximum]"""
+    result = []
+    cursor = 0
+    for start, end in ranges:
+        if start > cursor:
+            result.append((cursor, start - 1))
+        cursor = end + 1
+    if cursor <= maximum:
+        result.append((cursor, maximum))
+    return result
+
+
+def format_ranges(ranges):
+    if ranges is None:
+        return None
+    return [str(start) if start == end else f'{start}-{end}' for start, end in ranges]
+
+
+def format_addresses(addresses):
+    if addresses is None:
+        return None
+    result = []
+    for family, ranges in sorted(addresses.items()):
+        for start, end in ranges:
+            address = ipaddress.IPv4Address if family == 4 else ipaddress.IPv6Address
+            first, last = address(start), address(end)
+            networks = list(ipaddress.summarize_address_range(first, last))
+            if len(networks) == 1:
+                result.append(str(networks[0]))
+            else:
+                result.append(f'{first}-{last}')
+    return result
+
+
+def is_true(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
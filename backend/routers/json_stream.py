@@ -0,0 +1,136 @@
+"""
+Leitura incremental de documentos JSON grandes vindos dos roteadores
+
+Em vez de `response.json()`, que materializa a tabela inteira, os pedaços do
+corpo HTTP são decodificados à medida que chegam e cada elemento do array de
+linhas é entregue assim que fica completo. Só o elemento corrente e o trecho
+ainda não consumido ficam em memória, então o pico não cresce com o tamanho
+da tabela.
+"""
+import codecs
+import json
+
+_WHITESPACE = ' \t\n\r'
+_decoder = json.JSONDecoder()
+
+
+class JSONStreamError(ValueError):
+    """Documento malformado ou fora do formato esperado"""
+
+
+class _Buffer:
+    """Texto decodificado ainda não consumido, alimentado sob demanda"""
+
+    def __init__(self, chunks, encoding='utf-8'):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Ler mais um pedaço; retorna False no fim do fluxo"""
+        if self.eof:
+            return False
+        # Descarta o que já foi consumido para o buffer não crescer
+        if self.pos:
+            self.text = self.text[self.pos:]
+            self.pos = 0
+        for chunk in self.chunks:
+            if not chunk:
+                continue
+            self.text += self.decoder.decode(chunk)
+            return True
+        self.text += self.decoder.decode(b'', final=True)
+        self.eof = True
+        return False
+
+    def peek(self):
+        """Próximo caractere significativo (lendo mais se preciso) ou '' no fim"""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise JSONStreamError(f'Esperado {char!r} na posição {self.pos}')
+        self.pos += 1
+
+    def _may_continue(self, value, end):
+        """Literais e números cortados no fim do buffer podem continuar no próximo pedaço"""
+        if end >= len(self.text):
+            return self.text[end - 1] not in '}]"'
+        # '12' de '12.5' ou '1' de '1e3' quando o pedaço terminou no meio do número
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and self.text[end] in '.eE+-'
+
+    def value(self):
+        """Decodificar o próximo valor JSON completo"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError as e:
+                if not self.fill():
+                    raise JSONStreamError(str(e)) from e
+                continue
+            if not self.eof and self._may_continue(value, end) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def _project(row, fields):
+    if fields is None or not isinstance(row, dict):
+        return row
+    return {field: row[field] for field in fields if field in row}
+
+
+def _iter_array(buffer, fields):
+    buffer.expect('[')
+    if buffer.peek() == ']':
+        buffer.pos += 1
+        return
+    while True:
+        yield _project(buffer.value(), fields)
+        separator = buffer.peek()
+        buffer.pos += 1
+        if separator == ']':
+            return
+        if separator != ',':
+            raise JSONStreamError(f'Esperado "," ou "]" na posição {buffer.pos - 1}')
+
+
+def _find_key(buffer, key):
+    """Avançar dentro de um objeto até o valor da chave (pulando as demais)"""
+    buffer.expect('{')
+    while True:
+        if buffer.peek() == '}':
+            raise JSONStreamError(f'Chave {key!r} não encontrada')
+        name = buffer.value()
+        buffer.expect(':')
+        if name == key:
+            return
+        buffer.value()
+        if buffer.peek() == ',':
+            buffer.pos += 1
+
+
+def iter_json_items(chunks, items_path=(), fields=None, encoding='utf-8'):
+    """
+    Iterar os elementos de um array JSON a partir de pedaços de bytes.
+
+    `items_path` localiza o array dentro de objetos aninhados (ex.: ('rows',)
+    para o OPNsense, ('data',) para o UniFi); vazio significa que o documento
+    é o próprio array. `fields` projeta cada linha apenas nessas chaves.
+    Documentos vazios não produzem linhas.
+    """
+    buffer = _Buffer(chunks, encoding)
+    if buffer.peek() == '':
+        return
+    for key in items_path:
+        _find_key(buffer, key)
+    yield from _iter_array(buffer, tuple(fields) if fields is not None else None)
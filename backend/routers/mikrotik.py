@@ -1,9 +1,22 @@
 
 from .base import BaseRouter
+from .firewall import FirewallRule, normalize_action, normalize_protocols, parse_addresses, parse_ports, is_true
+from .pagination import collect
+from .mikrotik_batch import compile_script, parse_output, BatchCompileError
+
+# Propriedades das regras de firewall que não restringem o tráfego
+FIREWALL_INFORMATIONAL_FIELDS = {
+    '.id', '.nextid', 'chain', 'action', 'comment', 'disabled', 'dynamic', 'invalid', 'bytes',
+    'packets', 'log', 'log-prefix', 'reject-with', 'jump-target', 'protocol', 'src-address',
+    'dst-address', 'src-port', 'dst-port', 'in-interface', 'out-interface',
+}
 
 class MikrotikRouter(BaseRouter):
     """Classe específica para roteadores Mikrotik"""
     
+    WIREGUARD_INTERFACES_PATH = '/rest/interface/wireguard'
+    WIREGUARD_PEERS_PATH = '/rest/interface/wireguard/peers'
+    
     def get_router_type(self):
         return 'mikrotik'
     
@@ -41,3 +54,111 @@ class MikrotikRouter(BaseRouter):
     def get_dhcp_leases(self):
         """Obter leases DHCP"""
         return self.make_request('/rest/ip/dhcp-server/lease', 'GET')
+    
+    def iter_rows(self, path, fields=None):
+        """
+        Iterar as linhas de uma tabela do RouterOS em fluxo.
+        Com `fields`, a projeção também é pedida ao roteador via .proplist.
+        """
+        params = {'.proplist': ','.join(fields)} if fields else None
+        return self.stream_rows(path, fields=fields, params=params)
+    
+    def iter_firewall_rules(self, fields=None):
+        """Iterar regras de firewall sem carregar a tabela inteira"""
+        return self.iter_rows('/rest/ip/firewall/filter', fields)
+    
+    def iter_routes(self, fields=None):
+        """Iterar a tabela de roteamento sem carregá-la inteira"""
+        return self.iter_rows('/rest/ip/route', fields)
+    
+    def iter_dhcp_leases(self, fields=None):
+        """Iterar leases DHCP sem carregar a tabela inteira"""
+        return self.iter_rows('/rest/ip/dhcp-server/lease', fields)
+    
+    def iter_wireguard_peers(self, fields=None):
+        """Iterar peers WireGuard sem carregar a tabela inteira"""
+        return self.iter_rows(self.WIREGUARD_PEERS_PATH, fields)
+    
+    def get_wireguard_interfaces(self):
+        """Obter interfaces WireGuard"""
+        return self.make_request(self.WIREGUARD_INTERFACES_PATH, 'GET')
+    
+    def get_wireguard_peers(self):
+        """Obter peers WireGuard"""
+        return self.make_request(self.WIREGUARD_PEERS_PATH, 'GET')
+    
+    def normalize_firewall_rule(self, row, position):
+        """Converter uma regra de /ip/firewall/filter no modelo normalizado"""
+        unresolved = [
+            field for field, value in row.items()
+            if field not in FIREWALL_INFORMATIONAL_FIELDS and value not in (None, '', 'false')
+        ]
+        protocol = str(row.get('protocol') or '')
+        src, src_ok = parse_addresses(row.get('src-address'))
+        dst, dst_ok = parse_addresses(row.get('dst-address'))
+        src_ports, src_ports_ok = parse_ports(row.get('src-port'))
+        dst_ports, dst_ports_ok = parse_ports(row.get('dst-port'))
+        for field, ok in (('src-address', src_ok), ('dst-address', dst_ok),
+                          ('src-port', src_ports_ok), ('dst-port', dst_ports_ok)):
+            if not ok:
+                unresolved.append(field)
+        return FirewallRule(
+            id=row.get('.id'),
+            chain=row.get('chain'),
+            position=position,
+            action=normalize_action(row.get('action')),
+            protocols=normalize_protocols(protocol.lstrip('!')),
+            protocols_negated=protocol.startswith('!'),
+            src=src, dst=dst, src_ports=src_ports, dst_ports=dst_ports,
+            in_interface=row.get('in-interface') or None,
+            out_interface=row.get('out-interface') or None,
+            unresolved=unresolved,
+            comment=row.get('comment'),
+            disabled=is_true(row.get('disabled'))
+        )
+    
+    def get_normalized_firewall_rules(self):
+        """Regras de firewall no modelo normalizado (lidas em fluxo)"""
+        return collect(
+            self.iter_firewall_rules(),
+            lambda rows: [self.normalize_firewall_rule(row, position) for position, row in enumerate(rows)]
+        )
+    
+    def execute_script(self, script):
+        """Executar um script via /rest/execute aguardando a saída (as-string)"""
+        return self.make_request('/rest/execute', 'POST', {'script': script, 'as-string': True})
+    
+    def batch_write(self, operations, atomic=True):
+        """
+        Aplicar operações REST (PUT/PATCH/DELETE) num único script.
+        Preenche operation['result'] de cada item e retorna o resultado da chamada;
+        no modo atômico uma falha desfaz os itens já aplicados.
+        """
+        try:
+            script = compile_script(operations, atomic=atomic)
+        except BatchCompileError as e:
+            return {'success': False, 'status': 400, 'error': str(e), 'code': 'BATCH_COMPILE_ERROR'}
+        
+        result = self.execute_script(script)
+        ok = result.get('success') and result.get('status', 0) < 400
+        data = result.get('data')
+        output = data.get('ret') if isinstance(data, dict) else None
+        items = parse_output(output, len(operations)) if ok else {}
+        failed = any(item['status'] != 'ok' for item in items.values())
+        for index, operation in enumerate(operations):
+            item = items.get(index)
+            if not ok:
+                operation['result'] = {'success': False, 'status': result.get('status'),
+                                       'code': result.get('code'), 'error': result.get('error') or data}
+            elif item is None:
+                # Não chegou a executar (falha anterior no modo atômico)
+                operation['result'] = {'success': False, 'skipped': True}
+            else:
+                operation['result'] = {
+                    'success': item['status'] == 'ok',
+                    'status': result.get('status'),
+                    'id': item['id'],
+                    'rolled_back': item['status'] in ('rollback', 'rollback-err'),
+                    'error': None if item['status'] == 'ok' else item['status']
+                }
+        return {**result, 'success': bool(ok) and not failed}
@@ -0,0 +1,145 @@
+"""
+Escrita em lote no RouterOS com um único script
+
+Uma lista de operações REST (PUT = add, PATCH = set, DELETE = remove, no
+formato das operações de reconcile.py) é compilada num script do RouterOS e
+executada com uma só chamada a /rest/execute. Cada item imprime uma linha de
+resultado (`ok|índice|id` ou `err|índice`), então o custo de centenas de
+alterações é o de uma requisição.
+
+No modo atômico todas as operações ficam num único bloco: na primeira falha o
+script desfaz, em ordem inversa, o que já tinha aplicado (remove os itens
+criados, restaura os campos anteriores dos alterados e recria os removidos a
+partir de `previous`, sem os campos somente leitura do menu).
+"""
+import re
+
+from reconcile import READ_ONLY_FIELDS, INTERFACE_READ_ONLY_FIELDS
+
+_FIELD_NAME = re.compile(r'^[a-z0-9][a-z0-9-]*$')
+_ITEM_ID = re.compile(r'^\*[0-9A-Fa-f]+$')
+_MENU = re.compile(r'^(/[a-z0-9-]+)+$')
+
+# Campos que o RouterOS recusa em add/set, por menu (além de READ_ONLY_FIELDS)
+_MENU_READ_ONLY_FIELDS = {'/interface/wireguard': INTERFACE_READ_ONLY_FIELDS}
+
+# Resultados esperados na saída do script
+_RESULT_LINE = re.compile(r'^(ok|err|rollback|rollback-err)\|(\d+)(?:\|(.*))?$')
+
+
+class BatchCompileError(ValueError):
+    """Operação que não pode ser convertida em script com segurança"""
+
+
+def quote(value):
+    """Valor como string literal do RouterOS"""
+    if isinstance(value, bool):
+        value = 'yes' if value else 'no'
+    text = str(value)
+    for char, escaped in (('\\', '\\\\'), ('"', '\\"'), ('$', '\\$'), ('?', '\\?'), ('\n', '\\n'), ('\r', '\\r'), ('\t', '\\t')):
+        text = text.replace(char, escaped)
+    return f'"{text}"'
+
+
+def _arguments(fields):
+    parts = []
+    for name, value in (fields or {}).items():
+        if name == '.id':
+            continue
+        if not _FIELD_NAME.fullmatch(name):
+            raise BatchCompileError(f'Campo inválido: {name}')
+        parts.append(f'{name}={quote(value)}')
+    return ' '.join(parts)
+
+
+def _target(operation):
+    """(menu, id) a partir do path REST da operação"""
+    path = operation['path']
+    if not path.startswith('/rest/'):
+        raise BatchCompileError(f'Path fora da API REST: {path}')
+    menu = path[len('/rest'):]
+    item_id = None
+    if operation['method'] in ('PATCH', 'DELETE'):
+        menu, _, item_id = menu.rpartition('/')
+        if not _ITEM_ID.fullmatch(item_id):
+            raise BatchCompileError(f'.id inválido: {item_id}')
+    if not _MENU.fullmatch(menu):
+        raise BatchCompileError(f'Menu inválido: {menu}')
+    return menu, item_id
+
+
+def _apply_lines(index, operation):
+    menu, item_id = _target(operation)
+    method = operation['method']
+    if method == 'PUT':
+        return [
+            f':set ($ids->"{index}") [{menu}/add {_arguments(operation.get("body"))}]',
+            f':put ("ok|{index}|" . ($ids->"{index}"))',
+        ]
+    if method == 'PATCH':
+        return [f'{menu}/set {item_id} {_arguments(operation.get("body"))}', f':put "ok|{index}|{item_id}"']
+    if method == 'DELETE':
+        return [f'{menu}/remove {item_id}', f':put "ok|{index}|{item_id}"']
+    raise BatchCompileError(f'Método não suportado em lote: {method}')
+
+
+def _undo_lines(index, operation):
+    menu, item_id = _target(operation)
+    method = operation['method']
+    if method == 'PUT':
+        return [f'{menu}/remove ($ids->"{index}")']
+    previous = operation.get('previous')
+    if previous is None:
+        return None
+    ignored = READ_ONLY_FIELDS | _MENU_READ_ONLY_FIELDS.get(menu, set())
+    previous = {name: value for name, value in previous.items() if name not in ignored}
+    if method == 'PATCH':
+        return [f'{menu}/set {item_id} {_arguments(previous)}']
+    return [f'{menu}/add {_arguments(previous)}']
+
+
+def compile_script(operations, atomic=True):
+    """Gerar o script do RouterOS para as operações, na ordem recebida"""
+    lines = [':local ids [:toarray ""]']
+    if not atomic:
+        for index, operation in enumerate(operations):
+            body = '; '.join(_apply_lines(index, operation))
+            lines.append(f':do {{ {body} }} on-error={{ :put "err|{index}" }}')
+        return '\n'.join(lines)
+
+    undo = []
+    lines.append(':local step -1')
+    lines.append(':do {')
+    for index, operation in enumerate(operations):
+        lines.append(f'  :set step {index}')
+        lines.extend(f'  {line}' for line in _apply_lines(index, operation))
+        undo.append((index, _undo_lines(index, operation)))
+    lines.append('  :set step -1')
+    lines.append('} on-error={')
+    lines.append('  :put ("err|" . $step)')
+    for index, undo_lines in reversed(undo):
+        if undo_lines is None:
+            body = f':put "rollback-err|{index}"'
+        else:
+            body = f':do {{ {"; ".join(undo_lines)}; :put "rollback|{index}" }} on-error={{ :put "rollback-err|{index}" }}'
+        lines.append(f'  :if ($step > {index}) do={{ {body} }}')
+    lines.append('}')
+    return '\n'.join(lines)
+
+
+def parse_output(output, count):
+    """Saída do script -> {índice: {'status', 'id'}} (status: ok, err, rollback, rollback-err)"""
+    results = {}
+    for line in str(output or '').splitlines():
+        match = _RESULT_LINE.match(line.strip())
+        if not match:
+            continue
+        index = int(match.group(2))
+        if index >= count:
+            continue
+        # A última linha de cada item prevalece (ok seguido de rollback = desfeito)
+        entry = results.setdefault(index, {'status': None, 'id': None})
+        entry['status'] = match.group(1)
+        if match.group(1) == 'ok':
+            entry['id'] = match.group(3)
+    return results
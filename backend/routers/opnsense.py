@@ -1,5 +1,20 @@
 
 from .base import BaseRouter
+from .pagination import iter_pages, check_page_result, collect
+from .firewall import FirewallRule, normalize_action, normalize_protocols, parse_addresses, parse_ports, is_true
+from config import Config
+
+# Posição das regras sem `sequence` numérica: depois de todas as numeradas
+UNKNOWN_SEQUENCE = 2 ** 31
+
+
+def rule_sequence(row):
+    """`sequence` da regra como inteiro; ausente ou inválida vira UNKNOWN_SEQUENCE"""
+    try:
+        return int(str(row.get('sequence')).strip())
+    except (TypeError, ValueError):
+        return UNKNOWN_SEQUENCE
+
 
 class OPNsenseRouter(BaseRouter):
     """Classe específica para roteadores OPNsense"""
@@ -31,10 +46,77 @@ class OPNsenseRouter(BaseRouter):
         """Obter lista de interfaces"""
         return self.make_request('/api/diagnostics/interface/getInterfaceConfig', 'GET')
     
+    def iter_search(self, path, page_size=None, search_phrase=''):
+        """
+        Iterar sobre todas as linhas de um endpoint search* do OPNsense
+        (resposta com rows/total), buscando as páginas em paralelo
+        """
+        page_size = page_size or Config.PAGINATION_PAGE_SIZE
+        
+        def fetch_page(page, size):
+            data = check_page_result(self.make_request(path, 'POST', {
+                'current': page,
+                'rowCount': size,
+                'searchPhrase': search_phrase
+            }))
+            return data.get('rows') or [], data.get('total')
+        
+        return iter_pages(fetch_page, page_size)
+    
+    def search_all(self, path, page_size=None, search_phrase=''):
+        """Listagem completa de um endpoint search* no formato de make_request"""
+        return collect(
+            self.iter_search(path, page_size, search_phrase),
+            lambda rows: {'rows': rows, 'total': len(rows), 'rowCount': len(rows), 'current': 1}
+        )
+    
     def get_firewall_rules(self):
-        """Obter regras de firewall"""
-        return self.make_request('/api/firewall/filter/searchRule', 'GET')
+        """Obter todas as regras de firewall (todas as páginas)"""
+        return self.search_all('/api/firewall/filter/searchRule')
     
     def get_gateway_status(self):
         """Obter status dos gateways"""
         return self.make_request('/api/routes/gateway/status', 'GET')
+    
+    def normalize_firewall_rule(self, row, position):
+        """Converter uma linha de searchRule no modelo normalizado"""
+        unresolved = []
+        src, src_ok = parse_addresses(row.get('source_net'), negated=is_true(row.get('source_not')))
+        dst, dst_ok = parse_addresses(row.get('destination_net'), negated=is_true(row.get('destination_not')))
+        src_ports, src_ports_ok = parse_ports(row.get('source_port'))
+        dst_ports, dst_ports_ok = parse_ports(row.get('destination_port'))
+        for field, ok in (('source_net', src_ok), ('destination_net', dst_ok),
+                          ('source_port', src_ports_ok), ('destination_port', dst_ports_ok)):
+            if not ok:
+                unresolved.append(field)
+        interface = row.get('interface') or None
+        if interface and ',' in interface:
+            # Regra flutuante em várias interfaces
+            unresolved.append('interface')
+            interface = None
+        if row.get('quick') is not None and not is_true(row.get('quick')):
+            # Sem quick vale a última regra que casar, não a primeira
+            unresolved.append('quick')
+        direction = row.get('direction') or 'in'
+        return FirewallRule(
+            id=row.get('uuid'),
+            chain=direction,
+            position=position,
+            action=normalize_action(row.get('action')),
+            protocols=normalize_protocols(row.get('protocol')),
+            src=src, dst=dst, src_ports=src_ports, dst_ports=dst_ports,
+            in_interface=interface if direction == 'in' else None,
+            out_interface=interface if direction == 'out' else None,
+            unresolved=unresolved,
+            comment=row.get('description'),
+            disabled=not is_true(row.get('enabled', '1'))
+        )
+    
+    def get_normalized_firewall_rules(self):
+        """Regras de firewall no modelo normalizado, na ordem de avaliação (sequence)"""
+        def normalize(rows):
+            # Desempate pela ordem recebida da API
+            ordered = sorted(enumerate(rows), key=lambda item: (rule_sequence(item[1]), item[0]))
+            return [self.normalize_firewall_rule(row, position) for position, (_, row) in enumerate(ordered)]
+        
+        return collect(self.iter_search('/api/firewall/filter/searchRule'), normalize)
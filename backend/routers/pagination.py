@@ -0,0 +1,90 @@
+"""
+Iteração concorrente sobre APIs paginadas dos roteadores
+
+A primeira página revela o total de registros; as páginas restantes são buscadas
+em paralelo com uma janela limitada e entregues em ordem, como um fluxo de
+linhas. Uma listagem completa custa aproximadamente a latência de duas
+requisições em vez de uma por página.
+"""
+import math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from tracing import tracer
+
+
+class PageFetchError(Exception):
+    """Falha ao buscar uma página; `result` é o resultado de make_request"""
+
+    def __init__(self, result):
+        super().__init__(result.get('error') or f"HTTP {result.get('status')}")
+        self.result = result
+
+
+def check_page_result(result):
+    """Validar o resultado de make_request para uma página"""
+    if not result.get('success') or result.get('status', 0) >= 400:
+        raise PageFetchError(result)
+    return result.get('data') or {}
+
+
+def iter_pages(fetch_page, page_size, first_page=1, window=None):
+    """
+    Iterar sobre as linhas de todas as páginas.
+
+    `fetch_page(numero, tamanho)` retorna (linhas, total) e levanta
+    PageFetchError em caso de falha; `total` None significa desconhecido, e então
+    a paginação segue sequencialmente até uma página incompleta.
+
+    Se o servidor limitar o tamanho da página (primeira página com menos linhas
+    que o pedido, mas abaixo do total), as demais são pedidas e contadas com o
+    tamanho que ele de fato devolveu.
+    """
+    window = window or Config.PAGINATION_WINDOW
+    rows, total = fetch_page(first_page, page_size)
+    yield from rows
+
+    if total is None:
+        page = first_page
+        while len(rows) >= page_size:
+            page += 1
+            rows, _ = fetch_page(page, page_size)
+            yield from rows
+        return
+
+    if 0 < len(rows) < min(page_size, total):
+        page_size = len(rows)
+    last_page = first_page + max(math.ceil(total / page_size), 1) - 1
+    if last_page <= first_page:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=window, thread_name_prefix='page-fetch')
+    try:
+        pending = deque()
+        next_page = first_page + 1
+        while next_page <= last_page or pending:
+            while next_page <= last_page and len(pending) < window:
+                pending.append(executor.submit(tracer.wrap(fetch_page), next_page, page_size))
+                next_page += 1
+            rows, _ = pending.popleft().result()
+            yield from rows
+    finally:
+        # Consumidor parou antes do fim (ou houve erro): não busca o resto
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def collect(rows_iterator, wrap):
+    """
+    Materializar o iterador num resultado no formato de make_request.
+    `wrap(linhas)` monta o campo `data`; falhas viram o resultado da página.
+    """
+    try:
+        rows = list(rows_iterator)
+    except PageFetchError as e:
+        return e.result
+    return {
+        'success': True,
+        'status': 200,
+        'data': wrap(rows),
+    }
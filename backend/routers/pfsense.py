@@ -1,4 +1,5 @@
-from .base import BaseRouter
+from .base import BaseRouter, traced_request
+from .firewall import FirewallRule, normalize_action, normalize_protocols, parse_addresses, parse_ports
 import requests
 import json
 from datetime import datetime
@@ -29,6 +30,7 @@ class PfsenseRouter(BaseRouter):
         except Exception as e:
             return False
     
+    @traced_request
     def make_request(self, path, method='GET', body=None):
         """Fazer requisição HTTP específica para Pfsense"""
         try:
@@ -55,6 +57,7 @@ class PfsenseRouter(BaseRouter):
             
             end_time = datetime.now()
             duration = (end_time - start_time).total_seconds() * 1000
+            self.last_response = response
             
             # Processar resposta
             try:
@@ -99,3 +102,54 @@ class PfsenseRouter(BaseRouter):
     def get_firewall_rules(self):
         """Obter regras de firewall"""
         return self.make_request('/api/v1/firewall/rule', 'GET')
+    
+    def _rule_endpoint(self, value):
+        """Origem/destino da API (dict ou campos planos) -> (endereço, negado, porta)"""
+        if isinstance(value, dict):
+            if 'any' in value:
+                address = 'any'
+            else:
+                address = value.get('address') or value.get('network') or 'any'
+            return address, 'not' in value, value.get('port')
+        return value or 'any', False, None
+    
+    def normalize_firewall_rule(self, row, position):
+        """Converter uma regra de /api/v1/firewall/rule no modelo normalizado"""
+        unresolved = []
+        src_address, src_not, src_port = self._rule_endpoint(row.get('source', row.get('src')))
+        dst_address, dst_not, dst_port = self._rule_endpoint(row.get('destination', row.get('dst')))
+        src, src_ok = parse_addresses(src_address, negated=src_not)
+        dst, dst_ok = parse_addresses(dst_address, negated=dst_not)
+        src_ports, src_ports_ok = parse_ports(src_port if src_port is not None else row.get('srcport'))
+        dst_ports, dst_ports_ok = parse_ports(dst_port if dst_port is not None else row.get('dstport'))
+        for field, ok in (('source', src_ok), ('destination', dst_ok),
+                          ('source.port', src_ports_ok), ('destination.port', dst_ports_ok)):
+            if not ok:
+                unresolved.append(field)
+        if row.get('floating'):
+            unresolved.append('floating')
+        interface = row.get('interface') or None
+        return FirewallRule(
+            id=row.get('tracker'),
+            chain=interface,
+            position=position,
+            action=normalize_action(row.get('type')),
+            protocols=normalize_protocols(row.get('protocol')),
+            src=src, dst=dst, src_ports=src_ports, dst_ports=dst_ports,
+            in_interface=interface,
+            unresolved=unresolved,
+            comment=row.get('descr'),
+            disabled='disabled' in row and row.get('disabled') not in (False, None)
+        )
+    
+    def get_normalized_firewall_rules(self):
+        """Regras de firewall no modelo normalizado, na ordem da API"""
+        result = self.get_firewall_rules()
+        if not result.get('success') or result.get('status', 0) >= 400:
+            return result
+        data = result.get('data')
+        rows = data.get('data') if isinstance(data, dict) else data
+        return {
+            **result,
+            'data': [self.normalize_firewall_rule(row, position) for position, row in enumerate(rows or [])]
+        }
@@ -0,0 +1,104 @@
+"""
+Registro preguiçoso dos drivers de roteador
+
+Os drivers são descritos por um manifesto ('tipo' -> 'módulo:Classe') e por
+entry points do grupo `wiredash.routers`; o módulo de um driver só é importado
+na primeira vez que o tipo é usado, e a classe resolvida fica em cache.
+"""
+import importlib
+import logging
+import os
+import threading
+from importlib import metadata
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = 'wiredash.routers'
+
+# Manifesto dos drivers embutidos
+BUILTIN_DRIVERS = {
+    'mikrotik': 'routers.mikrotik:MikrotikRouter',
+    'opnsense': 'routers.opnsense:OPNsenseRouter',
+    'pfsense': 'routers.pfsense:PfsenseRouter',
+    'unifi': 'routers.unifi:UnifiRouter',
+}
+
+
+def _load_target(target):
+    module_name, _, attr = target.partition(':')
+    module = importlib.import_module(module_name)
+    return getattr(module, attr)
+
+
+class DriverRegistry:
+    """Resolve tipos de roteador para classes de driver sob demanda"""
+
+    def __init__(self, builtin=None):
+        self._specs = dict(builtin or {})
+        self._classes = {}
+        self._lock = threading.Lock()
+        self._discovered = False
+
+    def _discover(self):
+        """Ler entry points e o manifesto extra da env ROUTER_DRIVERS (sem importar drivers)"""
+        if self._discovered:
+            return
+        with self._lock:
+            if self._discovered:
+                return
+            try:
+                for entry_point in metadata.entry_points(group=ENTRY_POINT_GROUP):
+                    self._specs.setdefault(entry_point.name.lower(), entry_point)
+            except Exception as e:
+                logger.warning('Failed to read router driver entry points: %s', e)
+            # Formato: 'tipo=pacote.modulo:Classe,outro=...'
+            for item in os.getenv('ROUTER_DRIVERS', '').split(','):
+                if '=' in item:
+                    router_type, target = item.split('=', 1)
+                    self._specs[router_type.strip().lower()] = target.strip()
+            self._discovered = True
+
+    def register(self, router_type, target):
+        """Registrar um driver (classe ou 'módulo:Classe') em tempo de execução"""
+        self._discover()
+        with self._lock:
+            self._specs[router_type.lower()] = target
+            self._classes.pop(router_type.lower(), None)
+
+    def preload(self):
+        """Importar todos os drivers conhecidos (antes do fork, para compartilhar os módulos)"""
+        for router_type in self.supported_types():
+            try:
+                self.get(router_type)
+            except Exception as e:
+                logger.warning('Failed to preload router driver %s: %s', router_type, e)
+
+    def supported_types(self):
+        self._discover()
+        return sorted(self._specs)
+
+    def get(self, router_type):
+        """Classe do driver para o tipo, ou None se não suportado"""
+        router_type = router_type.lower()
+        router_class = self._classes.get(router_type)
+        if router_class is not None:
+            return router_class
+        self._discover()
+        spec = self._specs.get(router_type)
+        if spec is None:
+            return None
+        with self._lock:
+            router_class = self._classes.get(router_type)
+            if router_class is None:
+                if isinstance(spec, str):
+                    router_class = _load_target(spec)
+                elif isinstance(spec, metadata.EntryPoint):
+                    router_class = spec.load()
+                else:
+                    router_class = spec
+                self._classes[router_type] = router_class
+        return router_class
+
+
+# Registro global usado pelos blueprints
+registry = DriverRegistry(BUILTIN_DRIVERS)
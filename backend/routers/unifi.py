@@ -1,7 +1,9 @@
 
-from .base import BaseRouter
+from .base import BaseRouter, traced_request
 import requests
 import json
+import threading
+from datetime import datetime
 
 class UnifiRouter(BaseRouter):
     """Classe específica para controladores Unifi"""
@@ -11,6 +13,11 @@ class UnifiRouter(BaseRouter):
         super().__init__(endpoint, port or '8443', user, password, use_https)
         self.session = requests.Session()
         self.session.verify = False  # Unifi usa certificados auto-assinados
+        # Login feito uma vez e reaproveitado (cookie da sessão) pelas requisições seguintes,
+        # inclusive pelas páginas buscadas em paralelo
+        self._auth_lock = threading.Lock()
+        self._authenticated = False
+        self._auth_generation = 0
         
     def get_router_type(self):
         return 'unifi'
@@ -39,11 +46,38 @@ class UnifiRouter(BaseRouter):
         except Exception as e:
             return False
     
+    def ensure_authenticated(self, expired=None):
+        """
+        Autenticar só se ainda não houver sessão, uma thread por vez. `expired` é a
+        geração da sessão recusada com 401: se outra thread já renovou, reaproveita.
+        """
+        with self._auth_lock:
+            if not self._authenticated or expired == self._auth_generation:
+                self._authenticated = self.authenticate()
+                self._auth_generation += 1
+            return self._authenticated
+    
+    def _send(self, method, url, body):
+        if method == 'GET':
+            return self.session.get(url, timeout=10)
+        if method == 'POST':
+            return self.session.post(url, json=body, timeout=10)
+        if method == 'PUT':
+            return self.session.put(url, json=body, timeout=10)
+        return self.session.delete(url, timeout=10)
+    
+    @traced_request
     def make_request(self, path, method='GET', body=None):
         """Fazer requisição HTTP específica para Unifi"""
         try:
-            # Tentar autenticar primeiro
-            if not self.authenticate():
+            if method.upper() not in ('GET', 'POST', 'PUT', 'DELETE'):
+                return {
+                    'success': False,
+                    'error': f'Método HTTP não suportado: {method}',
+                    'code': 'UNSUPPORTED_METHOD'
+                }
+            
+            if not self.ensure_authenticated():
                 return {
                     'success': False,
                     'error': 'Falha na autenticação com o controlador Unifi',
@@ -51,28 +85,19 @@ class UnifiRouter(BaseRouter):
                     'router_type': self.get_router_type()
                 }
             
+            generation = self._auth_generation
             url = f'{self.base_url}{path}'
             
             start_time = datetime.now()
             
-            # Fazer requisição baseada no método
-            if method.upper() == 'GET':
-                response = self.session.get(url, timeout=10)
-            elif method.upper() == 'POST':
-                response = self.session.post(url, json=body, timeout=10)
-            elif method.upper() == 'PUT':
-                response = self.session.put(url, json=body, timeout=10)
-            elif method.upper() == 'DELETE':
-                response = self.session.delete(url, timeout=10)
-            else:
-                return {
-                    'success': False,
-                    'error': f'Método HTTP não suportado: {method}',
-                    'code': 'UNSUPPORTED_METHOD'
-                }
+            response = self._send(method.upper(), url, body)
+            if response.status_code == 401 and self.ensure_authenticated(expired=generation):
+                # Sessão expirada no controlador: novo login e uma nova tentativa
+                response = self._send(method.upper(), url, body)
             
             end_time = datetime.now()
             duration = (end_time - start_time).total_seconds() * 1000
+            self.last_response = response
             
             # Processar resposta
             try:
@@ -1,11 +1,11 @@
 from flask import Blueprint, request, jsonify
 import logging
-from database import db
+from database import db, USER_PUBLIC_FIELDS
+from session_tokens import session_tokens, TokenError
 import bcrypt
 import os
-import smtplib
-from email.message import EmailMessage
 from datetime import datetime, timedelta
+from mailer import enqueue_email
 import secrets
 
 logger = logging.getLogger(__name__)
@@ -28,17 +28,54 @@ def login():
             stored = user.get('password', '')
             if isinstance(stored, str) and stored.startswith(('$2a$', '$2b$', '$2y$')):
                 if bcrypt.checkpw(password.encode('utf-8'), stored.encode('utf-8')):
-                    return jsonify({'success': True, 'data': user})
+                    return login_response(user)
             else:
                 if stored == password:
                     db.update_user(user['id'], password=password)
-                    return jsonify({'success': True, 'data': user})
+                    return login_response(user)
         return jsonify({'success': False, 'error': 'Invalid credentials or user disabled'}), 401
             
     except Exception as e:
         logger.error(f'Error during login: {str(e)}')
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def login_response(user):
+    """Public user fields plus a fresh access/refresh token pair (never the password hash)"""
+    return jsonify({
+        'success': True,
+        'data': {field: user.get(field) for field in USER_PUBLIC_FIELDS},
+        'tokens': session_tokens.issue_pair(user['id'])
+    })
+
+@auth_bp.route('/auth/refresh', methods=['POST'])
+def refresh():
+    """Exchange a refresh token for a new token pair"""
+    data = request.get_json(silent=True) or {}
+    try:
+        claims = session_tokens.verify(data.get('refreshToken') or '', 'refresh')
+    except TokenError as e:
+        return jsonify({'success': False, 'error': str(e), 'code': e.code}), 401
+    return jsonify({'success': True, 'tokens': session_tokens.issue_pair(claims['sub'])})
+
+@auth_bp.route('/auth/logout', methods=['POST'])
+def logout():
+    """Revoke every token of the authenticated user"""
+    try:
+        claims = session_tokens.current_claims()
+    except TokenError as e:
+        return jsonify({'success': False, 'error': str(e), 'code': e.code}), 401
+    session_tokens.revoke_user(claims['sub'])
+    return jsonify({'success': True})
+
+@auth_bp.route('/auth/me', methods=['GET'])
+def me():
+    """Claims of the current access token"""
+    try:
+        claims = session_tokens.current_claims()
+    except TokenError as e:
+        return jsonify({'success': False, 'error': str(e), 'code': e.code}), 401
+    return jsonify({'success': True, 'data': {'id': claims['sub'], 'expires_at': claims['exp']}})
+
 @auth_bp.route('/auth/request-password-reset', methods=['POST'])
 def request_password_reset():
     try:
@@ -57,7 +94,7 @@ def request_password_reset():
             return jsonify({'success': False, 'error': 'SMTP não configurado'}), 500
         app_url = os.environ.get('APP_URL', '').rstrip('/')
         reset_link = f"{app_url}/reset-password?token={token}" if app_url else f"/reset-password?token={token}"
-        send_reset_email(smtp, email, reset_link)
+        queue_reset_email(email, reset_link)
         return jsonify({'success': True})
     except Exception as e:
         logger.error(f'Error requesting password reset: {str(e)}')
@@ -85,27 +122,10 @@ def reset_password():
         logger.error(f'Error resetting password: {str(e)}')
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def send_reset_email(smtp_config, to_email, reset_link):
-    msg = EmailMessage()
-    msg['Subject'] = 'Recuperação de senha'
-    msg['From'] = smtp_config.get('from_email') or smtp_config.get('username')
-    msg['To'] = to_email
-    msg.set_content(f"Para redefinir sua senha, acesse: {reset_link}")
-    host = smtp_config.get('host')
-    port = int(smtp_config.get('port') or (587 if smtp_config.get('use_tls') else 25))
-    username = smtp_config.get('username')
-    password = smtp_config.get('password')
-    use_tls = bool(smtp_config.get('use_tls'))
-    use_ssl = bool(smtp_config.get('use_ssl'))
-    if use_ssl:
-        with smtplib.SMTP_SSL(host, port) as server:
-            if username and password:
-                server.login(username, password)
-            server.send_message(msg)
-    else:
-        with smtplib.SMTP(host, port) as server:
-            if use_tls:
-                server.starttls()
-            if username and password:
-                server.login(username, password)
-            server.send_message(msg)
\ No newline at end of file
+def queue_reset_email(to_email, reset_link):
+    """Queue the reset email; delivery happens in the background sender"""
+    return enqueue_email(
+        to_email,
+        'Recuperação de senha',
+        f"Para redefinir sua senha, acesse: {reset_link}"
+    )
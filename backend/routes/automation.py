@@ -0,0 +1,132 @@
+from flask import Blueprint, request, jsonify
+import logging
+import time
+import automation
+from automation import automation_scheduler
+from database import db
+from routers.registry import registry
+
+logger = logging.getLogger(__name__)
+
+automation_bp = Blueprint('automation', __name__)
+
+# Campos do roteador exigidos na criação dos jobs
+ROUTER_REQUIRED_FIELDS = ('routerType', 'endpoint', 'user', 'password')
+
+# Máximo de jobs por requisição de criação
+MAX_JOBS_PER_REQUEST = 5000
+
+@automation_bp.route('/automation/jobs', methods=['POST'])
+def create_jobs():
+    """
+    Criar jobs de automação para um roteador
+    Espera: credenciais do roteador (routerType, endpoint, port, user, password, useHttps)
+    + um job {action, target, runAt, intervalSeconds, name, enabled} ou jobs: [...]
+    action: enable-peer | disable-peer | expire-peer | rotate-key; target: public-key do peer
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        for field in ROUTER_REQUIRED_FIELDS:
+            if not data.get(field):
+                return jsonify({'success': False, 'error': f'Campo obrigatório ausente: {field}'}), 400
+        router_class = registry.get(data['routerType'].lower())
+        if router_class is None or not hasattr(router_class, 'get_wireguard_peers'):
+            return jsonify({
+                'success': False,
+                'error': f"Automação não suportada para: {data['routerType']}",
+                'code': 'UNSUPPORTED_ROUTER'
+            }), 400
+        items = data.get('jobs') if isinstance(data.get('jobs'), list) else [data]
+        if not items or len(items) > MAX_JOBS_PER_REQUEST:
+            return jsonify({'success': False, 'error': f'Informe de 1 a {MAX_JOBS_PER_REQUEST} jobs'}), 400
+        try:
+            rows = [automation.build_job(item, data, data['password']) for item in items]
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e), 'code': 'INVALID_JOB'}), 400
+        ids = db.create_automation_jobs(rows)
+        automation_scheduler.wake()
+        return jsonify({'success': True, 'ids': ids}), 201
+    except Exception as e:
+        logger.error(f'Erro ao criar jobs de automação: {str(e)}')
+        return jsonify({'success': False, 'error': 'Erro ao criar jobs', 'code': 'AUTOMATION_ERROR'}), 500
+
+@automation_bp.route('/automation/jobs', methods=['GET'])
+def list_jobs():
+    """
+    Listar jobs por id
+    Query params: status (scheduled, done, failed), after (último id da página anterior), limit
+    """
+    try:
+        try:
+            limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+            after = int(request.args['after']) if request.args.get('after') else None
+        except ValueError:
+            return jsonify({'success': False, 'error': 'limit e after devem ser números'}), 400
+        rows = db.list_automation_jobs(status=request.args.get('status'), after_id=after, limit=limit)
+        return jsonify({
+            'success': True,
+            'data': [automation.public_job(row) for row in rows],
+            'next_after': rows[-1]['id'] if len(rows) == limit else None
+        })
+    except Exception as e:
+        logger.error(f'Erro ao listar jobs de automação: {str(e)}')
+        return jsonify({'success': False, 'error': 'Erro ao listar jobs', 'code': 'AUTOMATION_ERROR'}), 500
+
+@automation_bp.route('/automation/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    job = db.get_automation_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job não encontrado'}), 404
+    return jsonify({'success': True, 'data': automation.public_job(job)})
+
+@automation_bp.route('/automation/jobs/<int:job_id>', methods=['PATCH'])
+def update_job(job_id):
+    """
+    Alterar um job: enabled, runAt, intervalSeconds (null = execução única), name
+    Reativar um job concluído ou com falha: status 'scheduled'
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        job = db.get_automation_job(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': 'Job não encontrado'}), 404
+        fields = {}
+        try:
+            if 'runAt' in data:
+                fields['run_at'] = automation.parse_time(data['runAt'])
+            if 'intervalSeconds' in data:
+                fields['interval_seconds'] = automation.parse_interval(data['intervalSeconds'], job['action'])
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e), 'code': 'INVALID_JOB'}), 400
+        if 'enabled' in data:
+            fields['enabled'] = 1 if data['enabled'] else 0
+        if 'name' in data:
+            fields['name'] = data['name']
+        if data.get('status') == 'scheduled':
+            fields.update(status='scheduled', attempts=0)
+        if not db.update_automation_job(job_id, **fields):
+            return jsonify({'success': False, 'error': 'Job não encontrado'}), 404
+        automation_scheduler.wake()
+        return jsonify({'success': True, 'data': automation.public_job(db.get_automation_job(job_id))})
+    except Exception as e:
+        logger.error(f'Erro ao alterar job de automação: {str(e)}')
+        return jsonify({'success': False, 'error': 'Erro ao alterar job', 'code': 'AUTOMATION_ERROR'}), 500
+
+@automation_bp.route('/automation/jobs/<int:job_id>/run', methods=['POST'])
+def run_job(job_id):
+    """Antecipar a próxima execução para agora"""
+    if not db.update_automation_job(job_id, run_at=time.time(), status='scheduled', attempts=0):
+        return jsonify({'success': False, 'error': 'Job não encontrado'}), 404
+    automation_scheduler.wake()
+    return jsonify({'success': True})
+
+@automation_bp.route('/automation/jobs/<int:job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    if not db.delete_automation_job(job_id):
+        return jsonify({'success': False, 'error': 'Job não encontrado'}), 404
+    return jsonify({'success': True})
+
+@automation_bp.route('/automation/status', methods=['GET'])
+def scheduler_status():
+    """Estado do agendador neste worker (líder, fila, próxima execução)"""
+    return jsonify({'success': True, 'data': automation_scheduler.status()})
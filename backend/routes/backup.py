@@ -0,0 +1,171 @@
+from flask import Blueprint, request, jsonify, Response
+import itertools
+import logging
+import tarfile
+import zlib
+from datetime import datetime
+from config import Config
+from database import db
+from ndjson_stream import ndjson_lines, buffered, gzip_stream, tar_stream, open_input, iter_ndjson, iter_tar_ndjson
+from router_scheduler import scheduler, QueueTimeout
+from routes.router import build_router
+from routers.pagination import PageFetchError
+import reconcile
+
+logger = logging.getLogger(__name__)
+
+backup_bp = Blueprint('backup', __name__)
+
+def configured_router():
+    """Instantiate the router saved in configuracoes_roteador"""
+    config = db.get_router_config()
+    if not config:
+        return None, (jsonify({'success': False, 'error': 'Roteador não configurado'}), 400)
+    router, error = build_router({
+        'routerType': config['router_type'],
+        'endpoint': config['endpoint'],
+        'port': config.get('port'),
+        'user': config['user'],
+        'password': config['password'],
+        'useHttps': bool(config.get('use_https'))
+    }, ['routerType', 'endpoint', 'user', 'password'])
+    if error:
+        return None, error
+    if not hasattr(router, 'iter_wireguard_peers'):
+        return None, (jsonify({
+            'success': False,
+            'error': f'Exportação não suportada para: {router.get_router_type()}',
+            'code': 'UNSUPPORTED_ROUTER'
+        }), 400)
+    return router, None
+
+def stream_response(members, basename):
+    """
+    Stream (name, byte iterator) members as concatenated NDJSON or as a tar,
+    gzip-compressed on the fly unless gzip=0
+    Query params: format (ndjson | tar), gzip (1 | 0)
+    """
+    fmt = request.args.get('format', 'ndjson')
+    use_gzip = request.args.get('gzip', '1') != '0'
+    if fmt == 'tar':
+        body = tar_stream(members)
+        mimetype, extension = 'application/x-tar', 'tar'
+    else:
+        body = buffered(itertools.chain.from_iterable(chunks for _, chunks in members))
+        mimetype, extension = 'application/x-ndjson', 'ndjson'
+    if use_gzip:
+        body = gzip_stream(body, Config.EXPORT_GZIP_LEVEL)
+        mimetype, extension = 'application/gzip', extension + '.gz'
+    filename = f"{basename}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{extension}"
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"'
+    })
+
+def input_records():
+    """Records of an uploaded NDJSON or tar-of-NDJSON stream (gzip detected automatically)"""
+    stream = open_input(request.stream)
+    if request.args.get('format') == 'tar' or request.mimetype == 'application/x-tar':
+        return (record for _, record in iter_tar_ndjson(stream))
+    return iter_ndjson(stream)
+
+# Database export/import
+def table_records(table):
+    for row in db.iter_table_rows(table):
+        yield {'table': table, 'row': row}
+
+@backup_bp.route('/export/database', methods=['GET'])
+def export_database():
+    """Stream configuration tables as {"table", "row"} lines (passwords stay encrypted)"""
+    try:
+        members = [(f'{table}.ndjson', ndjson_lines(table_records(table))) for table in db.EXPORTABLE_TABLES]
+        return stream_response(members, 'wiredash-database')
+    except Exception as e:
+        logger.error(f'Error exporting database: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@backup_bp.route('/import/database', methods=['POST'])
+def import_database():
+    """
+    Restore configuration tables from an export. The whole upload is parsed and
+    validated first, then every table it contains is replaced in one transaction,
+    so a bad or truncated file changes nothing.
+    """
+    try:
+        tables = {}
+        count = 0
+        try:
+            for record in input_records():
+                if not isinstance(record, dict):
+                    return jsonify({'success': False, 'error': 'Registro inválido: esperado um objeto', 'code': 'INVALID_BACKUP'}), 400
+                table = record.get('table')
+                if table not in db.EXPORTABLE_TABLES:
+                    continue
+                row = record.get('row')
+                if not isinstance(row, dict):
+                    return jsonify({'success': False, 'error': f'Linha inválida em {table}: esperado um objeto', 'code': 'INVALID_BACKUP'}), 400
+                count += 1
+                if count > Config.IMPORT_MAX_ROWS:
+                    return jsonify({'success': False, 'error': f'Backup acima de {Config.IMPORT_MAX_ROWS} linhas', 'code': 'INVALID_BACKUP'}), 400
+                tables.setdefault(table, []).append(row)
+        except (ValueError, EOFError, tarfile.TarError, zlib.error) as e:
+            # JSON inválido, gzip/tar truncado ou corrompido
+            return jsonify({'success': False, 'error': f'Backup inválido: {str(e)}', 'code': 'INVALID_BACKUP'}), 400
+        imported = db.import_tables(tables)
+        return jsonify({'success': True, 'data': {'imported': imported}})
+    except Exception as e:
+        logger.error(f'Error importing database: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# Router WireGuard export/import (configured router)
+def router_records(kind, rows):
+    """Registros {"kind", "data"} lidos em fluxo; uma falha vira um registro de erro"""
+    try:
+        for item in rows:
+            yield {'kind': kind, 'data': item}
+    except PageFetchError as e:
+        yield {'kind': 'error', 'data': {'source': kind, 'error': e.result.get('error'), 'status': e.result.get('status')}}
+    except QueueTimeout as e:
+        yield {'kind': 'error', 'data': {'source': kind, 'error': str(e), 'status': 503, 'code': 'QUEUE_TIMEOUT'}}
+
+@backup_bp.route('/export/router', methods=['GET'])
+def export_router():
+    """Stream the configured router's WireGuard interfaces and peers (includes private keys)"""
+    try:
+        router, error = configured_router()
+        if error:
+            return error
+        # Cada leitura em fluxo ocupa uma vaga bulk do agendador enquanto é exportada
+        interfaces = scheduler.iter_rows(router, router.iter_rows(router.WIREGUARD_INTERFACES_PATH))
+        peers = scheduler.iter_rows(router, router.iter_wireguard_peers())
+        members = [
+            ('interfaces.ndjson', ndjson_lines(router_records('interface', interfaces))),
+            ('peers.ndjson', ndjson_lines(router_records('peer', peers))),
+        ]
+        return stream_response(members, 'wiredash-wireguard')
+    except Exception as e:
+        logger.error(f'Error exporting router: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@backup_bp.route('/import/router', methods=['POST'])
+def import_router():
+    """
+    Restore interfaces and peers into the configured router through the bulk lane
+    Query params: format (ndjson | tar), concurrency
+    """
+    try:
+        router, error = configured_router()
+        if error:
+            return error
+        summary, failure = reconcile.apply_stream(
+            router,
+            input_records(),
+            concurrency=request.args.get('concurrency', type=int),
+            request=lambda path, method, body: scheduler.request(router, path, method, body, lane='bulk'),
+            call=lambda run: scheduler.call(router, run, lane='bulk')
+        )
+        if failure:
+            return jsonify(failure), 503 if failure.get('code') == 'QUEUE_TIMEOUT' else 502
+        return jsonify({'success': summary['failed'] == 0, 'data': summary})
+    except Exception as e:
+        logger.error(f'Error importing router: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
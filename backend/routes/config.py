@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify
 import logging
+from config import Config
 from database import db
-import smtplib
-from email.message import EmailMessage
+from mailer import enqueue_email
+from key_rotation import key_rotation
 
 logger = logging.getLogger(__name__)
 
@@ -111,30 +112,55 @@ def test_smtp_send():
         smtp = db.get_smtp_config()
         if not smtp:
             return jsonify({'success': False, 'error': 'SMTP não configurado'}), 400
-        msg = EmailMessage()
-        msg['Subject'] = 'Teste de SMTP - WireGuard Manager'
-        msg['From'] = smtp.get('from_email') or smtp.get('username')
-        msg['To'] = to_email
-        msg.set_content('Este é um teste de envio SMTP. Se você recebeu este email, a configuração está correta.')
-        host = smtp.get('host')
-        port = int(smtp.get('port') or (587 if smtp.get('use_tls') else 25))
-        username = smtp.get('username')
-        password = smtp.get('password')
-        use_tls = bool(smtp.get('use_tls'))
-        use_ssl = bool(smtp.get('use_ssl'))
-        if use_ssl:
-            with smtplib.SMTP_SSL(host, port) as server:
-                if username and password:
-                    server.login(username, password)
-                server.send_message(msg)
-        else:
-            with smtplib.SMTP(host, port) as server:
-                if use_tls:
-                    server.starttls()
-                if username and password:
-                    server.login(username, password)
-                server.send_message(msg)
-        return jsonify({'success': True})
+        message_id = enqueue_email(
+            to_email,
+            'Teste de SMTP - WireGuard Manager',
+            'Este é um teste de envio SMTP. Se você recebeu este email, a configuração está correta.'
+        )
+        return jsonify({'success': True, 'data': {'id': message_id, 'status': 'pending'}})
     except Exception as e:
         logger.error(f'SMTP test send error: {str(e)}')
-        return jsonify({'success': False, 'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@config_bp.route('/config/smtp/outbox/<int:message_id>', methods=['GET'])
+def get_outbox_message(message_id):
+    """Delivery status of a queued email"""
+    try:
+        message = db.get_outbox_message(message_id)
+        if not message:
+            return jsonify({'success': False, 'error': 'Mensagem não encontrada'}), 404
+        return jsonify({'success': True, 'data': message})
+    except Exception as e:
+        logger.error(f'Error getting outbox message: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# Encryption key rotation endpoints
+@config_bp.route('/config/encryption/rotate', methods=['POST'])
+def start_key_rotation():
+    """Re-encrypt stored passwords with the current ENCRYPTION_KEY in the background"""
+    try:
+        data = request.get_json(silent=True) or {}
+        batch_size = data.get('batchSize')
+        if batch_size is not None:
+            # bool é int em Python; 0 ou negativo viraria LIMIT -1 (a tabela inteira)
+            if isinstance(batch_size, bool) or not isinstance(batch_size, int) \
+                    or not 1 <= batch_size <= Config.KEY_ROTATION_MAX_BATCH_SIZE:
+                return jsonify({
+                    'success': False,
+                    'error': f'batchSize deve ser um inteiro entre 1 e {Config.KEY_ROTATION_MAX_BATCH_SIZE}'
+                }), 400
+        started = key_rotation.start(batch_size=batch_size)
+        if not started:
+            return jsonify({'success': False, 'error': 'Rotação já em andamento', 'data': key_rotation.status}), 409
+        return jsonify({'success': True, 'data': key_rotation.status}), 202
+    except Exception as e:
+        logger.error(f'Error starting key rotation: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@config_bp.route('/config/encryption/rotate', methods=['GET'])
+def get_key_rotation_status():
+    try:
+        return jsonify({'success': True, 'data': key_rotation.status})
+    except Exception as e:
+        logger.error(f'Error getting key rotation status: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
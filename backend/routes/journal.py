@@ -0,0 +1,44 @@
+from flask import Blueprint, request, jsonify
+import logging
+from database import db
+from journal import journal
+
+logger = logging.getLogger(__name__)
+
+journal_bp = Blueprint('journal', __name__)
+
+@journal_bp.route('/journal', methods=['GET'])
+def get_journal():
+    """
+    Query proxied router operations, newest first
+    Query params: from, to (ISO timestamps), router, path (trailing * for prefix),
+    status, code, before_id, limit
+    """
+    try:
+        try:
+            limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+            status = int(request.args['status']) if request.args.get('status') else None
+            before_id = int(request.args['before_id']) if request.args.get('before_id') else None
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid numeric parameter'}), 400
+
+        # Entries still in this worker's buffer become visible immediately
+        journal.flush()
+        entries = db.query_journal(
+            start=request.args.get('from'),
+            end=request.args.get('to'),
+            router=request.args.get('router'),
+            path=request.args.get('path'),
+            status=status,
+            error_code=request.args.get('code'),
+            before_id=before_id,
+            limit=limit
+        )
+        return jsonify({
+            'success': True,
+            'data': entries,
+            'next_before_id': entries[-1]['id'] if len(entries) == limit else None
+        })
+    except Exception as e:
+        logger.error(f'Error querying API journal: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,58 @@
+from flask import Blueprint, request, jsonify, Response
+import logging
+from profiling import request_profiler, authorized, export
+
+logger = logging.getLogger(__name__)
+
+profiling_bp = Blueprint('profiling', __name__)
+
+@profiling_bp.before_request
+def require_profiling_token():
+    """Profiles expose code paths and timings: admin token only"""
+    if not authorized(request.headers.get('X-Profile-Token')):
+        return jsonify({'success': False, 'error': 'Forbidden', 'code': 'FORBIDDEN'}), 403
+
+@profiling_bp.route('/profiles', methods=['GET'])
+def list_profiles():
+    """Stored profiles, newest first"""
+    try:
+        return jsonify({'success': True, 'data': request_profiler.store.list()})
+    except Exception as e:
+        logger.error(f'Error listing profiles: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@profiling_bp.route('/profiles/<profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    """
+    Download a profile
+    Query params: format (sampler: speedscope | collapsed; cprofile: pstats | text)
+    """
+    try:
+        try:
+            meta, data = request_profiler.store.get(profile_id)
+        except ValueError:
+            meta = None
+        if meta is None:
+            return jsonify({'success': False, 'error': 'Profile not found'}), 404
+        exported = export(meta, data, request.args.get('format'))
+        if exported is None:
+            return jsonify({'success': False, 'error': f"Unsupported format for {meta['mode']} profile"}), 400
+        body, mimetype, extension = exported
+        return Response(body, mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename="profile-{profile_id}.{extension}"'
+        })
+    except Exception as e:
+        logger.error(f'Error exporting profile: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@profiling_bp.route('/profiles/<profile_id>', methods=['DELETE'])
+def delete_profile(profile_id):
+    """Delete a stored profile"""
+    try:
+        request_profiler.store.delete(profile_id)
+        return jsonify({'success': True})
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Profile not found'}), 404
+    except Exception as e:
+        logger.error(f'Error deleting profile: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
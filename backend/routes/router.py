@@ -1,25 +1,110 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, g
 import logging
-from routers.mikrotik import MikrotikRouter
-from routers.opnsense import OPNsenseRouter
-from routers.pfsense import PfsenseRouter
+from config import Config
+from etag_cache import TagCache, etag_for_result, etag_matches
+from shared_cache import shared_cache
+from journal import journal
+import reconcile
+import peer_analytics
+import firewall_index
+import prefix_index
+from router_scheduler import scheduler
+from write_queue import write_queue, is_offline
+import functools
+import hashlib
+import hmac
+import ipaddress
+import time
+from routers.registry import registry
+from database import db
+from session_tokens import session_tokens, bearer_token, TokenError
+from routers.pagination import collect
 
 logger = logging.getLogger(__name__)
 
 router_bp = Blueprint('router', __name__)
 
-# Mapeamento dos tipos de roteadores
-ROUTER_CLASSES = {
-    'mikrotik': MikrotikRouter,
-    'opnsense': OPNsenseRouter,
-    'pfsense': PfsenseRouter
-}
+# Campos do envelope completo que o envelope compacto omite
+COMPACT_DROPPED_FIELDS = ('headers', 'url', 'method', 'router_type', 'protocol')
+
+# ETags recentes por roteador/path para GETs feitos via proxy
+tag_cache = TagCache(max_entries=Config.ETAG_CACHE_SIZE)
+
+def build_router(data, required_fields):
+    """
+    Validar campos obrigatórios e instanciar a classe específica do roteador
+    Retorna (router, None) ou (None, resposta de erro)
+    """
+    for field in required_fields:
+        if field not in data or not data[field]:
+            return None, (jsonify({'error': f'Campo obrigatório ausente: {field}'}), 400)
+    
+    router_type = data['routerType'].lower()
+    
+    # Verificar se o tipo de roteador é suportado (o driver é importado no primeiro uso)
+    router_class = registry.get(router_type)
+    if router_class is None:
+        return None, (jsonify({
+            'error': f'Tipo de roteador não suportado: {router_type}',
+            'supported_types': registry.supported_types()
+        }), 400)
+    
+    return router_class(
+        endpoint=data['endpoint'],
+        port=data.get('port', ''),
+        user=data['user'],
+        password=data['password'],
+        use_https=data.get('useHttps', False)
+    ), None
+
+def shape_result(result, envelope):
+    """Aplicar o formato de envelope solicitado ao resultado do roteador"""
+    if envelope != 'compact':
+        return result
+    return {key: value for key, value in result.items() if key not in COMPACT_DROPPED_FIELDS}
+
+@functools.lru_cache(maxsize=1)
+def cache_key_secret():
+    """Segredo aleatório do servidor (tabela server_secrets) para as chaves do cache"""
+    return bytes.fromhex(db.get_server_secret('cache-keys'))
+
+def shared_cache_key(router_type, data):
+    """
+    Chave do cache compartilhado: inclui um HMAC da senha (com segredo do servidor)
+    para não vazar entre credenciais nem permitir quebrar a senha a partir do arquivo
+    """
+    secret = hmac.new(cache_key_secret(), data['password'].encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+    return 'proxy:%s:%s:%s:%s:%s:%s' % (
+        router_type, data['endpoint'], data.get('port', ''), data['user'], secret, data['path']
+    )
+
+def request_actor():
+    """
+    Identificar quem fez a operação: o usuário do token de sessão (já validado
+    pelo before_request com AUTH_REQUIRED, senão verificado aqui); sem token
+    válido, o header X-User-Email (não autenticado) ou o IP
+    """
+    user_id = g.get('user_id')
+    if user_id is None and bearer_token():
+        try:
+            user_id = session_tokens.current_claims()['sub']
+        except TokenError:
+            user_id = None
+    if user_id is not None:
+        return f'user:{user_id}'
+    return request.headers.get('X-User-Email') or request.remote_addr
+
+def request_lane(data, default='interactive'):
+    """Fila de prioridade da requisição: campo priority ou header X-Request-Priority"""
+    return (data.get('priority') or request.headers.get('X-Request-Priority') or default).lower()
 
 @router_bp.route('/router/proxy', methods=['POST'])
 def router_proxy():
     """
     Proxy genérico para requisições de API de diferentes roteadores
     Espera um JSON com: routerType, endpoint, port, user, password, useHttps, path
+    Opcional: envelope ('full' ou 'compact'), cacheTtl (segundos, apenas GET),
+    priority ('interactive' ou 'bulk'), queue (false: não usar a fila de escritas)
     """
     try:
         # Validar se é uma requisição JSON
@@ -28,39 +113,70 @@ def router_proxy():
         
         data = request.get_json()
         
-        # Validar campos obrigatórios
-        required_fields = ['routerType', 'endpoint', 'user', 'password', 'path']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return jsonify({'error': f'Campo obrigatório ausente: {field}'}), 400
-        
-        router_type = data['routerType'].lower()
-        
-        # Verificar se o tipo de roteador é suportado
-        if router_type not in ROUTER_CLASSES:
-            return jsonify({
-                'error': f'Tipo de roteador não suportado: {router_type}',
-                'supported_types': list(ROUTER_CLASSES.keys())
-            }), 400
-        
-        # Instanciar a classe específica do roteador
-        router_class = ROUTER_CLASSES[router_type]
-        router = router_class(
-            endpoint=data['endpoint'],
-            port=data.get('port', ''),
-            user=data['user'],
-            password=data['password'],
-            use_https=data.get('useHttps', False)
-        )
+        router, error = build_router(data, ['routerType', 'endpoint', 'user', 'password', 'path'])
+        if error:
+            return error
+        router_type = router.get_router_type()
         
         # Fazer a requisição através da classe específica
-        result = router.make_request(
+        method = data.get('method', 'GET').upper()
+        started = time.perf_counter()
+        lane = request_lane(data)
+        cache_ttl = data.get('cacheTtl')
+        if cache_ttl:
+            try:
+                cache_ttl = float(cache_ttl)
+            except (TypeError, ValueError):
+                cache_ttl = -1
+            if not 0 < cache_ttl < float('inf'):
+                return jsonify({'error': 'cacheTtl deve ser um número positivo de segundos'}), 400
+        if method == 'GET' and cache_ttl:
+            # Leitura compartilhada entre workers: apenas um consulta o roteador
+            result = shared_cache.get_or_compute(
+                shared_cache_key(router_type, data),
+                lambda: scheduler.request(router, data['path'], method, lane=lane),
+                ttl=cache_ttl,
+                cache_if=lambda value: value.get('success') and 200 <= value.get('status', 0) < 300
+            )
+        elif write_queue.should_queue(data, method) and write_queue.has_pending(data):
+            # Roteador com escritas pendentes: entra na fila atrás delas, sem tentar
+            result = write_queue.enqueue(data, method, actor=request_actor())
+        else:
+            result = scheduler.request(router, data['path'], method, data.get('body'), lane=lane)
+            if is_offline(result) and write_queue.should_queue(data, method):
+                result = write_queue.enqueue(data, method, actor=request_actor(), failure=result)
+        
+        journal.record(
+            actor=request_actor(),
+            router_type=router_type,
+            router_endpoint=router.base_url,
             path=data['path'],
-            method=data.get('method', 'GET'),
-            body=data.get('body')
+            method=method,
+            status=result.get('status'),
+            duration_ms=round((time.perf_counter() - started) * 1000, 2),
+            error_code=result.get('code')
         )
         
-        return jsonify(result), result.get('status', 200)
+        # GET bem-sucedido: ETag forte e resposta condicional (If-None-Match)
+        etag = None
+        if method == 'GET' and result.get('success') and 200 <= result.get('status', 0) < 300:
+            last_response = getattr(router, 'last_response', None)
+            etag = etag_for_result(
+                tag_cache,
+                (router_type, router.endpoint, router.port, router.user, data['path']),
+                result,
+                last_response.content if last_response is not None else None,
+                lambda payload: current_app.json.dumps_bytes(payload, sort_keys=True)
+            )
+            if etag_matches(request.headers.get('If-None-Match'), etag):
+                return '', 304, {'ETag': etag}
+        
+        envelope = data.get('envelope') or request.args.get('envelope') or Config.RESPONSE_ENVELOPE
+        response = jsonify(shape_result(result, envelope))
+        response.status_code = result.get('status', 200)
+        if etag:
+            response.headers['ETag'] = etag
+        return response
         
     except Exception as e:
         logger.error(f'Erro interno: {str(e)}')
@@ -78,30 +194,9 @@ def test_router_connection():
     try:
         data = request.get_json()
         
-        # Validar campos obrigatórios
-        required_fields = ['routerType', 'endpoint', 'user', 'password']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return jsonify({'error': f'Campo obrigatório ausente: {field}'}), 400
-        
-        router_type = data['routerType'].lower()
-        
-        # Verificar se o tipo de roteador é suportado
-        if router_type not in ROUTER_CLASSES:
-            return jsonify({
-                'error': f'Tipo de roteador não suportado: {router_type}',
-                'supported_types': list(ROUTER_CLASSES.keys())
-            }), 400
-        
-        # Instanciar a classe específica do roteador
-        router_class = ROUTER_CLASSES[router_type]
-        router = router_class(
-            endpoint=data['endpoint'],
-            port=data.get('port', ''),
-            user=data['user'],
-            password=data['password'],
-            use_https=data.get('useHttps', False)
-        )
+        router, error = build_router(data, ['routerType', 'endpoint', 'user', 'password'])
+        if error:
+            return error
         
         # Testar conexão usando o método específico de cada roteador
         result = router.test_connection()
@@ -114,4 +209,369 @@ def test_router_connection():
             'success': False,
             'error': 'Erro no teste de conexão',
             'code': 'TEST_ERROR'
-        }), 500
\ No newline at end of file
+        }), 500
+
+@router_bp.route('/router/reconcile', methods=['POST'])
+def reconcile_wireguard():
+    """
+    Levar o WireGuard do roteador ao estado desejado com o mínimo de operações
+    Espera: credenciais do roteador + desired {interfaces: [...], peers: [...]}
+    Opcional: prune (remove itens não listados), dryRun (apenas o plano), concurrency,
+    checkOverlaps (valida allowed-address contra rotas e peers; force aplica mesmo assim),
+    batch (Mikrotik: aplica tudo num único script), atomic (com batch; padrão true)
+    """
+    try:
+        data = request.get_json()
+        router, error = build_router(data, ['routerType', 'endpoint', 'user', 'password', 'desired'])
+        if error:
+            return error
+        if not hasattr(router, 'get_wireguard_peers'):
+            return jsonify({
+                'success': False,
+                'error': f'Reconciliação não suportada para: {router.get_router_type()}',
+                'code': 'UNSUPPORTED_ROUTER'
+            }), 400
+        
+        lane = request_lane(data, default='bulk')
+        operations, failure = reconcile.plan(
+            router, data['desired'], prune=bool(data.get('prune')),
+            call=lambda run: scheduler.call(router, run, lane=lane)
+        )
+        if failure:
+            return jsonify(failure), 503 if failure.get('code') == 'QUEUE_TIMEOUT' else 502
+        
+        conflicts = []
+        if data.get('checkOverlaps'):
+            index, failure = load_prefix_index(router, data, refresh=True)
+            if failure:
+                return jsonify(failure), failure.get('status') or 502
+            conflicts = overlap_precheck(index, operations)
+        
+        dry_run = bool(data.get('dryRun'))
+        if conflicts and not data.get('force'):
+            return jsonify({
+                'success': False,
+                'error': 'allowed-address em conflito com rotas ou outros peers',
+                'code': 'ADDRESS_CONFLICT',
+                'conflicts': conflicts,
+                'operations': reconcile.public(operations)
+            }), 409
+        if not dry_run:
+            if data.get('batch') and hasattr(router, 'batch_write'):
+                # Um único script no roteador, com rollback no modo atômico
+                reconcile.apply_batch(
+                    router, operations, atomic=data.get('atomic', True) is not False,
+                    call=lambda run: scheduler.call(router, run, lane=lane)
+                )
+            else:
+                reconcile.apply(
+                    router, operations, concurrency=data.get('concurrency'),
+                    request=lambda path, method, body: scheduler.request(router, path, method, body, lane=lane)
+                )
+        
+        summary = reconcile.summarize(operations)
+        return jsonify({
+            'success': summary['failed'] == 0 and summary['invalid'] == 0,
+            'dry_run': dry_run,
+            'summary': summary,
+            'conflicts': conflicts,
+            'operations': reconcile.public(operations)
+        })
+        
+    except Exception as e:
+        logger.error(f'Erro na reconciliação: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Erro na reconciliação',
+            'code': 'RECONCILE_ERROR'
+        }), 500
+
+@router_bp.route('/router/wireguard/analytics', methods=['POST'])
+def wireguard_analytics():
+    """
+    Agregados dos peers WireGuard: top-N por tráfego, peers sem handshake recente
+    e histograma de idade do handshake por interface
+    Espera: credenciais do roteador
+    Opcional: metric (rx, tx, total), top, staleAfter (segundos), staleLimit,
+    bins (limites em segundos), refresh (ignora o snapshot em cache)
+    """
+    try:
+        data = request.get_json()
+        router, error = build_router(data, ['routerType', 'endpoint', 'user', 'password'])
+        if error:
+            return error
+        if not hasattr(router, 'iter_wireguard_peers'):
+            return jsonify({
+                'success': False,
+                'error': f'Análise não suportada para: {router.get_router_type()}',
+                'code': 'UNSUPPORTED_ROUTER'
+            }), 400
+        
+        metric = data.get('metric', 'total')
+        if metric not in peer_analytics.METRICS:
+            return jsonify({'error': f'metric deve ser um de: {", ".join(peer_analytics.METRICS)}'}), 400
+        try:
+            top = int(data.get('top', 10))
+            stale_after = float(data.get('staleAfter', 86400))
+            stale_limit = int(data.get('staleLimit', 1000))
+            bins = tuple(float(b) for b in data.get('bins') or peer_analytics.DEFAULT_HISTOGRAM_BINS)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'top, staleAfter, staleLimit e bins devem ser numéricos'}), 400
+        
+        key = shared_cache_key(router.get_router_type(), {**data, 'path': router.WIREGUARD_PEERS_PATH})
+        snapshot, failure = peer_analytics.load_snapshot(
+            peer_analytics.snapshots,
+            key,
+            # Leitura em fluxo, só com os campos usados nos agregados
+            lambda: scheduler.call(
+                router,
+                lambda: collect(router.iter_wireguard_peers(fields=peer_analytics.SNAPSHOT_FIELDS), lambda rows: rows),
+                lane=request_lane(data)
+            ),
+            refresh=bool(data.get('refresh'))
+        )
+        if failure:
+            return jsonify(failure), failure.get('status') or 502
+        
+        return jsonify({
+            'success': True,
+            'snapshot': snapshot.describe(),
+            'summary': snapshot.summary(),
+            'top': {'metric': metric, 'peers': snapshot.top(metric, top)},
+            'stale': snapshot.stale(stale_after, stale_limit),
+            'handshake_histogram': snapshot.histogram(bins)
+        })
+        
+    except Exception as e:
+        logger.error(f'Erro na análise de peers: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Erro na análise de peers',
+            'code': 'ANALYTICS_ERROR'
+        }), 500
+
+def firewall_router(data):
+    """Instanciar o roteador e verificar suporte ao modelo normalizado de firewall"""
+    router, error = build_router(data, ['routerType', 'endpoint', 'user', 'password'])
+    if error:
+        return None, error
+    if not hasattr(router, 'get_normalized_firewall_rules'):
+        return None, (jsonify({
+            'success': False,
+            'error': f'Firewall normalizado não suportado para: {router.get_router_type()}',
+            'code': 'UNSUPPORTED_ROUTER'
+        }), 400)
+    return router, None
+
+@router_bp.route('/router/firewall/rules', methods=['POST'])
+def normalized_firewall_rules():
+    """
+    Regras de firewall no modelo normalizado, comum aos fabricantes
+    Espera: credenciais do roteador
+    """
+    try:
+        data = request.get_json()
+        router, error = firewall_router(data)
+        if error:
+            return error
+        
+        result = scheduler.call(router, router.get_normalized_firewall_rules, lane=request_lane(data))
+        if not result.get('success') or result.get('status', 0) >= 400:
+            return jsonify(result), result.get('status') or 502
+        
+        return jsonify({
+            'success': True,
+            'router_type': router.get_router_type(),
+            'rules': [rule.to_dict() for rule in result['data']]
+        })
+        
+    except Exception as e:
+        logger.error(f'Erro ao normalizar regras de firewall: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Erro ao obter regras de firewall',
+            'code': 'FIREWALL_ERROR'
+        }), 500
+
+@router_bp.route('/router/firewall/match', methods=['POST'])
+def firewall_match():
+    """
+    Primeira regra de firewall que casa com um tráfego
+    Espera: credenciais do roteador + query {src, dst, protocol, srcPort, dstPort,
+    chain, inInterface, outInterface} (ou queries: [...])
+    Opcional: refresh (reconstrói o índice)
+    """
+    try:
+        data = request.get_json()
+        router, error = firewall_router(data)
+        if error:
+            return error
+        
+        raw_queries = data.get('queries') or [data.get('query') or {}]
+        try:
+            queries = [firewall_index.parse_query(query) for query in raw_queries]
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        key = shared_cache_key(router.get_router_type(), {**data, 'path': 'firewall-index'})
+        index, failure = firewall_index.load_index(
+            firewall_index.indexes,
+            key,
+            lambda: scheduler.call(router, router.get_normalized_firewall_rules, lane=request_lane(data)),
+            refresh=bool(data.get('refresh'))
+        )
+        if failure:
+            return jsonify(failure), failure.get('status') or 502
+        
+        results = []
+        for query in queries:
+            started = time.perf_counter()
+            matches = index.match(query)
+            results.append({
+                'matches': matches,
+                'lookup_us': round((time.perf_counter() - started) * 1e6, 1)
+            })
+        
+        return jsonify({
+            'success': True,
+            'index': index.describe(),
+            'results': results
+        })
+        
+    except Exception as e:
+        logger.error(f'Erro na consulta de firewall: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Erro na consulta de firewall',
+            'code': 'FIREWALL_ERROR'
+        }), 500
+
+def load_prefix_index(router, data, refresh=False):
+    """Índice de rotas + allowed-address do roteador (em cache por PREFIX_INDEX_TTL)"""
+    lane = request_lane(data)
+    return prefix_index.load_index(
+        prefix_index.indexes,
+        shared_cache_key(router.get_router_type(), {**data, 'path': 'prefix-index'}),
+        lambda: scheduler.call(router, lambda: collect(router.iter_routes(fields=prefix_index.ROUTE_FIELDS), lambda rows: rows), lane=lane),
+        lambda: scheduler.call(router, lambda: collect(router.iter_wireguard_peers(fields=prefix_index.PEER_FIELDS), lambda rows: rows), lane=lane),
+        refresh=refresh
+    )
+
+def overlap_precheck(index, operations):
+    """Conflitos dos peers criados/alterados por um plano de reconciliação"""
+    conflicts = []
+    for op in operations:
+        if op['kind'] != 'peer' or op['action'] not in ('create', 'update'):
+            continue
+        if 'allowed-address' not in (op.get('body') or {}):
+            continue
+        existing_id = op['path'].rsplit('/', 1)[1] if op['action'] == 'update' else None
+        # Um update traz só os campos alterados: interface e demais vêm da linha atual
+        current = index.peers.get(existing_id, {}) if existing_id else {}
+        peer = {**current, **op['body'], '.id': existing_id,
+                'public-key': op['body'].get('public-key') or current.get('public-key') or op['key']}
+        for conflict in index.check(peer, exclude_id=existing_id, exclude_key=peer['public-key']):
+            conflicts.append({'key': op['key'], **conflict})
+    return conflicts
+
+def prefix_router(data):
+    """Instanciar o roteador e verificar suporte a rotas + peers WireGuard"""
+    router, error = build_router(data, ['routerType', 'endpoint', 'user', 'password'])
+    if error:
+        return None, error
+    if not hasattr(router, 'iter_routes') or not hasattr(router, 'iter_wireguard_peers'):
+        return None, (jsonify({
+            'success': False,
+            'error': f'Índice de prefixos não suportado para: {router.get_router_type()}',
+            'code': 'UNSUPPORTED_ROUTER'
+        }), 400)
+    return router, None
+
+@router_bp.route('/router/wireguard/overlaps', methods=['POST'])
+def wireguard_overlaps():
+    """
+    Sobreposições entre allowed-address dos peers e a tabela de rotas
+    Espera: credenciais do roteador
+    Opcional: refresh
+    """
+    try:
+        data = request.get_json()
+        router, error = prefix_router(data)
+        if error:
+            return error
+        index, failure = load_prefix_index(router, data, refresh=bool(data.get('refresh')))
+        if failure:
+            return jsonify(failure), failure.get('status') or 502
+        return jsonify({'success': True, 'index': index.describe(), **index.overlaps()})
+        
+    except Exception as e:
+        logger.error(f'Erro na análise de sobreposições: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Erro na análise de sobreposições',
+            'code': 'OVERLAP_ERROR'
+        }), 500
+
+@router_bp.route('/router/wireguard/peers/check', methods=['POST'])
+def wireguard_peer_check():
+    """
+    Validar os allowed-address de um peer antes de criar ou editar
+    Espera: credenciais do roteador + peer {allowed-address, interface, public-key, .id}
+    Opcional: refresh
+    """
+    try:
+        data = request.get_json()
+        router, error = prefix_router(data)
+        if error:
+            return error
+        peer = data.get('peer') or {}
+        if not peer.get('allowed-address'):
+            return jsonify({'error': 'Campo obrigatório ausente: peer.allowed-address'}), 400
+        index, failure = load_prefix_index(router, data, refresh=bool(data.get('refresh')))
+        if failure:
+            return jsonify(failure), failure.get('status') or 502
+        started = time.perf_counter()
+        conflicts = index.check(peer, exclude_id=peer.get('.id'), exclude_key=peer.get('public-key'))
+        return jsonify({
+            'success': True,
+            'ok': not conflicts,
+            'conflicts': conflicts,
+            'check_us': round((time.perf_counter() - started) * 1e6, 1),
+            'index': index.describe()
+        })
+        
+    except Exception as e:
+        logger.error(f'Erro na validação do peer: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Erro na validação do peer',
+            'code': 'OVERLAP_ERROR'
+        }), 500
+
+@router_bp.route('/router/routes/lookup', methods=['POST'])
+def route_lookup():
+    """
+    Longest-prefix-match de um endereço sobre rotas e allowed-address
+    Espera: credenciais do roteador + address
+    """
+    try:
+        data = request.get_json()
+        router, error = prefix_router(data)
+        if error:
+            return error
+        try:
+            address = str(ipaddress.ip_address(str(data.get('address', '')).strip()))
+        except ValueError:
+            return jsonify({'error': 'address deve ser um endereço IP'}), 400
+        index, failure = load_prefix_index(router, data, refresh=bool(data.get('refresh')))
+        if failure:
+            return jsonify(failure), failure.get('status') or 502
+        return jsonify({'success': True, 'address': address, 'matches': index.lookup(address)})
+        
+    except Exception as e:
+        logger.error(f'Erro na consulta de rota: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Erro na consulta de rota',
+            'code': 'OVERLAP_ERROR'
+        }), 500
@@ -0,0 +1,45 @@
+from flask import Blueprint, request, jsonify
+import logging
+from profiling import authorized
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+tracing_bp = Blueprint('tracing', __name__)
+
+@tracing_bp.before_request
+def require_profiling_token():
+    """Traces expose queries and router paths: same admin token as profiling"""
+    if not authorized(request.headers.get('X-Profile-Token')):
+        return jsonify({'success': False, 'error': 'Forbidden', 'code': 'FORBIDDEN'}), 403
+
+@tracing_bp.route('/traces', methods=['GET'])
+def list_traces():
+    """
+    Recent traces from the in-memory buffer, newest first
+    Query params: name (substring of any span name), minDurationMs, limit (default 50, max 500)
+    """
+    try:
+        try:
+            limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+            min_duration = request.args.get('minDurationMs')
+            min_duration = float(min_duration) if min_duration not in (None, '') else None
+        except ValueError:
+            return jsonify({'success': False, 'error': 'limit and minDurationMs must be numbers'}), 400
+        traces = tracer.query(name=request.args.get('name') or None, min_duration_ms=min_duration, limit=limit)
+        return jsonify({'success': True, 'data': traces})
+    except Exception as e:
+        logger.error(f'Error listing traces: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@tracing_bp.route('/traces/<trace_id>', methods=['GET'])
+def get_trace(trace_id):
+    """All buffered spans of one trace"""
+    try:
+        traces = tracer.query(trace_id=trace_id.lower(), limit=1)
+        if not traces:
+            return jsonify({'success': False, 'error': 'Trace not found'}), 404
+        return jsonify({'success': True, 'data': traces[0]})
+    except Exception as e:
+        logger.error(f'Error reading trace: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -1,17 +1,53 @@
 from flask import Blueprint, request, jsonify
 import logging
+import base64
+import json
+from config import Config
 from database import db
+from session_tokens import session_tokens
 
 logger = logging.getLogger(__name__)
 
 users_bp = Blueprint('users', __name__)
 
+def encode_cursor(cursor):
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    padded = token + '=' * (-len(token) % 4)
+    created_at, user_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    return created_at, int(user_id)
+
 @users_bp.route('/users', methods=['GET'])
 def get_users():
-    """Get all users"""
+    """
+    List users, one keyset page at a time
+    Query params: limit, cursor, q (name/email prefix), fields (comma separated), total=exact
+    """
     try:
-        users = db.get_users()
-        return jsonify({'success': True, 'data': users})
+        try:
+            limit = min(max(int(request.args.get('limit', Config.USERS_PAGE_SIZE)), 1), Config.USERS_MAX_PAGE_SIZE)
+            cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        except (ValueError, TypeError):
+            return jsonify({'success': False, 'error': 'Invalid limit or cursor'}), 400
+        fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] or None
+
+        users, next_cursor, total = db.list_users(
+            limit,
+            cursor=cursor,
+            search=request.args.get('q', '').strip() or None,
+            fields=fields,
+            include_total=request.args.get('total') == 'exact'
+        )
+        return jsonify({
+            'success': True,
+            'data': users,
+            'pagination': {
+                'limit': limit,
+                'next_cursor': encode_cursor(next_cursor) if next_cursor else None,
+                'total': total
+            }
+        })
     except Exception as e:
         logger.error(f'Error getting users: {str(e)}')
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -49,6 +85,8 @@ def update_user(user_id):
     try:
         data = request.get_json()
         db.update_user(user_id, **data)
+        # Disabling or a password change revokes tokens (trigger); apply it here right away
+        session_tokens.refresh_revocations(force=True)
         return jsonify({'success': True})
     except Exception as e:
         logger.error(f'Error updating user: {str(e)}')
@@ -59,6 +97,7 @@ def delete_user(user_id):
     """Delete user"""
     try:
         db.delete_user(user_id)
+        session_tokens.refresh_revocations(force=True)
         return jsonify({'success': True})
     except Exception as e:
         logger.error(f'Error deleting user: {str(e)}')
@@ -0,0 +1,65 @@
+from flask import Blueprint, request, jsonify
+import logging
+import write_queue as queue
+from write_queue import write_queue
+from database import db
+
+logger = logging.getLogger(__name__)
+
+write_queue_bp = Blueprint('write_queue', __name__)
+
+@write_queue_bp.route('/write-queue', methods=['GET'])
+def queue_status():
+    """
+    Estado da fila de escritas: por roteador, alcance (online/offline), próximo
+    teste de conexão, último erro e contagem por status; mais o envio neste worker
+    """
+    try:
+        return jsonify({
+            'success': True,
+            'data': {'routers': db.write_queue_summary(), 'sender': write_queue.status()}
+        })
+    except Exception as e:
+        logger.error(f'Erro ao consultar a fila de escritas: {str(e)}')
+        return jsonify({'success': False, 'error': 'Erro ao consultar a fila', 'code': 'WRITE_QUEUE_ERROR'}), 500
+
+@write_queue_bp.route('/write-queue/entries', methods=['GET'])
+def list_entries():
+    """
+    Listar escritas por id
+    Query params: router (chave do roteador), status (pending, done, failed,
+    coalesced, cancelled), after (último id da página anterior), limit
+    """
+    try:
+        try:
+            limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+            after = int(request.args['after']) if request.args.get('after') else None
+        except ValueError:
+            return jsonify({'success': False, 'error': 'limit e after devem ser números'}), 400
+        rows = db.list_writes(
+            router_key=request.args.get('router'), status=request.args.get('status'),
+            after_id=after, limit=limit
+        )
+        return jsonify({
+            'success': True,
+            'data': [queue.public_entry(row) for row in rows],
+            'next_after': rows[-1]['id'] if len(rows) == limit else None
+        })
+    except Exception as e:
+        logger.error(f'Erro ao listar a fila de escritas: {str(e)}')
+        return jsonify({'success': False, 'error': 'Erro ao listar a fila', 'code': 'WRITE_QUEUE_ERROR'}), 500
+
+@write_queue_bp.route('/write-queue/entries/<int:entry_id>', methods=['DELETE'])
+def cancel_entry(entry_id):
+    """Cancelar uma escrita pendente que ainda não está sendo enviada"""
+    if not db.cancel_write(entry_id):
+        return jsonify({'success': False, 'error': 'Escrita não encontrada ou já enviada'}), 404
+    return jsonify({'success': True})
+
+@write_queue_bp.route('/write-queue/flush', methods=['POST'])
+def flush():
+    """Testar a conexão e enviar já, sem esperar o recuo. Opcional: router (chave do roteador)"""
+    data = request.get_json(silent=True) or {}
+    if not write_queue.flush_now(data.get('router')):
+        return jsonify({'success': False, 'error': 'Roteador sem fila'}), 404
+    return jsonify({'success': True})
@@ -0,0 +1,186 @@
+"""
+Tokens de sessão assinados com HMAC-SHA256
+
+O login emite um token de acesso curto (AUTH_ACCESS_TOKEN_TTL) e um token de
+renovação (AUTH_REFRESH_TOKEN_TTL). Verificar um token é um HMAC e uma consulta
+a um dicionário em memória, sem SQLite nem bcrypt por requisição.
+
+Revogação: a tabela token_revocations guarda, por usuário, o instante a partir
+do qual os tokens voltam a valer; triggers em usuarios a atualizam quando o
+usuário é desativado, troca de senha ou é removido. Cada worker mantém uma cópia
+em memória e lê apenas as linhas novas (por seq) no máximo a cada
+AUTH_REVOCATION_POLL segundos, então a desativação chega a todos os workers
+nesse intervalo.
+
+Formato: v1.<payload base64url>.<assinatura base64url>, payload
+{"sub": id do usuário, "typ": "access" | "refresh", "iat": emissão, "exp": expiração}.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+
+from flask import g, jsonify, request
+
+from config import Config
+from database import db
+
+logger = logging.getLogger(__name__)
+
+TOKEN_VERSION = 'v1'
+
+
+class TokenError(Exception):
+    """Token inválido, expirado ou revogado (code: TOKEN_INVALID, TOKEN_EXPIRED, TOKEN_REVOKED)"""
+
+    def __init__(self, message, code='TOKEN_INVALID'):
+        super().__init__(message)
+        self.code = code
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _secret():
+    if Config.AUTH_TOKEN_SECRET:
+        return Config.AUTH_TOKEN_SECRET.encode('utf-8')
+    # Sem segredo próprio, usa o aleatório gerado no banco (igual em todos os workers)
+    return bytes.fromhex(db.get_server_secret('session-tokens'))
+
+
+def bearer_token():
+    """Token do header Authorization: Bearer <token>, ou None"""
+    scheme, _, token = (request.headers.get('Authorization') or '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+
+class SessionTokens:
+    """Emissão e verificação dos tokens, com a cópia local das revogações"""
+
+    def __init__(self, secret=None):
+        self._secret = secret
+        self._revocations = {}
+        self._seq = 0
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def secret(self):
+        # Lido no primeiro uso: o módulo é importado antes de init_database criar o segredo
+        if self._secret is None:
+            self._secret = _secret()
+        return self._secret
+
+    def _sign(self, signing_input):
+        return hmac.new(self.secret, signing_input.encode('ascii'), hashlib.sha256).digest()
+
+    def issue(self, user_id, kind='access', now=None):
+        """(token, expira_em) para o usuário"""
+        now = time.time() if now is None else now
+        ttl = Config.AUTH_ACCESS_TOKEN_TTL if kind == 'access' else Config.AUTH_REFRESH_TOKEN_TTL
+        expires_at = int(now + ttl)
+        payload = json.dumps(
+            {'sub': user_id, 'typ': kind, 'iat': now, 'exp': expires_at},
+            separators=(',', ':')
+        ).encode('utf-8')
+        signing_input = f'{TOKEN_VERSION}.{_b64encode(payload)}'
+        return f'{signing_input}.{_b64encode(self._sign(signing_input))}', expires_at
+
+    def issue_pair(self, user_id):
+        """Par de tokens devolvido pelo login e pela renovação"""
+        now = time.time()
+        access_token, _ = self.issue(user_id, 'access', now)
+        refresh_token, _ = self.issue(user_id, 'refresh', now)
+        return {
+            'access_token': access_token,
+            'refresh_token': refresh_token,
+            'token_type': 'Bearer',
+            'expires_in': Config.AUTH_ACCESS_TOKEN_TTL,
+            'refresh_expires_in': Config.AUTH_REFRESH_TOKEN_TTL,
+        }
+
+    def verify(self, token, kind='access'):
+        """Claims do token; levanta TokenError se a assinatura, o tipo, a validade ou a revogação falharem"""
+        try:
+            version, payload, signature = token.split('.')
+        except (AttributeError, ValueError):
+            raise TokenError('Token malformado')
+        if version != TOKEN_VERSION:
+            raise TokenError('Versão de token não suportada')
+        try:
+            expected = self._sign(f'{version}.{payload}')
+            valid = hmac.compare_digest(_b64decode(signature), expected)
+            claims = json.loads(_b64decode(payload)) if valid else None
+        except (ValueError, UnicodeDecodeError):
+            raise TokenError('Token malformado')
+        if not valid or not isinstance(claims, dict):
+            raise TokenError('Assinatura inválida')
+        if claims.get('typ') != kind:
+            raise TokenError('Tipo de token incorreto')
+        if claims.get('exp', 0) <= time.time():
+            raise TokenError('Token expirado', 'TOKEN_EXPIRED')
+        if self.revoked(claims.get('sub'), claims.get('iat', 0)):
+            raise TokenError('Token revogado', 'TOKEN_REVOKED')
+        return claims
+
+    def revoked(self, user_id, issued_at):
+        self.refresh_revocations()
+        valid_after = self._revocations.get(user_id)
+        return valid_after is not None and issued_at <= valid_after
+
+    def refresh_revocations(self, force=False):
+        """Lê as revogações novas; fora de force, no máximo a cada AUTH_REVOCATION_POLL segundos"""
+        now = time.monotonic()
+        if not force and self._refreshed_at is not None and now - self._refreshed_at < Config.AUTH_REVOCATION_POLL:
+            return
+        # Uma thread atualiza; as demais seguem com a cópia atual
+        if not self._lock.acquire(blocking=force):
+            return
+        try:
+            for user_id, valid_after, seq in db.changed_token_revocations(self._seq):
+                self._revocations[user_id] = valid_after
+                self._seq = seq
+            self._refreshed_at = now
+        except Exception as e:
+            logger.warning(f'Erro ao atualizar revogações de tokens: {str(e)}')
+        finally:
+            self._lock.release()
+
+    def revoke_user(self, user_id):
+        """Revoga todos os tokens do usuário (logout em todos os dispositivos)"""
+        db.revoke_user_tokens(user_id)
+        self.refresh_revocations(force=True)
+
+    def current_claims(self):
+        """Claims do token de acesso da requisição atual; levanta TokenError"""
+        token = bearer_token()
+        if token is None:
+            raise TokenError('Token de acesso ausente', 'TOKEN_MISSING')
+        return self.verify(token, 'access')
+
+    def init_app(self, app):
+        if Config.AUTH_REQUIRED:
+            app.before_request(self._authenticate)
+
+    def _authenticate(self):
+        if request.method == 'OPTIONS' or request.blueprint not in Config.AUTH_PROTECTED_BLUEPRINTS:
+            return None
+        try:
+            g.user_id = self.current_claims()['sub']
+        except TokenError as e:
+            return jsonify({'success': False, 'error': str(e), 'code': e.code}), 401
+        return None
+
+
+# Emissor/verificador global usado pelas rotas de autenticação e pelo app
+session_tokens = SessionTokens()
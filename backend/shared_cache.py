@@ -0,0 +1,182 @@
+"""
+Cache compartilhado entre processos (workers do gunicorn) no mesmo nó
+
+Os valores ficam numa tabela SQLite em modo WAL, de modo que todos os workers
+enxergam uma única cópia aquecida. Suporta TTL, limites de quantidade/tamanho e
+get_or_compute atômico: apenas um worker calcula um valor ausente enquanto os
+demais aguardam o resultado.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class SharedCache:
+    """Cache chave/valor com TTL persistido em SQLite (WAL)"""
+
+    def __init__(self, path=None, max_entries=None, max_bytes=None, default_ttl=None):
+        self.path = path or Config.SHARED_CACHE_PATH
+        self.max_entries = max_entries or Config.SHARED_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or Config.SHARED_CACHE_MAX_BYTES
+        self.default_ttl = default_ttl or Config.SHARED_CACHE_DEFAULT_TTL
+        self._local = threading.local()
+        self._schema_ready = False
+        self._writes = 0
+
+    def _connection(self):
+        """Conexão por thread; recriada após fork (conexões SQLite não atravessam fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        if not self._schema_ready:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries(expires_at)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_locks (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            self._schema_ready = True
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, default=None):
+        """Obter valor não expirado ou `default`"""
+        row = self._connection().execute(
+            'SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value, ttl=None):
+        """Gravar valor com TTL em segundos"""
+        payload = json.dumps(value, default=str)
+        if len(payload) > self.max_bytes:
+            return False
+        expires_at = time.time() + (ttl or self.default_ttl)
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, size, expires_at) VALUES (?, ?, ?, ?)',
+            (key, payload, len(payload), expires_at)
+        )
+        self._writes += 1
+        if self._writes % Config.SHARED_CACHE_EVICT_EVERY == 0:
+            self.evict()
+        return True
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+
+    def evict(self):
+        """Remover expirados e, acima dos limites, as entradas mais próximas de expirar"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute('DELETE FROM cache_entries WHERE expires_at <= ?', (now,))
+        conn.execute('DELETE FROM cache_locks WHERE expires_at <= ?', (now,))
+        count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries').fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # Remove em lotes ordenados por expiração até voltar aos limites
+        excess = max(count - self.max_entries, 0)
+        rows = conn.execute('SELECT key, size FROM cache_entries ORDER BY expires_at').fetchall()
+        doomed = []
+        for key, size in rows:
+            if excess <= 0 and total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            excess -= 1
+            total -= size
+        conn.executemany('DELETE FROM cache_entries WHERE key = ?', doomed)
+
+    def _try_lock(self, key, owner, lease):
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM cache_locks WHERE key = ? AND expires_at <= ?', (key, now))
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO cache_locks (key, owner, expires_at) VALUES (?, ?, ?)',
+                (key, owner, now + lease)
+            )
+            conn.execute('COMMIT')
+            return cursor.rowcount == 1
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _unlock(self, key, owner):
+        self._connection().execute('DELETE FROM cache_locks WHERE key = ? AND owner = ?', (key, owner))
+
+    def _is_locked(self, key):
+        row = self._connection().execute(
+            'SELECT 1 FROM cache_locks WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def get_or_compute(self, key, compute, ttl=None, cache_if=None, lease=None, wait_timeout=None):
+        """
+        Obter `key` ou calculá-lo com `compute()` uma única vez entre processos.
+
+        Quem obtém o lock calcula e grava; os demais aguardam (até `wait_timeout`)
+        o valor aparecer. `cache_if(valor)` permite não armazenar resultados ruins
+        (ex.: erros de conexão). Se o lock expirar ou a espera esgotar, o valor é
+        calculado localmente.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        lease = lease or Config.SHARED_CACHE_LOCK_LEASE
+        wait_timeout = Config.SHARED_CACHE_LOCK_LEASE if wait_timeout is None else wait_timeout
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + wait_timeout
+        while True:
+            try:
+                locked = self._try_lock(key, owner, lease)
+            except sqlite3.OperationalError as e:
+                logger.warning('Shared cache lock error: %s', e)
+                return compute()
+            if locked:
+                try:
+                    value = compute()
+                    if cache_if is None or cache_if(value):
+                        self.set(key, value, ttl)
+                    return value
+                finally:
+                    self._unlock(key, owner)
+
+            # Outro worker está calculando: aguarda o valor ou a liberação do lock
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                value = self.get(key, _MISSING)
+                if value is not _MISSING:
+                    return value
+                if not self._is_locked(key):
+                    break
+            else:
+                return compute()
+
+
+# Instância global compartilhada pelos blueprints
+shared_cache = SharedCache()
@@ -0,0 +1,159 @@
+"""
+Logging estruturado e não-bloqueante do backend
+
+Os registros são entregues a uma fila em memória e formatados como JSON por uma
+thread dedicada, de modo que o caminho quente (proxy de roteadores) não paga
+formatação nem o lock do handler de saída.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+from config import Config
+
+# Atributos padrão de LogRecord que não devem ser repetidos no JSON
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formata registros como uma linha JSON, incluindo os campos de `extra`"""
+
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Amostragem por rota para logs de sucesso de alto volume.
+
+    Registros marcados com `extra={'route': ...}` e nível abaixo de WARNING são
+    mantidos com a probabilidade configurada para a rota; avisos e erros nunca
+    são descartados.
+    """
+
+    def __init__(self, rates=None, default_rate=1.0):
+        super().__init__()
+        self.rates = rates or {}
+        self.default_rate = default_rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, 'route', None), self.default_rate)
+        if rate >= 1.0:
+            return True
+        return rate > 0.0 and random.random() < rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que adia a formatação e não bloqueia para logs de baixo nível"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # A mensagem é montada apenas na thread de escrita (formatação preguiçosa)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.WARNING:
+                # Erros nunca são descartados: aguarda espaço na fila
+                self.queue.put(record)
+            else:
+                self.dropped += 1
+
+
+def parse_sample_rates(spec):
+    """Converter 'rota=taxa,rota=taxa' em dicionário"""
+    rates = {}
+    for item in (spec or '').split(','):
+        if '=' not in item:
+            continue
+        route, rate = item.split('=', 1)
+        try:
+            rates[route.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+_queue_handler = None
+_listener = None
+
+
+def _build_output_handler():
+    handler = logging.StreamHandler(sys.stderr)
+    if Config.LOG_FORMAT == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    return handler
+
+
+def _start_listener():
+    global _listener
+    _listener = logging.handlers.QueueListener(
+        _queue_handler.queue, _build_output_handler(), respect_handler_level=False
+    )
+    _listener.start()
+
+
+def _restart_listener_after_fork():
+    # Threads não sobrevivem ao fork: o processo filho precisa de fila e listener próprios
+    if _queue_handler is not None:
+        _queue_handler.queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+        _start_listener()
+
+
+def stop_logging():
+    """Esvaziar a fila e parar a thread de escrita"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def setup_logging(level=None):
+    """Instalar o handler em fila no logger raiz (idempotente)"""
+    global _queue_handler
+    if _queue_handler is not None:
+        return _queue_handler
+
+    _queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=Config.LOG_QUEUE_SIZE))
+    _queue_handler.addFilter(SamplingFilter(
+        parse_sample_rates(Config.LOG_SAMPLE_RATES),
+        default_rate=Config.LOG_SAMPLE_DEFAULT,
+    ))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level or Config.LOG_LEVEL)
+
+    _start_listener()
+    atexit.register(stop_logging)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_restart_listener_after_fork)
+    return _queue_handler
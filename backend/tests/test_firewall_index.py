@@ -0,0 +1,117 @@
+"""
+Testes do modelo de regras (routers/firewall.py) e da consulta de primeira
+regra que casa (firewall_index.ChainIndex)
+
+Uso (a partir de backend/):
+    python -m pytest -q tests
+"""
+import ipaddress
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from firewall_index import ChainIndex, parse_query  # noqa: E402
+from routers.firewall import IPV4_MAX, IPV6_MAX, FirewallRule, parse_addresses, parse_ports  # noqa: E402
+
+
+def ip(value):
+    return int(ipaddress.ip_address(value))
+
+
+def rule(id, position, action, src=None, dst=None, **extra):
+    return FirewallRule(
+        id, 'forward', position, action,
+        src=parse_addresses(src)[0] if src else None,
+        dst=parse_addresses(dst)[0] if dst else None,
+        **extra
+    )
+
+
+def first(index, **query):
+    result = index.match(parse_query(query))
+    return (
+        result['rule']['id'] if result['rule'] else None,
+        [item['id'] for item in result['uncertain_before']],
+    )
+
+
+def test_parse_addresses_ranges_and_any():
+    assert parse_addresses('10.0.0.0/24, 10.0.0.128-10.0.1.5') == (
+        {4: [(ip('10.0.0.0'), ip('10.0.1.5'))], 6: []}, True
+    )
+    assert parse_addresses('any') == (None, True)
+    assert parse_addresses('') == (None, True)
+    assert parse_addresses('LAN_NET') == (None, False)
+
+
+def test_parse_addresses_negation_complements_both_families():
+    ranges, resolved = parse_addresses('!10.0.0.0/8')
+    assert resolved
+    assert ranges[4] == [(0, ip('9.255.255.255')), (ip('11.0.0.0'), IPV4_MAX)]
+    # Um endereço IPv6 nunca está numa lista só de IPv4
+    assert ranges[6] == [(0, IPV6_MAX)]
+
+
+def test_parse_addresses_negation_flag_and_prefix_cancel_out():
+    assert parse_addresses('!192.168.1.0/24', negated=True) == parse_addresses('192.168.1.0/24')
+    assert parse_addresses('192.168.1.0/24', negated=True) == parse_addresses('!192.168.1.0/24')
+
+
+def test_parse_ports_negation():
+    assert parse_ports('!22') == ([(0, 21), (23, 65535)], True)
+    assert parse_ports('1000:2000,1500-2500') == ([(1000, 2500)], True)
+    assert parse_ports('ssh') == (None, False)
+
+
+def test_first_match_follows_rule_order():
+    index = ChainIndex([
+        rule('*3', 3, 'drop'),
+        rule('*1', 1, 'accept', src='10.0.0.0/8', dst_ports=[(22, 22)], protocols={'tcp'}),
+        rule('*2', 2, 'reject', src='10.1.0.0/16'),
+    ])
+    assert first(index, src='10.1.2.3', dst='1.1.1.1', protocol='tcp', dstPort=22) == ('*1', [])
+    assert first(index, src='10.1.2.3', dst='1.1.1.1', protocol='udp', dstPort=22) == ('*2', [])
+    assert first(index, src='10.2.0.1', dst='1.1.1.1', protocol='udp', dstPort=53) == ('*3', [])
+
+
+def test_negated_address_and_protocol():
+    index = ChainIndex([
+        rule('*1', 1, 'drop', src='!10.0.0.0/8'),
+        rule('*2', 2, 'drop', protocols={'icmp'}, protocols_negated=True),
+        rule('*3', 3, 'accept'),
+    ])
+    assert first(index, src='192.168.0.1', dst='10.0.0.1', protocol='icmp') == ('*1', [])
+    assert first(index, src='10.0.0.1', dst='10.0.0.2', protocol='tcp') == ('*2', [])
+    assert first(index, src='10.0.0.1', dst='10.0.0.2', protocol='icmp') == ('*3', [])
+    assert first(index, src='fd00::1', dst='fd00::2', protocol='icmp') == ('*1', [])
+
+
+def test_unresolved_and_branch_rules_are_reported_before_the_match():
+    index = ChainIndex([
+        rule('*1', 1, 'accept', unresolved=('src-address-list',)),
+        rule('*2', 2, 'jump'),
+        rule('*3', 3, 'accept', src='10.0.0.0/8'),
+        rule('*4', 4, 'drop', unresolved=('connection-state',)),
+    ])
+    assert first(index, src='10.0.0.1', dst='1.1.1.1') == ('*3', ['*1', '*2'])
+    assert first(index, src='172.16.0.1', dst='1.1.1.1') == (None, ['*1', '*2', '*4'])
+
+
+def test_missing_query_fields_make_constrained_rules_uncertain():
+    index = ChainIndex([
+        rule('*1', 1, 'accept', dst_ports=[(443, 443)]),
+        rule('*2', 2, 'drop'),
+    ])
+    assert first(index, src='10.0.0.1', dst='1.1.1.1', dstPort=443) == ('*1', [])
+    assert first(index, src='10.0.0.1', dst='1.1.1.1') == ('*2', ['*1'])
+
+
+def test_disabled_and_non_terminal_rules_are_skipped():
+    index = ChainIndex([
+        rule('*1', 1, 'drop', disabled=True),
+        rule('*2', 2, 'log'),
+        rule('*3', 3, 'accept'),
+    ])
+    assert [item.id for item in index.rules] == ['*3']
+    assert first(index, src='10.0.0.1') == ('*3', [])
@@ -0,0 +1,129 @@
+"""
+Testes da compilação de escritas em lote do RouterOS (routers/mikrotik_batch.py)
+
+Uso (a partir de backend/):
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from routers.mikrotik_batch import BatchCompileError, compile_script, parse_output, quote  # noqa: E402
+
+PEERS = '/rest/interface/wireguard/peers'
+INTERFACES = '/rest/interface/wireguard'
+
+
+def test_quote_escapes_special_characters():
+    assert quote('a"b') == r'"a\"b"'
+    assert quote('$(x)') == r'"\$(x)"'
+    assert quote('line1\nline2') == r'"line1\nline2"'
+    assert quote('back\\slash') == r'"back\\slash"'
+    assert quote('what?') == r'"what\?"'
+    assert quote(True) == '"yes"'
+
+
+def test_compile_escapes_values_and_cannot_break_out_of_the_string():
+    script = compile_script([{
+        'method': 'PATCH', 'path': f'{PEERS}/*1A',
+        'body': {'comment': 'x" ; /system/reboot ; :put "$y\n'},
+    }], atomic=False)
+    line = script.splitlines()[1]
+    assert 'comment="x\\" ; /system/reboot ; :put \\"\\$y\\n"' in line
+    assert '\n' not in line
+
+
+def test_compile_non_atomic_wraps_each_operation():
+    script = compile_script([
+        {'method': 'PUT', 'path': PEERS, 'body': {'interface': 'wg0', 'public-key': 'K1'}},
+        {'method': 'DELETE', 'path': f'{PEERS}/*2'},
+    ], atomic=False)
+    lines = script.splitlines()
+    assert lines[0] == ':local ids [:toarray ""]'
+    assert '/interface/wireguard/peers/add interface="wg0" public-key="K1"' in lines[1]
+    assert 'on-error={ :put "err|0" }' in lines[1]
+    assert lines[2].startswith(':do { /interface/wireguard/peers/remove *2; :put "ok|1|*2" }')
+
+
+def test_compile_atomic_undoes_in_reverse_order():
+    script = compile_script([
+        {'method': 'PUT', 'path': PEERS, 'body': {'public-key': 'K1'}},
+        {'method': 'PATCH', 'path': f'{PEERS}/*2', 'body': {'comment': 'new'}, 'previous': {'comment': 'old'}},
+    ])
+    undo = [line for line in script.splitlines() if line.strip().startswith(':if ($step >')]
+    assert undo[0].startswith('  :if ($step > 1)') and 'set *2 comment="old"' in undo[0]
+    assert undo[1].startswith('  :if ($step > 0)') and 'remove ($ids->"0")' in undo[1]
+
+
+def test_undo_of_interface_delete_skips_read_only_fields():
+    script = compile_script([{
+        'method': 'DELETE', 'path': f'{INTERFACES}/*1',
+        'previous': {'.id': '*1', 'name': 'wg0', 'private-key': 'PRIV', 'public-key': 'PUB', 'running': 'true'},
+    }])
+    assert '/interface/wireguard/add name="wg0" private-key="PRIV";' in script
+    assert 'PUB' not in script and 'running' not in script
+
+
+def test_undo_of_peer_delete_keeps_public_key():
+    script = compile_script([{
+        'method': 'DELETE', 'path': f'{PEERS}/*3',
+        'previous': {'interface': 'wg0', 'public-key': 'PUB', 'rx': '10'},
+    }])
+    assert '/interface/wireguard/peers/add interface="wg0" public-key="PUB";' in script
+    assert 'rx=' not in script
+
+
+def test_missing_previous_marks_rollback_error():
+    script = compile_script([{'method': 'DELETE', 'path': f'{PEERS}/*3'}])
+    assert ':if ($step > 0) do={ :put "rollback-err|0" }' in script
+
+
+@pytest.mark.parametrize('path', [
+    f'{PEERS}/1',
+    f'{PEERS}/*1;/system/reboot',
+    f'{PEERS}/*XYZ',
+    f'{PEERS}/',
+    f'{PEERS}/*1"',
+    f'{PEERS}/*1\n',
+])
+def test_invalid_item_id_is_rejected(path):
+    with pytest.raises(BatchCompileError):
+        compile_script([{'method': 'PATCH', 'path': path, 'body': {'comment': 'x'}}])
+
+
+@pytest.mark.parametrize('operation', [
+    {'method': 'PUT', 'path': '/interface/wireguard/peers', 'body': {}},
+    {'method': 'PUT', 'path': '/rest/interface/Wire guard', 'body': {}},
+    {'method': 'PUT', 'path': PEERS, 'body': {'comment="x" disabled': 'no'}},
+    {'method': 'PUT', 'path': PEERS, 'body': {'comment\n': 'x'}},
+    {'method': 'PUT', 'path': PEERS + '\n', 'body': {}},
+    {'method': 'POST', 'path': PEERS, 'body': {}},
+])
+def test_unsafe_operations_are_rejected(operation):
+    with pytest.raises(BatchCompileError):
+        compile_script([operation], atomic=False)
+
+
+def test_parse_output_reads_result_lines():
+    output = 'ok|0|*A\nerr|1\ngarbage\nok|2\n'
+    assert parse_output(output, 3) == {
+        0: {'status': 'ok', 'id': '*A'},
+        1: {'status': 'err', 'id': None},
+        2: {'status': 'ok', 'id': None},
+    }
+
+
+def test_parse_output_last_line_wins_and_ignores_unknown_indexes():
+    output = 'ok|0|*A\nerr|1\nrollback|0\nok|7|*Z\nok|-1|*B\n'
+    results = parse_output(output, 2)
+    assert results[0]['status'] == 'rollback'
+    assert results[1] == {'status': 'err', 'id': None}
+    assert set(results) == {0, 1}
+
+
+def test_parse_output_handles_empty_output():
+    assert parse_output(None, 3) == {}
+    assert parse_output('', 3) == {}
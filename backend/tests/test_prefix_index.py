@@ -0,0 +1,102 @@
+"""
+Testes do índice de prefixos (prefix_index.py): longest-prefix-match e
+relatório de sobreposições
+
+Uso (a partir de backend/):
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from prefix_index import PrefixIndex  # noqa: E402
+
+
+def route(id, dst, interface='ether1', **extra):
+    return {'.id': id, 'dst-address': dst, 'gateway': '192.168.88.1', 'immediate-gw': f'192.168.88.1%{interface}', **extra}
+
+
+def peer(id, allowed, interface='wg0', **extra):
+    return {'.id': id, 'public-key': f'KEY{id}', 'allowed-address': allowed, 'interface': interface, **extra}
+
+
+def kinds(report):
+    return sorted((c['kind'], c['outer']['id'], c['inner']['id']) for c in report['conflicts'])
+
+
+def test_longest_prefix_match_picks_most_specific():
+    index = PrefixIndex(
+        [route('*R0', '0.0.0.0/0'), route('*R1', '10.0.0.0/8'), route('*R2', '10.1.0.0/16')],
+        [peer('*P1', '10.1.2.0/24')],
+    )
+    assert [e['id'] for e in index.lookup('10.1.2.3')] == ['*P1']
+    assert [e['id'] for e in index.lookup('10.1.9.9')] == ['*R2']
+    assert [e['id'] for e in index.lookup('10.200.0.1')] == ['*R1']
+    assert [e['id'] for e in index.lookup('172.16.0.1')] == ['*R0']
+    assert index.lookup('fd00::1') == []
+
+
+def test_disabled_and_other_tables_are_ignored():
+    index = PrefixIndex(
+        [route('*R1', '10.0.0.0/8', disabled='true'), route('*R2', '10.0.0.0/8', **{'routing-table': 'vpn'})],
+        [peer('*P1', '10.0.0.0/24', disabled='true')],
+    )
+    assert index.lookup('10.0.0.1') == []
+    assert index.overlaps()['total'] == 0
+
+
+def test_nested_overlaps():
+    index = PrefixIndex(
+        [route('*R1', '10.0.0.0/16'), route('*R0', '0.0.0.0/0')],
+        [peer('*P1', '10.0.0.0/24'), peer('*P2', '10.0.0.5/32'), peer('*P3', '10.0.1.0/24,fd00::/64')],
+    )
+    assert kinds(index.overlaps()) == [
+        ('overlap', '*P1', '*P2'),
+        ('peer-shadows-route', '*R1', '*P1'),
+        ('peer-shadows-route', '*R1', '*P2'),
+        ('peer-shadows-route', '*R1', '*P3'),
+    ]
+
+
+def test_route_to_the_peer_interface_is_not_a_conflict():
+    index = PrefixIndex([route('*R1', '10.0.0.0/24', interface='wg0')], [peer('*P1', '10.0.0.2/32')])
+    assert index.overlaps()['total'] == 0
+
+
+def test_duplicate_prefixes_are_paired_once():
+    index = PrefixIndex(
+        [],
+        [peer('*P0', '10.9.0.0/24')] + [peer(f'*D{i}', '10.9.0.1/32') for i in range(3)] + [peer('*P4', '10.9.0.2/32')],
+    )
+    assert kinds(index.overlaps()) == [
+        ('duplicate', '*D0', '*D1'),
+        ('duplicate', '*D0', '*D2'),
+        ('duplicate', '*D1', '*D2'),
+        ('overlap', '*P0', '*D0'),
+        ('overlap', '*P0', '*D1'),
+        ('overlap', '*P0', '*D2'),
+        ('overlap', '*P0', '*P4'),
+    ]
+
+
+def test_many_duplicates_are_counted_and_truncated():
+    count = 50
+    index = PrefixIndex([], [peer(f'*{i}', '10.0.0.1/32') for i in range(count)])
+    report = index.overlaps(limit=10)
+    assert report['total'] == count * (count - 1) // 2
+    assert report['truncated'] is True
+    assert len(report['conflicts']) == 10
+    assert {c['kind'] for c in report['conflicts']} == {'duplicate'}
+
+
+def test_same_peer_prefixes_do_not_conflict():
+    index = PrefixIndex([], [peer('*P1', '10.0.0.0/24,10.0.0.1/32')])
+    assert index.overlaps()['total'] == 0
+
+
+def test_check_candidate_excludes_itself():
+    index = PrefixIndex([], [peer('*P1', '10.0.0.0/24'), peer('*P2', '10.0.0.9/32')])
+    candidate = {'public-key': 'KEY*P2', 'allowed-address': '10.0.0.9/32', 'interface': 'wg0'}
+    assert [c['kind'] for c in index.check(candidate)] == ['overlap', 'duplicate']
+    assert [c['kind'] for c in index.check(candidate, exclude_id='*P2')] == ['overlap']
@@ -0,0 +1,71 @@
+"""
+Testes da união de escritas na fila store-and-forward (DatabaseManager.enqueue_write)
+
+Uso (a partir de backend/):
+    python -m pytest -q tests
+"""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import DatabaseManager  # noqa: E402
+
+KEY = 'mikrotik:10.0.0.1::admin'
+PEER = '/rest/interface/wireguard/peers/*1'
+INTERFACES = '/rest/interface/wireguard'
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(str(tmp_path / 'queue.db'))
+
+
+def enqueue(db, method, path, body=None):
+    return db.enqueue_write(KEY, '{}', 'secret', method, path, body)
+
+
+def pending(db):
+    return [(row['id'], row['method'], row['path'], json.loads(row['body']) if row['body'] else None)
+            for row in db.list_writes(router_key=KEY, status='pending', after_id=None, limit=100)]
+
+
+def test_consecutive_patches_on_the_same_item_are_merged(db):
+    first, _ = enqueue(db, 'PATCH', PEER, {'comment': 'a'})
+    second, coalesced = enqueue(db, 'PATCH', PEER, {'disabled': 'true'})
+    assert (second, coalesced) == (first, True)
+    assert pending(db) == [(first, 'PATCH', PEER, {'comment': 'a', 'disabled': 'true'})]
+
+
+def test_patch_is_not_merged_across_a_later_write(db):
+    enqueue(db, 'PATCH', PEER, {'comment': 'a'})
+    enqueue(db, 'PUT', INTERFACES, {'name': 'wg9'})
+    third, coalesced = enqueue(db, 'PATCH', PEER, {'interface': 'wg9'})
+    assert not coalesced
+    assert [(method, body) for _, method, _, body in pending(db)] == [
+        ('PATCH', {'comment': 'a'}),
+        ('PUT', {'name': 'wg9'}),
+        ('PATCH', {'interface': 'wg9'}),
+    ]
+    assert pending(db)[-1][0] == third
+
+
+def test_delete_supersedes_patches_queued_after_the_last_create(db):
+    before, _ = enqueue(db, 'PATCH', PEER, {'comment': 'a'})
+    enqueue(db, 'PUT', INTERFACES, {'name': 'wg9'})
+    enqueue(db, 'PATCH', PEER, {'interface': 'wg9'})
+    delete_id, coalesced = enqueue(db, 'DELETE', PEER)
+    assert coalesced
+    assert [(entry_id, method) for entry_id, method, _, _ in pending(db)] == [
+        (before, 'PATCH'), (before + 1, 'PUT'), (delete_id, 'DELETE'),
+    ]
+
+
+def test_delete_without_creates_drops_every_pending_patch(db):
+    enqueue(db, 'PATCH', PEER, {'comment': 'a'})
+    delete_id, coalesced = enqueue(db, 'DELETE', PEER)
+    assert coalesced
+    assert pending(db) == [(delete_id, 'DELETE', PEER, None)]
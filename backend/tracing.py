@@ -0,0 +1,457 @@
+"""
+Tracing leve por spans
+
+Cada requisição HTTP abre um span de servidor que continua o trace do header
+W3C `traceparent` enviado pelo navegador (ou inicia um novo). Chamadas ao
+DatabaseManager, make_request dos drivers e envios SMTP viram spans filhos
+através do contexto corrente (contextvars). Spans de banco e de roteador só são
+criados dentro de um trace, então as threads de fundo não geram ruído.
+
+Spans finalizados vão para um buffer circular em memória e, se TRACE_FILE
+estiver definido, para um arquivo JSON Lines gravado em lote por uma thread
+dedicada. O custo por span é a criação de um objeto pequeno e um append numa
+deque.
+
+/api/traces consulta o arquivo quando TRACE_FILE está definido (todos os
+workers gravam nele, então a consulta vê os spans de qualquer worker) e, sem
+ele, só o buffer do processo que atendeu a consulta. Com mais de um worker,
+defina TRACE_FILE. Acima de TRACE_FILE_MAX_BYTES o arquivo é renomeado para
+TRACE_FILE.1 (um único arquivo antigo); a escrita e a rotação são feitas sob
+flock, então os workers não intercalam linhas nem rotacionam duas vezes.
+"""
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('current_span', default=None)
+
+
+def _new_id(bits):
+    return '%0*x' % (bits // 4, random.getrandbits(bits))
+
+
+def parse_traceparent(value):
+    """'00-<trace_id>-<span_id>-<flags>' -> (trace_id, span_id, sampled) ou None"""
+    if not value:
+        return None
+    parts = value.strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[1] == '0' * 32 or parts[2] == '0' * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind', 'start', '_clock',
+                 'duration_ms', 'status', 'attributes', '_token')
+
+    def __init__(self, trace_id, parent_id, name, kind, attributes):
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time()
+        self._clock = time.perf_counter()
+        self.duration_ms = None
+        self.status = 'ok'
+        self.attributes = attributes
+        self._token = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def error(self, message):
+        self.status = 'error'
+        self.attributes['error'] = str(message)[:500]
+
+    @property
+    def traceparent(self):
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'start': self.start,
+            'duration_ms': self.duration_ms,
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Span descartado (fora de trace ou não amostrado)"""
+
+    __slots__ = ()
+    traceparent = None
+
+    def set(self, key, value):
+        pass
+
+    def error(self, message):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _Unsampled:
+    """Marca no contexto de uma requisição não amostrada"""
+
+    __slots__ = ('trace_id', 'span_id')
+
+    def __init__(self, trace_id, span_id):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+
+class Tracer:
+    def __init__(self, enabled=None, sample_rate=None, buffer_size=None, path=None, max_bytes=None):
+        self.enabled = Config.TRACING_ENABLED if enabled is None else enabled
+        self.sample_rate = Config.TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.spans = deque(maxlen=buffer_size or Config.TRACE_BUFFER_SIZE)
+        self.path = Config.TRACE_FILE if path is None else path
+        self.max_bytes = Config.TRACE_FILE_MAX_BYTES if max_bytes is None else max_bytes
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    # Criação e término de spans
+
+    def start_span(self, name, kind='internal', attributes=None, root=False, parent=None, activate=True):
+        """
+        Abrir um span filho do span corrente. Sem span corrente só abre se
+        root=True (ou com `parent` = (trace_id, span_id, sampled) vindo de traceparent).
+        activate=False não torna o span corrente (geradores, que cedem o controle).
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        current = _current.get()
+        if isinstance(current, _Unsampled):
+            return NOOP_SPAN
+        if current is not None:
+            trace_id, parent_id = current.trace_id, current.span_id
+        elif parent is not None:
+            trace_id, parent_id, sampled = parent
+            if not sampled:
+                return NOOP_SPAN
+        elif root:
+            if self.sample_rate < 1 and random.random() >= self.sample_rate:
+                return NOOP_SPAN
+            trace_id, parent_id = _new_id(128), None
+        else:
+            return NOOP_SPAN
+        span = Span(trace_id, parent_id, name, kind, attributes or {})
+        if activate:
+            span._token = _current.set(span)
+        return span
+
+    def end_span(self, span):
+        if span is NOOP_SPAN:
+            return
+        span.duration_ms = round((time.perf_counter() - span._clock) * 1000, 3)
+        if span._token is not None:
+            try:
+                _current.reset(span._token)
+            except ValueError:
+                # Terminado em outro contexto (ex.: teardown do Flask)
+                pass
+            span._token = None
+        self._export(span)
+
+    def suppress(self, parent=None):
+        """Marcar o contexto atual como não amostrado; retorna o token para restaurar"""
+        trace_id, span_id = (parent[0], parent[1]) if parent else (_new_id(128), _new_id(64))
+        return _current.set(_Unsampled(trace_id, span_id))
+
+    def span(self, name, kind='internal', attributes=None, root=False):
+        """Context manager de um span"""
+        return _SpanContext(self, name, kind, attributes, root)
+
+    def traced(self, name=None, kind='internal', root=False):
+        """Decorador: um span por chamada"""
+        def decorator(func):
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or (_current.get() is None and not root):
+                    return func(*args, **kwargs)
+                with self.span(span_name, kind, root=root):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def instrument(self, cls, prefix, kind='internal', exclude=()):
+        """
+        Envolver os métodos públicos da classe em spans '<prefix>.<método>'.
+        Geradores ficam de fora: o span terminaria antes da iteração.
+        """
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith('_') or attr in exclude or not inspect.isfunction(value):
+                continue
+            if inspect.isgeneratorfunction(value):
+                continue
+            setattr(cls, attr, self.traced(f'{prefix}.{attr}', kind)(value))
+        return cls
+
+    @staticmethod
+    def current():
+        span = _current.get()
+        return span if isinstance(span, Span) else None
+
+    @staticmethod
+    def wrap(func):
+        """Levar o contexto (span corrente) para outra thread: executor.submit(tracer.wrap(f), ...)"""
+        context = contextvars.copy_context()
+
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            # Cópia por chamada: um Context não pode estar ativo em duas threads
+            return context.copy().run(func, *args, **kwargs)
+        return run
+
+    # Exportação
+
+    def _export(self, span):
+        self.spans.append(span)
+        if self.path:
+            self._ensure_writer()
+            self._queue.put(span)
+
+    def _ensure_writer(self):
+        # Uma thread por processo; após fork o filho cria a sua
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.SimpleQueue()
+            self._thread = threading.Thread(target=self._write_loop, name='trace-writer', daemon=True)
+            self._thread.start()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # Junta o que já estiver na fila numa única escrita
+            while len(batch) < 500:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _open_for_append(self):
+        """Arquivo aberto para append e travado, rotacionado antes se passou de max_bytes"""
+        while True:
+            handle = open(self.path, 'a', encoding='utf-8')
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            stat = os.fstat(handle.fileno())
+            try:
+                current = os.stat(self.path).st_ino == stat.st_ino
+            except FileNotFoundError:
+                current = False
+            if not current:
+                # Outro worker rotacionou enquanto esperávamos o lock
+                handle.close()
+                continue
+            if self.max_bytes and stat.st_size >= self.max_bytes:
+                os.replace(self.path, self.path + '.1')
+                handle.close()
+                continue
+            return handle
+
+    def _write(self, batch):
+        try:
+            with self._open_for_append() as handle:
+                handle.write(''.join(json.dumps(span.to_dict(), default=str) + '\n' for span in batch))
+        except OSError as e:
+            logger.error('Falha ao gravar spans: %s', e, extra={'route': 'tracing'})
+
+    def flush(self):
+        """Gravar spans pendentes (usado na saída do processo)"""
+        if self._queue is None or self._pid != os.getpid():
+            return
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+
+    # Consulta
+
+    @staticmethod
+    def _read_tail(path, max_spans):
+        """Últimos max_spans spans de um arquivo, do mais antigo ao mais recente"""
+        chunks, lines = [], 0
+        with open(path, 'rb') as handle:
+            position = handle.seek(0, os.SEEK_END)
+            while position > 0 and lines <= max_spans:
+                size = min(65536, position)
+                position -= size
+                handle.seek(position)
+                chunk = handle.read(size)
+                chunks.append(chunk)
+                lines += chunk.count(b'\n')
+        raw = b''.join(reversed(chunks)).splitlines()
+        if position > 0:
+            # Primeira linha cortada no meio
+            raw = raw[1:]
+        spans = []
+        for line in raw[-max_spans:]:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                # Linha ainda sendo gravada por outro worker
+                continue
+        return spans
+
+    def recent_spans(self):
+        """Spans recentes como dicts: do arquivo (todos os workers) ou do buffer deste processo"""
+        if self.path:
+            try:
+                spans = []
+                # Arquivo atual e, se faltar, o final do rotacionado
+                for path in (self.path, self.path + '.1'):
+                    missing = self.spans.maxlen - len(spans)
+                    if missing <= 0:
+                        break
+                    try:
+                        spans = self._read_tail(path, missing) + spans
+                    except FileNotFoundError:
+                        continue
+                return spans
+            except OSError as e:
+                logger.error('Falha ao ler spans: %s', e, extra={'route': 'tracing'})
+        return [span.to_dict() for span in list(self.spans)]
+
+    def query(self, trace_id=None, name=None, min_duration_ms=None, limit=100):
+        """Traces mais recentes: [{trace_id, spans: [...]}]"""
+        traces = {}
+        for span in reversed(self.recent_spans()):
+            if trace_id and span['trace_id'] != trace_id:
+                continue
+            if span['trace_id'] not in traces:
+                if len(traces) >= limit:
+                    continue
+                traces[span['trace_id']] = []
+            traces[span['trace_id']].append(span)
+        result = []
+        for tid, spans in traces.items():
+            spans.sort(key=lambda span: span['start'])
+            ids = {span['span_id'] for span in spans}
+            roots = [span for span in spans if span['parent_id'] is None or span['parent_id'] not in ids]
+            duration = max((span['duration_ms'] or 0) for span in roots) if roots else None
+            if name and not any(name in span['name'] for span in spans):
+                continue
+            if min_duration_ms is not None and (duration or 0) < min_duration_ms:
+                continue
+            result.append({
+                'trace_id': tid,
+                'root': roots[0]['name'] if roots else None,
+                'start': spans[0]['start'],
+                'duration_ms': duration,
+                'span_count': len(spans),
+                'spans': spans,
+            })
+        return result
+
+    # Integração com o Flask
+
+    def init_app(self, app):
+        from flask import g, request
+
+        @app.before_request
+        def _start_request_span():
+            parent = parse_traceparent(request.headers.get('traceparent'))
+            if parent is not None and not parent[2]:
+                g.trace_suppressed = self.suppress(parent)
+                return
+            span = self.start_span(
+                f'{request.method} {request.endpoint or request.path}',
+                kind='server',
+                attributes={'http.method': request.method, 'http.path': request.path},
+                root=True,
+                parent=parent
+            )
+            g.trace_span = span
+
+        @app.after_request
+        def _finish_request_span(response):
+            span = g.get('trace_span')
+            if span is not None and span is not NOOP_SPAN:
+                span.set('http.status', response.status_code)
+                if response.status_code >= 500:
+                    span.status = 'error'
+                response.headers['traceparent'] = span.traceparent
+            return response
+
+        @app.teardown_request
+        def _end_request_span(error=None):
+            span = g.pop('trace_span', None)
+            if span is not None:
+                if error is not None:
+                    span.error(error)
+                self.end_span(span)
+            token = g.pop('trace_suppressed', None)
+            if token is not None:
+                _current.reset(token)
+
+
+class _SpanContext:
+    __slots__ = ('tracer', 'args', 'span')
+
+    def __init__(self, tracer, name, kind, attributes, root):
+        self.tracer = tracer
+        self.args = (name, kind, attributes, root)
+        self.span = None
+
+    def __enter__(self):
+        name, kind, attributes, root = self.args
+        self.span = self.tracer.start_span(name, kind, attributes, root=root)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.span.error(exc)
+        self.tracer.end_span(self.span)
+        return False
+
+
+# Tracer global
+tracer = Tracer()
+atexit.register(tracer.flush)
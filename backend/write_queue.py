@@ -0,0 +1,271 @@
+"""
+Fila store-and-forward de escritas para roteadores inacessíveis
+
+Com WRITE_QUEUE_ENABLED, uma escrita do proxy (POST/PUT/PATCH/DELETE) que
+falha com CONNECTION_ERROR ou TIMEOUT é gravada na tabela write_queue e
+respondida com 202. Enquanto o roteador tiver escritas pendentes, as novas vão
+direto para a fila, atrás delas: a ordem se mantém e nenhum worker fica
+preso esperando o timeout de um roteador fora do ar.
+
+Escritas no mesmo item são unidas na fila (ver DatabaseManager.enqueue_write):
+PATCHes seguidos no mesmo path viram um só e um DELETE descarta os PATCHes
+pendentes do item.
+
+Todos os workers rodam a thread, mas só o dono do lease `write-queue-leader`
+esvazia a fila. Para cada roteador com pendências ele testa a conexão
+(test_connection) a cada WRITE_QUEUE_PROBE_INTERVAL segundos, com recuo
+exponencial até WRITE_QUEUE_PROBE_MAX_INTERVAL; quando o roteador responde,
+aplica as escritas em ordem de id, em lotes de WRITE_QUEUE_BATCH_SIZE (um
+script único no Mikrotik, sequencial nos demais). Uma nova falha de conexão
+devolve o restante do lote à fila, no mesmo lugar.
+
+A entrega é "pelo menos uma vez": uma escrita que expirou no meio do caminho
+pode já ter sido aplicada pelo roteador e será repetida.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from config import Config
+from database import db
+from encryption import password_encryption
+from router_scheduler import scheduler
+from routers.registry import registry
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'write-queue-leader'
+
+# Métodos que podem ser enfileirados
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# Falhas que indicam roteador inacessível (a escrita nem chegou a ser respondida)
+OFFLINE_CODES = ('CONNECTION_ERROR', 'TIMEOUT')
+
+# Campos do roteador guardados na fila (a senha vai cifrada em `password`)
+ROUTER_FIELDS = ('routerType', 'endpoint', 'port', 'user', 'useHttps')
+
+
+def router_key(data):
+    return '%s:%s:%s:%s' % (data['routerType'].lower(), data['endpoint'], data.get('port') or '', data['user'])
+
+
+def is_offline(result):
+    return not result.get('success') and result.get('code') in OFFLINE_CODES
+
+
+def public_entry(row):
+    """Linha da fila para a API (corpo e resultado decodificados)"""
+    entry = {key: value for key, value in row.items() if key not in ('claimed_by', 'claim_expires_at')}
+    entry['body'] = json.loads(row['body']) if row.get('body') else None
+    entry['result'] = json.loads(row['result']) if row.get('result') else None
+    entry['in_flight'] = row.get('claimed_by') is not None
+    return entry
+
+
+def probe_delay(failures):
+    return min(Config.WRITE_QUEUE_PROBE_INTERVAL * (2 ** max(failures - 1, 0)), Config.WRITE_QUEUE_PROBE_MAX_INTERVAL)
+
+
+def _operation(entry):
+    return {'method': entry['method'], 'path': entry['path'],
+            'body': json.loads(entry['body']) if entry['body'] else None}
+
+
+class WriteQueue:
+    """Enfileiramento no caminho da requisição e thread de envio por processo"""
+
+    def __init__(self):
+        self.owner = uuid.uuid4().hex
+        self.leader = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.stats = {'flushed': 0, 'failed': 0, 'probes': 0, 'last_flush_at': None, 'last_error': None}
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self.owner = uuid.uuid4().hex
+            self.leader = False
+            self._wake = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    # Caminho da requisição
+
+    def should_queue(self, data, method):
+        """Escrita elegível: fila habilitada, método de escrita e sem `queue: false`"""
+        return Config.WRITE_QUEUE_ENABLED and method in WRITE_METHODS and data.get('queue') is not False
+
+    def has_pending(self, data):
+        return db.has_pending_writes(router_key(data))
+
+    def enqueue(self, data, method, actor=None, failure=None):
+        """
+        Gravar a escrita na fila; failure é o resultado da tentativa direta
+        (None quando o roteador já tinha pendências). Retorna o resultado 202.
+        """
+        key = router_key(data)
+        entry_id, coalesced = db.enqueue_write(
+            key,
+            json.dumps({field: data.get(field) for field in ROUTER_FIELDS}),
+            password_encryption.encrypt_password(data['password']),
+            method,
+            data['path'].rstrip('/') or '/',
+            data.get('body'),
+            actor
+        )
+        if failure is not None:
+            db.update_write_queue_router(key, state='offline', last_error=failure.get('error'))
+        self.wake()
+        return {
+            'success': True,
+            'status': 202,
+            'queued': True,
+            'code': 'QUEUED',
+            'queue': {'id': entry_id, 'coalesced': coalesced, 'router': key},
+            'error': failure.get('error') if failure else None
+        }
+
+    # Envio
+
+    def _router(self, row):
+        config = json.loads(row['router'])
+        router_class = registry.get(config['routerType'])
+        if router_class is None:
+            return None
+        return router_class(
+            endpoint=config['endpoint'],
+            port=config.get('port') or '',
+            user=config['user'],
+            password=password_encryption.decrypt_password(row['password']),
+            use_https=config.get('useHttps', False)
+        )
+
+    def tick(self, now=None):
+        """Uma rodada do líder sobre os roteadores vencidos; retorna quantas escritas saíram da fila"""
+        now = now or time.time()
+        total = 0
+        for row in db.due_write_queue_routers(now):
+            total += self.flush_router(row, now)
+        return total
+
+    def flush_router(self, row, now):
+        key = row['router_key']
+        router = self._router(row)
+        if router is None:
+            db.update_write_queue_router(key, last_error='Tipo de roteador não suportado',
+                                         next_probe_at=now + Config.WRITE_QUEUE_PROBE_MAX_INTERVAL)
+            return 0
+        self.stats['probes'] += 1
+        probe = scheduler.call(router, router.test_connection, lane='bulk')
+        if not probe.get('success'):
+            failures = row['probe_failures'] + 1
+            db.update_write_queue_router(key, state='offline', probe_failures=failures,
+                                         next_probe_at=now + probe_delay(failures), last_error=probe.get('error'))
+            return 0
+        db.update_write_queue_router(key, state='online', probe_failures=0, last_error=None,
+                                     last_seen_at=datetime.now().isoformat())
+        flushed = 0
+        while True:
+            entries = db.claim_write_batch(key, self.owner, time.time(), Config.WRITE_QUEUE_CLAIM_LEASE,
+                                           Config.WRITE_QUEUE_BATCH_SIZE)
+            if not entries:
+                break
+            updates, offline = self.apply(router, entries)
+            db.finish_writes(updates, self.owner)
+            flushed += sum(1 for status, _, _ in updates if status != 'pending')
+            if offline is not None:
+                db.update_write_queue_router(key, state='offline', probe_failures=1,
+                                             next_probe_at=time.time() + probe_delay(1),
+                                             last_error=offline.get('error'))
+                break
+            if len(entries) < Config.WRITE_QUEUE_BATCH_SIZE:
+                break
+        if flushed:
+            self.stats['last_flush_at'] = datetime.now().isoformat()
+        return flushed
+
+    def apply(self, router, entries):
+        """
+        Aplicar um lote em ordem. Retorna ([(status, resultado, id)], falha de
+        conexão ou None); após uma falha de conexão o restante volta a 'pending'.
+        """
+        if hasattr(router, 'batch_write') and all(entry['method'] != 'POST' for entry in entries):
+            operations = [_operation(entry) for entry in entries]
+            result = scheduler.call(router, lambda: router.batch_write(operations, atomic=False), lane='bulk')
+            if is_offline(result) or result.get('code') == 'QUEUE_TIMEOUT':
+                return [('pending', None, entry['id']) for entry in entries], result
+            # Sem resultado por item o script nem rodou (BATCH_COMPILE_ERROR, RouterOS sem
+            # /rest/execute, usuário sem política de script): segue uma requisição por escrita
+            if any('rolled_back' in (operation.get('result') or {}) for operation in operations):
+                return [self._outcome(entry, operation['result'])
+                        for entry, operation in zip(entries, operations)], None
+            logger.info('Batch write unavailable (%s), applying queued writes one by one', result.get('error'))
+        updates = []
+        for index, entry in enumerate(entries):
+            operation = _operation(entry)
+            result = scheduler.request(router, operation['path'], operation['method'], operation['body'], lane='bulk')
+            if is_offline(result) or result.get('code') == 'QUEUE_TIMEOUT':
+                updates.extend(('pending', None, pending['id']) for pending in entries[index:])
+                return updates, result
+            updates.append(self._outcome(entry, result))
+        return updates, None
+
+    def _outcome(self, entry, result):
+        ok = bool(result.get('success')) and (result.get('status') or 200) < 400
+        self.stats['flushed' if ok else 'failed'] += 1
+        summary = {key: result.get(key) for key in ('success', 'status', 'code', 'error', 'id') if result.get(key) is not None}
+        summary['success'] = ok
+        if not ok:
+            logger.warning('Queued write %s (%s %s) failed: %s', entry['id'], entry['method'], entry['path'], result.get('error'))
+        return ('done' if ok else 'failed', json.dumps(summary, default=str), entry['id'])
+
+    # Laço
+
+    def _run(self):
+        while True:
+            try:
+                leader = db.acquire_lease(LEASE_NAME, self.owner, Config.WRITE_QUEUE_LEASE_SECONDS)
+                if leader != self.leader:
+                    logger.info('Write queue %s leadership', 'acquired' if leader else 'lost')
+                    self.leader = leader
+                if leader:
+                    self.tick()
+            except Exception as e:
+                logger.error('Write queue error: %s', e)
+                self.stats['last_error'] = str(e)
+            self._wake.wait(Config.WRITE_QUEUE_POLL_INTERVAL)
+            self._wake.clear()
+
+    def flush_now(self, key=None):
+        """Antecipar o próximo teste de conexão (de um roteador ou de todos)"""
+        keys = [key] if key else [row['router_key'] for row in db.write_queue_summary()]
+        found = False
+        for item in keys:
+            found = db.update_write_queue_router(item, next_probe_at=0) or found
+        self.wake()
+        return found
+
+    def status(self):
+        lease = db.get_lease(LEASE_NAME)
+        return {
+            'enabled': Config.WRITE_QUEUE_ENABLED,
+            'leader': self.leader,
+            'leader_active': bool(lease and lease['expires_at'] > time.time()),
+            **self.stats,
+        }
+
+
+write_queue = WriteQueue()
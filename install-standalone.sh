@@ -130,7 +130,7 @@ User=www-data
 Group=www-data
 WorkingDirectory=${INSTALL_DIR}/backend
 Environment="APP_URL=${APP_URL}"
-ExecStart=${INSTALL_DIR}/venv/bin/gunicorn --workers 4 --bind 0.0.0.0:5000 app:app
+ExecStart=${INSTALL_DIR}/venv/bin/gunicorn -c gunicorn.conf.py
 Restart=always
 
 [Install]
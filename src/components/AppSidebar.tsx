@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { NavLink } from 'react-router-dom';
 import { LayoutDashboard, Users, Settings, Network, QrCode, Plus } from 'lucide-react';
 import { Sidebar, SidebarContent, SidebarGroup, SidebarGroupContent, SidebarGroupLabel, SidebarHeader, SidebarFooter, SidebarMenu, SidebarMenuButton, SidebarMenuItem, useSidebar } from '@/components/ui/sidebar';
+import { authHeaders } from '@/services/api';
 const navigation = [{
   name: 'Dashboard',
   href: '/',
@@ -58,7 +59,8 @@ const AppSidebar = () => {
       const response = await fetch(`${backendUrl}/api/router/test-connection`, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+          ...authHeaders()
         },
         body: JSON.stringify(requestBody),
         signal: AbortSignal.timeout(10000)
@@ -6,7 +6,7 @@ import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
 import { Plus } from 'lucide-react';
-import { apiService } from '@/services/api';
+import { apiService, authHeaders } from '@/services/api';
 
 // Helper function to get the correct backend URL
 const getBackendUrl = () => {
@@ -191,7 +191,8 @@ const CreatePeerModal: React.FC<CreatePeerModalProps> = ({
       const response = await fetch(proxyUrl, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+          ...authHeaders()
         },
         body: JSON.stringify(requestBody),
         signal: AbortSignal.timeout(15000)
@@ -281,7 +282,8 @@ const CreatePeerModal: React.FC<CreatePeerModalProps> = ({
       const response = await fetch(proxyUrl, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+          ...authHeaders()
         },
         body: JSON.stringify(requestBody),
         signal: AbortSignal.timeout(15000)
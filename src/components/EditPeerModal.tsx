@@ -8,7 +8,7 @@ import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@
 import { Switch } from '@/components/ui/switch';
 import { useToast } from '@/hooks/use-toast';
 import { Edit, Loader2 } from 'lucide-react';
-import { apiService } from '@/services/api';
+import { apiService, authHeaders } from '@/services/api';
 
 interface EditPeerModalProps {
   isOpen: boolean;
@@ -98,7 +98,8 @@ const EditPeerModal: React.FC<EditPeerModalProps> = ({
       const response = await fetch(proxyUrl, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+          ...authHeaders()
         },
         body: JSON.stringify(requestBody),
         signal: AbortSignal.timeout(15000)
@@ -187,7 +188,8 @@ const EditPeerModal: React.FC<EditPeerModalProps> = ({
       const response = await fetch(proxyUrl, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+          ...authHeaders()
         },
         body: JSON.stringify(requestBody),
         signal: AbortSignal.timeout(15000)
@@ -9,7 +9,7 @@ import { Command, CommandEmpty, CommandGroup, CommandInput, CommandItem, Command
 import { Popover, PopoverContent, PopoverTrigger } from '@/components/ui/popover';
 import { useToast } from '@/hooks/use-toast';
 import { useWireguardPeers } from '@/hooks/useWireguardPeers';
-import { apiService } from '@/services/api';
+import { apiService, authHeaders } from '@/services/api';
 import QRCode from 'qrcode';
 
 // Helper function to get the correct backend URL
@@ -123,7 +123,8 @@ const PeerForm = () => {
           const response = await fetch(proxyUrl, {
             method: 'POST',
             headers: {
-              'Content-Type': 'application/json'
+              'Content-Type': 'application/json',
+              ...authHeaders()
             },
             body: JSON.stringify(requestBody),
             signal: AbortSignal.timeout(15000)
@@ -228,7 +229,8 @@ const PeerForm = () => {
       const response = await fetch(proxyUrl, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+          ...authHeaders()
         },
         body: JSON.stringify(requestBody),
         signal: AbortSignal.timeout(15000)
@@ -4,7 +4,7 @@ import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle } f
 import { Button } from '@/components/ui/button';
 import { QrCode, Download, Copy, Check } from 'lucide-react';
 import { useToast } from '@/hooks/use-toast';
-import { apiService } from '@/services/api';
+import { apiService, authHeaders } from '@/services/api';
 import QRCode from 'qrcode';
 
 interface QRCodeModalProps {
@@ -58,7 +58,8 @@ const QRCodeModal = ({ isOpen, onClose, peer }: QRCodeModalProps) => {
       const response = await fetch(proxyUrl, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+          ...authHeaders()
         },
         body: JSON.stringify(requestBody),
         signal: AbortSignal.timeout(15000)
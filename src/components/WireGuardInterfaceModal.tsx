@@ -6,7 +6,7 @@ import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
 import { useToast } from '@/hooks/use-toast';
 import { Loader2, RefreshCw } from 'lucide-react';
-import { apiService } from '@/services/api';
+import { apiService, authHeaders } from '@/services/api';
 
 interface WireGuardInterfaceModalProps {
   isOpen: boolean;
@@ -128,7 +128,8 @@ const WireGuardInterfaceModal = ({ isOpen, onClose, onSuccess }: WireGuardInterf
       const response = await fetch(`${backendUrl}/api/router/proxy`, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+          ...authHeaders()
         },
         body: JSON.stringify(requestBody),
         signal: AbortSignal.timeout(15000)
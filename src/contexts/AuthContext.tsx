@@ -1,6 +1,6 @@
 
 import React, { createContext, useContext, useState, useEffect } from 'react';
-import { apiService } from '@/services/api';
+import { apiService, clearTokens } from '@/services/api';
 
 interface User {
   id: string;
@@ -181,6 +181,7 @@ export const AuthProvider: React.FC<{ children: React.ReactNode }> = ({ children
     localStorage.removeItem('current_user');
     localStorage.removeItem('session_token');
     localStorage.removeItem('session_expiry');
+    clearTokens();
   };
 
   const addUser = async (userData: Omit<User, 'id' | 'created_at'>): Promise<boolean> => {
@@ -2,7 +2,7 @@
 import { useState, useEffect, useCallback } from 'react';
 import { useToast } from '@/hooks/use-toast';
 import { useApiLogsContext } from '@/contexts/ApiLogsContext';
-import { apiService } from '@/services/api';
+import { apiService, authHeaders } from '@/services/api';
 
 interface ConnectionFormData {
   endpoint: string;
@@ -171,7 +171,8 @@ export const useRouterConnection = () => {
       const response = await fetch(`${backendUrl}/api/router/test-connection`, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+          ...authHeaders()
         },
         body: JSON.stringify(requestData),
         signal: AbortSignal.timeout(15000)
@@ -2,7 +2,7 @@
 import { useState, useEffect, useCallback } from 'react';
 import { useToast } from '@/hooks/use-toast';
 import { useApiLogsContext } from '@/contexts/ApiLogsContext';
-import { apiService } from '@/services/api';
+import { apiService, authHeaders } from '@/services/api';
 
 interface WireguardPeer {
   id: string;
@@ -77,7 +77,8 @@ export const useWireguardPeers = () => {
     const response = await fetch(`${backendUrl}/api/router/proxy`, {
       method: 'POST',
       headers: {
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        ...authHeaders()
       },
       body: JSON.stringify(requestBody),
       signal: AbortSignal.timeout(15000)
@@ -9,7 +9,7 @@ import WireGuardInterfaceModal from '../components/WireGuardInterfaceModal';
 import WireGuardEditModal from '../components/WireGuardEditModal';
 import { useToast } from '@/hooks/use-toast';
 import { useNavigate } from 'react-router-dom';
-import { apiService } from '@/services/api';
+import { apiService, authHeaders } from '@/services/api';
 
 interface WireGuardInterface {
   '.id': string;
@@ -75,7 +75,8 @@ const Interfaces = () => {
         const response = await fetch(`${backendUrl}/api/router/test-connection`, {
           method: 'POST',
           headers: {
-            'Content-Type': 'application/json'
+            'Content-Type': 'application/json',
+            ...authHeaders()
           },
           body: JSON.stringify({
             routerType: config.router_type,
@@ -138,7 +139,8 @@ const Interfaces = () => {
     const response = await fetch(`${backendUrl}/api/router/proxy`, {
       method: 'POST',
       headers: {
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        ...authHeaders()
       },
       body: JSON.stringify(requestBody),
       signal: AbortSignal.timeout(15000)
@@ -12,7 +12,7 @@ import QRCodeModal from '../components/QRCodeModal';
 import { useWireguardPeers } from '../hooks/useWireguardPeers';
 import { useToast } from '@/hooks/use-toast';
 import { useNavigate } from 'react-router-dom';
-import { apiService } from '@/services/api';
+import { apiService, authHeaders } from '@/services/api';
 
 // Helper function to get the correct backend URL
 const getBackendUrl = () => {
@@ -70,7 +70,8 @@ const Peers = () => {
         const response = await fetch(`${backendUrl}/api/router/test-connection`, {
           method: 'POST',
           headers: {
-            'Content-Type': 'application/json'
+            'Content-Type': 'application/json',
+            ...authHeaders()
           },
           body: JSON.stringify({
             routerType: config.router_type,
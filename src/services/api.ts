@@ -18,21 +18,50 @@ const getApiBaseUrl = () => {
 
 const API_BASE_URL = getApiBaseUrl();
 
+const ACCESS_TOKEN_KEY = 'access_token';
+const REFRESH_TOKEN_KEY = 'refresh_token';
+
+// Authorization header with the access token issued at login (identifies the user in the journal)
+export const authHeaders = (): Record<string, string> => {
+  const token = localStorage.getItem(ACCESS_TOKEN_KEY);
+  return token ? { Authorization: `Bearer ${token}` } : {};
+};
+
+export const storeTokens = (tokens?: { access_token?: string; refresh_token?: string }) => {
+  if (tokens?.access_token) {
+    localStorage.setItem(ACCESS_TOKEN_KEY, tokens.access_token);
+  }
+  if (tokens?.refresh_token) {
+    localStorage.setItem(REFRESH_TOKEN_KEY, tokens.refresh_token);
+  }
+};
+
+export const clearTokens = () => {
+  localStorage.removeItem(ACCESS_TOKEN_KEY);
+  localStorage.removeItem(REFRESH_TOKEN_KEY);
+};
+
 class ApiService {
-  private async request(endpoint: string, options: RequestInit = {}) {
+  private async request(endpoint: string, options: RequestInit = {}, retry = true) {
     const url = `${API_BASE_URL}${endpoint}`;
     const config = {
+      ...options,
       headers: {
         'Content-Type': 'application/json',
+        ...authHeaders(),
         ...options.headers,
       },
-      ...options,
     };
 
     try {
       const response = await fetch(url, config);
       const data = await response.json();
       
+      // Access token expired: renew once with the refresh token and repeat the request
+      if (response.status === 401 && data.code === 'TOKEN_EXPIRED' && retry && await this.refreshTokens()) {
+        return this.request(endpoint, options, false);
+      }
+      
       if (!response.ok) {
         throw new Error(data.error || `HTTP error! status: ${response.status}`);
       }
@@ -45,8 +74,23 @@ class ApiService {
   }
 
   // User management
+  // GET /users is keyset-paginated: follow next_cursor until the last page
   async getUsers() {
-    return this.request('/users');
+    const users: unknown[] = [];
+    let cursor: string | null = null;
+    do {
+      const params = new URLSearchParams({ limit: '1000' });
+      if (cursor) {
+        params.set('cursor', cursor);
+      }
+      const response = await this.request(`/users?${params.toString()}`);
+      if (!response.success) {
+        return response;
+      }
+      users.push(...response.data);
+      cursor = response.pagination?.next_cursor ?? null;
+    } while (cursor);
+    return { success: true, data: users };
   }
 
   async createUser(userData: { name: string; email: string; password: string; enabled?: boolean }) {
@@ -70,10 +114,37 @@ class ApiService {
   }
 
   async login(email: string, password: string) {
-    return this.request('/auth/login', {
+    const response = await this.request('/auth/login', {
       method: 'POST',
       body: JSON.stringify({ email, password }),
     });
+    if (response.success) {
+      storeTokens(response.tokens);
+    }
+    return response;
+  }
+
+  private async refreshTokens(): Promise<boolean> {
+    const refreshToken = localStorage.getItem(REFRESH_TOKEN_KEY);
+    if (!refreshToken) {
+      return false;
+    }
+    try {
+      const response = await fetch(`${API_BASE_URL}/auth/refresh`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ refreshToken }),
+      });
+      const data = await response.json();
+      if (!response.ok || !data.success) {
+        clearTokens();
+        return false;
+      }
+      storeTokens(data.tokens);
+      return true;
+    } catch {
+      return false;
+    }
   }
 
   // SMTP configuration